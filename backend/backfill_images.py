@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+"""
+Génère les déclinaisons responsive (AVIF/WebP) des pochettes déjà en ligne
+Usage: MONGO_URL=mongodb://localhost:27017 python3 backfill_images.py
+"""
+
+import asyncio
+
+from server import client, backfill_image_srcsets, media_executor, normalize_media_urls
+
+async def main():
+    print("🖼️  Génération des images responsive...")
+    # Les pochettes enregistrées avec une URL absolue ne sont retrouvées qu'une fois ramenées à /uploads/...
+    await normalize_media_urls()
+    result = await backfill_image_srcsets()
+    client.close()
+    media_executor.shutdown()
+    print(f"✅ {result['processed']} pochette(s) traitée(s), {result['skipped']} fichier(s) introuvable(s)")
+
+if __name__ == "__main__":
+    asyncio.run(main())
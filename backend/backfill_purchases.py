@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+"""
+Construit la table des achats (utilisateur, produit) à partir des commandes payées
+Usage: MONGO_URL=mongodb://localhost:27017 python3 backfill_purchases.py
+Peut être relancé sans risque: les achats déjà enregistrés sont conservés.
+"""
+
+import asyncio
+
+from server import client, ensure_indexes, backfill_purchases
+
+async def main():
+    print("🧾 Enregistrement des achats existants...")
+    await ensure_indexes()
+    written = await backfill_purchases()
+    client.close()
+    print(f"✅ {written} achat(s) ajouté(s)")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Mesure la latence de l'inscription et de la connexion (bcrypt) sous charge
+Usage: MONGO_URL=mongodb://localhost:27017 python3 bench_auth.py [--users 200] [--logins 1000] [--concurrency 32] [--database music_store_bench] [--inline]
+Appelle l'application dans ce processus (sans réseau) sur une base dédiée (jamais music_store) :
+débit et latences p50/p95/p99 de POST /api/auth/register et /api/auth/login, nombre de 503 (file
+PASSWORD_HASH_MAX_PENDING pleine), et retard de la boucle d'événements pendant les connexions
+(ce que subissent toutes les autres requêtes). --inline hache sur la boucle, comme avant le pool.
+"""
+
+import argparse
+import asyncio
+import time
+
+import httpx
+
+import server
+from server import client
+
+def percentiles(latencies: list) -> dict:
+    latencies = sorted(latencies)
+    percentile = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+    return {"p50": percentile(0.50), "p95": percentile(0.95), "p99": percentile(0.99)}
+
+async def run_load(requests: list, concurrency: int) -> dict:
+    latencies, statuses = [], {}
+    pending = iter(requests)
+    started = time.perf_counter()
+
+    async def worker():
+        # Measured from when the client was ready to send: with --inline, the time spent waiting
+        # for a loop blocked by someone else's bcrypt call counts too
+        ready = started
+        for send in pending:
+            response = await send()
+            done = time.perf_counter()
+            latencies.append(done - ready)
+            ready = done
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return {**percentiles(latencies), "rps": len(latencies) / (time.perf_counter() - started), "statuses": statuses}
+
+async def loop_lag(stop: asyncio.Event) -> dict:
+    """How late a 10 ms timer fires while bcrypt runs: the delay every other request on this worker sees"""
+    lags = []
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.01)
+        lags.append(time.perf_counter() - started - 0.01)
+    return percentiles(lags)
+
+def report(label: str, result: dict):
+    overloaded = result.get('statuses', {}).get(503, 0)
+    print(
+        f"   {label:24}" + (f" {result['rps']:6.1f} req/s" if "rps" in result else " " * 12)
+        + f"  p50 {result['p50']:7.1f} ms  p95 {result['p95']:7.1f} ms  p99 {result['p99']:7.1f} ms"
+        + (f"  ⚠️  {overloaded} réponse(s) 503" if overloaded else "")
+    )
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark de l'inscription et de la connexion")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--logins", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--database", default="music_store_bench")
+    parser.add_argument("--inline", action="store_true", help="bcrypt sur la boucle d'événements (référence avant le pool)")
+    args = parser.parse_args()
+    if args.database == "music_store":
+        parser.error("la base de production ne doit pas servir au benchmark")
+
+    database = client[args.database]
+    server.db = database
+    await database.users.drop()
+    await database.email_verifications.drop()
+    await server.ensure_indexes()
+    if args.inline:
+        async def run_inline(func, *args):
+            return func(*args)
+        server.run_password_job = run_inline
+
+    mode = "sur la boucle" if args.inline else f"pool de {server.PASSWORD_HASH_WORKERS} thread(s), file max {server.PASSWORD_HASH_MAX_PENDING}"
+    print(f"🔐 bcrypt {mode}, {args.concurrency} clients simultanés")
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as http:
+        accounts = [{"prenom": "Bench", "nom": "Auth", "email": f"bench{index}@example.com", "adresse": "1 rue du Test", "mot_de_passe": f"motdepasse-{index}"} for index in range(args.users)]
+        register = await run_load([lambda account=account: http.post("/api/auth/register", json=account) for account in accounts], args.concurrency)
+        report(f"inscription ({args.users})", register)
+
+        await database.users.update_many({}, {"$set": {"email_verifie": True}})
+        logins = [accounts[index % len(accounts)] for index in range(args.logins)]
+        stop = asyncio.Event()
+        lag = asyncio.create_task(loop_lag(stop))
+        login = await run_load([
+            lambda account=account: http.post("/api/auth/login", json={"email": account['email'], "mot_de_passe": account['mot_de_passe']})
+            for account in logins
+        ], args.concurrency)
+        stop.set()
+        report(f"connexion ({args.logins})", login)
+        report("retard de la boucle", await lag)
+
+    await client.drop_database(args.database)
+    client.close()
+    server.password_executor.shutdown()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Mesure GET /api/cart selon la taille du panier : une requête find_one par article (avant)
+contre une seule requête $in projetée (get_cart)
+Usage: MONGO_URL=mongodb://localhost:27017 python3 bench_cart.py [--sizes 1 5 10 30 100] [--repeat 50] [--database music_store_bench]
+Remplit une base dédiée (jamais music_store) puis affiche les latences p50/p95 des deux chemins.
+"""
+
+import argparse
+import asyncio
+import time
+
+import server
+from server import client, get_cart, PRODUCT_PROJECTION
+
+async def get_cart_one_query_per_item(current_user: server.User) -> dict:
+    """The former get_cart: one round trip per cart line"""
+    cart = await server.db.carts.find_one({"user_id": current_user.id}, {"_id": 0})
+    items_with_details = []
+    for item in cart.get('items', []):
+        product = await server.db.products.find_one({"id": item['product_id']}, PRODUCT_PROJECTION)
+        if product:
+            items_with_details.append({**item, "product": product})
+    return {"items": items_with_details}
+
+async def time_path(path, current_user: server.User, repeat: int) -> dict:
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await path(current_user)
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    return {"p50": latencies[len(latencies) // 2], "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]}
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark du chargement du panier")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 5, 10, 30, 100])
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--database", default="music_store_bench")
+    args = parser.parse_args()
+    if args.database == "music_store":
+        parser.error("la base de production ne doit pas servir au benchmark")
+
+    database = client[args.database]
+    server.db = database
+    await database.products.drop()
+    await database.carts.drop()
+    await server.ensure_indexes()
+    products = [
+        server.Product(
+            titre=f"Titre {index}", artiste=f"Artiste {index % 50}", type="single", prix=1.99,
+            image_url="", audio_preview_url="", audio_file_url="", description="Description " * 40
+        ).model_dump()
+        for index in range(max(args.sizes))
+    ]
+    await database.products.insert_many(products)
+
+    print(f"🛒 {args.repeat} chargements par taille de panier")
+    for size in args.sizes:
+        current_user = server.User(prenom="Bench", nom="Panier", email=f"cart{size}@example.com", adresse="1 rue du Test")
+        items = [{"product_id": product['id'], "quantite": 1} for product in products[:size]]
+        await database.carts.insert_one({"user_id": current_user.id, "items": items})
+        before = await time_path(get_cart_one_query_per_item, current_user, args.repeat)
+        after = await time_path(get_cart, current_user, args.repeat)
+        print(
+            f"   {size:4d} article(s)  avant p50 {before['p50']:7.2f} ms  p95 {before['p95']:7.2f} ms"
+            f"  |  $in p50 {after['p50']:7.2f} ms  p95 {after['p95']:7.2f} ms  (x{before['p50'] / after['p50']:.1f})"
+        )
+
+    await client.drop_database(args.database)
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Mesure la sérialisation JSON d'une page de produits : chemin FastAPI d'avant (dates ISO relues
+avec fromisoformat, validation response_model=List[Product], json.dumps) contre dump_json (orjson)
+Usage: MONGO_URL=mongodb://localhost:27017 python3 bench_json.py [--products 10000] [--repeat 10]
+Aucune base n'est utilisée : les documents sont générés en mémoire, tels que Mongo les rend.
+"""
+
+import argparse
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+import server
+from server import Product, dump_json
+
+def make_documents(count: int) -> list:
+    now = datetime.now(timezone.utc)
+    documents = []
+    for index in range(count):
+        product = Product(
+            titre=f"Titre {index}", artiste=f"Artiste {index % 300}", type="album" if index % 3 else "single",
+            prix=round(0.99 + index % 20, 2), image_url=f"/uploads/images/{index:064x}.png",
+            audio_preview_url="", audio_file_url=f"/uploads/audio_files/{index:064x}.mp3",
+            description="Un album de test. " * 10, created_at=now - timedelta(minutes=index),
+            tracks=[{"numero": numero, "titre": f"Morceau {numero}", "audio_url": ""} for numero in range(1, 11)] if index % 3 else None
+        ).model_dump()
+        documents.append(product)
+    return documents
+
+def serialize_before(documents: list, adapter: TypeAdapter) -> bytes:
+    """What get_products did: datetimes stored as ISO strings, FastAPI's response_model pass, Starlette's json.dumps"""
+    for product in documents:
+        if isinstance(product.get('created_at'), str):
+            product['created_at'] = datetime.fromisoformat(product['created_at'])
+    validated = adapter.validate_python(documents)
+    return JSONResponse(adapter.dump_python(validated, mode="json")).body
+
+def time_it(function, repeat: int) -> dict:
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = function()
+        durations.append((time.perf_counter() - started) * 1000)
+    durations.sort()
+    return {"p50": durations[len(durations) // 2], "min": durations[0], "bytes": len(body)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la sérialisation JSON du catalogue")
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    documents = make_documents(args.products)
+    legacy_documents = [{**product, "created_at": product['created_at'].isoformat()} for product in documents]
+    adapter = TypeAdapter(List[Product])
+
+    print(f"🧾 {args.products} produits, {args.repeat} sérialisations")
+    before = time_it(lambda: serialize_before([dict(product) for product in legacy_documents], adapter), args.repeat)
+    after = time_it(lambda: dump_json(documents), args.repeat)
+    print(f"   avant (response_model)   p50 {before['p50']:8.1f} ms  min {before['min']:8.1f} ms  {before['bytes'] / 1024:.0f} Kio")
+    print(f"   dump_json (orjson)       p50 {after['p50']:8.1f} ms  min {after['min']:8.1f} ms  {after['bytes'] / 1024:.0f} Kio  (x{before['p50'] / after['p50']:.0f})")
+    server.client.close()
+
+if __name__ == "__main__":
+    main()
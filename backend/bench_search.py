@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Mesure la recherche catalogue sur un gros catalogue synthétique
+Usage: MONGO_URL=mongodb://localhost:27017 python3 bench_search.py [--products 100000] [--repeat 20] [--database music_store_bench]
+Remplit une base dédiée (jamais music_store), puis chronomètre GET /api/products/search
+pour des préfixes fréquents, rares et multi-mots (latences p50/p95, taille de l'index).
+"""
+
+import argparse
+import asyncio
+import itertools
+import random
+import time
+
+import server
+from server import client, normalize_text, search_index_fields, search_products
+
+SYLLABLES = ["la", "mi", "do", "re", "so", "fa", "ti", "na", "ko", "ra", "lu", "ve", "the", "ban", "dor", "sil", "mar", "tin"]
+
+def make_vocabulary(size: int, rng: random.Random) -> list:
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+def make_product(index: int, vocabulary: list, weights: list, rng: random.Random) -> dict:
+    # Zipf word frequencies: a few words (and their prefixes) are very common
+    pick = lambda: rng.choices(vocabulary, cum_weights=weights)[0]
+    product_type = rng.choice(["album", "single"])
+    tracks = [
+        {"numero": numero, "titre": " ".join(pick().capitalize() for _ in range(rng.randint(1, 3))), "audio_url": ""}
+        for numero in range(1, rng.randint(8, 14) if product_type == "album" else 1)
+    ]
+    product = server.Product(
+        titre=" ".join(pick().capitalize() for _ in range(rng.randint(1, 4))),
+        artiste=" ".join(pick().capitalize() for _ in range(rng.randint(1, 2))),
+        type=product_type,
+        prix=round(rng.uniform(0.99, 19.99), 2),
+        image_url="", audio_preview_url="", audio_file_url="",
+        description=f"Produit de test {index} : " + " ".join(pick() for _ in range(rng.randint(10, 40))),
+        tracks=tracks
+    ).model_dump()
+    product.update(search_index_fields(product))
+    return product
+
+async def seed(database, count: int, rng: random.Random) -> list:
+    await database.products.drop()
+    vocabulary = make_vocabulary(5000, rng)
+    weights = list(itertools.accumulate(1 / rank for rank in range(1, len(vocabulary) + 1)))
+    started = time.perf_counter()
+    for start in range(0, count, 5000):
+        await database.products.insert_many([make_product(index, vocabulary, weights, rng) for index in range(start, min(start + 5000, count))])
+    await database.products.create_index([("id", 1)], unique=True)
+    await database.products.create_index([("search_keywords", 1)])
+    print(f"📦 {count} produits insérés et indexés en {time.perf_counter() - started:.1f} s")
+    return vocabulary
+
+async def time_query(q: str, repeat: int) -> dict:
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await search_products(q=q, limit=20, type=None)
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    return {"p50": latencies[len(latencies) // 2], "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]}
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la recherche catalogue")
+    parser.add_argument("--products", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--database", default="music_store_bench")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    if args.database == "music_store":
+        parser.error("la base de production ne doit pas servir au benchmark")
+
+    database = client[args.database]
+    server.db = database
+    rng = random.Random(args.seed)
+    vocabulary = await seed(database, args.products, rng)
+
+    stats = await database.command("collStats", "products")
+    keywords = await database.products.aggregate([{"$group": {"_id": None, "avg": {"$avg": {"$size": "$search_keywords"}}}}]).to_list(1)
+    print(f"🗂️  index search_keywords: {stats['indexSizes'].get('search_keywords_1', 0) / 1024 / 1024:.1f} Mo, {keywords[0]['avg']:.1f} entrées par produit")
+
+    queries = [
+        vocabulary[0][:2],              # préfixe très fréquent
+        vocabulary[0],                  # mot entier fréquent
+        vocabulary[-1],                 # mot rare
+        f"{vocabulary[0]} {vocabulary[1][:3]}",  # deux termes
+    ]
+    print(f"⏱️  {args.repeat} exécutions par requête (limit=20)")
+    for q in queries:
+        terms = [term for term in normalize_text(q) if len(term) >= server.SEARCH_MIN_PREFIX]
+        matches = await database.products.count_documents({"$and": [
+            {"search_keywords": {"$in": server.search_term_keywords(term)}} for term in terms
+        ]})
+        result = await time_query(q, args.repeat)
+        print(f"   {q!r:28} {matches:7d} correspondance(s)  p50 {result['p50']:7.1f} ms  p95 {result['p95']:7.1f} ms")
+
+    await database.products.drop()
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Mesure la réactivité du catalogue pendant l'envoi d'un gros fichier audio
+Usage: MONGO_URL=mongodb://localhost:27017 python3 bench_uploads.py [--size-mb 200] [--readers 8] [--database music_store_bench] [--blocking]
+Appelle l'application dans ce processus (sans réseau) sur une base et un dossier d'uploads dédiés :
+des clients lisent GET /api/products en continu, d'abord au repos puis pendant un POST
+/api/upload/audio-file de --size-mb Mo, et on compare leurs latences p50/p99/max.
+--blocking recopie le fichier sur la boucle avec shutil.copyfileobj, comme avant write_upload.
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+import httpx
+
+import server
+from server import client
+
+def percentiles(latencies: list) -> dict:
+    latencies = sorted(latencies)
+    percentile = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+    return {"p50": percentile(0.50), "p99": percentile(0.99), "max": latencies[-1] * 1000, "count": len(latencies)}
+
+async def read_catalog(http: httpx.AsyncClient, readers: int, until) -> dict:
+    latencies = []
+
+    async def reader():
+        while not until():
+            started = time.perf_counter()
+            await http.get("/api/products")
+            latencies.append(time.perf_counter() - started)
+            # A memory cache hit never waits on I/O: yield so the upload gets its turn
+            await asyncio.sleep(0)
+
+    await asyncio.gather(*(reader() for _ in range(readers)))
+    return percentiles(latencies)
+
+async def save_upload_blocking(file, subdir: str) -> dict:
+    """The former handlers: a plain copy on the event loop"""
+    relative_path = f"{subdir}/{uuid.uuid4()}.{file.filename.split('.')[-1]}"
+    with open(server.UPLOAD_DIR / relative_path, "wb") as buffer:
+        shutil.copyfileobj(file.file, buffer)
+    return {"url": f"/uploads/{relative_path}"}
+
+def report(label: str, result: dict):
+    print(f"   {label:22} {result['count']:6d} lecture(s)  p50 {result['p50']:7.1f} ms  p99 {result['p99']:7.1f} ms  max {result['max']:8.1f} ms")
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark des lectures catalogue pendant un upload")
+    parser.add_argument("--size-mb", type=int, default=200)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--idle-seconds", type=float, default=3)
+    parser.add_argument("--database", default="music_store_bench")
+    parser.add_argument("--blocking", action="store_true", help="copie sur la boucle d'événements (référence avant write_upload)")
+    args = parser.parse_args()
+    if args.database == "music_store":
+        parser.error("la base de production ne doit pas servir au benchmark")
+
+    database = client[args.database]
+    server.db = database
+    await database.products.drop()
+    await database.users.drop()
+    await server.ensure_indexes()
+    await database.products.insert_many([
+        server.Product(
+            titre=f"Titre {index}", artiste="Bench", type="single", prix=1.99,
+            image_url="", audio_preview_url="", audio_file_url="", description=""
+        ).model_dump()
+        for index in range(100)
+    ])
+    admin = server.User(prenom="Bench", nom="Admin", email="admin@example.com", adresse="1 rue du Test", email_verifie=True, role="admin")
+    await database.users.insert_one(admin.model_dump())
+    headers = {"Authorization": f"Bearer {server.create_access_token(admin.id, admin.email)}"}
+    # Only the transfer is measured: no rendition encoding afterwards
+    server.schedule_audio_processing = lambda saved: saved
+    if args.blocking:
+        server.save_upload = save_upload_blocking
+
+    with tempfile.TemporaryDirectory() as upload_dir:
+        server.UPLOAD_DIR = Path(upload_dir)
+        for subdir in server.UPLOAD_MAX_BYTES:
+            (server.UPLOAD_DIR / subdir).mkdir()
+        source = server.UPLOAD_DIR / "source.wav"
+        with open(source, "wb") as output:
+            for _ in range(args.size_mb):
+                output.write(os.urandom(1024 * 1024))
+
+        mode = "copie sur la boucle" if args.blocking else "write_upload dans un thread"
+        print(f"📤 upload de {args.size_mb} Mo ({mode}), {args.readers} lecteurs du catalogue")
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as http:
+            deadline = time.perf_counter() + args.idle_seconds
+            report("au repos", await read_catalog(http, args.readers, lambda: time.perf_counter() > deadline))
+
+            with open(source, "rb") as audio:
+                started = time.perf_counter()
+                upload = asyncio.create_task(http.post("/api/upload/audio-file", files={"file": ("source.wav", audio, "audio/wav")}, headers=headers))
+                report("pendant l'upload", await read_catalog(http, args.readers, upload.done))
+                response = await upload
+            print(f"   upload: HTTP {response.status_code} en {time.perf_counter() - started:.1f} s")
+
+    await client.drop_database(args.database)
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Mesure le débit du backend selon le nombre de workers gunicorn
+Usage: MONGO_URL=mongodb://localhost:27017 CACHE_URL=redis://localhost:6379/0 python3 bench_workers.py [--workers 1 2 4] [--requests 5000] [--concurrency 64] [--path /api/products]
+Pour chaque valeur de --workers, lance gunicorn (gunicorn.conf.py) sur un port local,
+envoie la charge avec httpx puis affiche requêtes/s et latences p50/p95/p99.
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+ROOT_DIR = Path(__file__).parent
+
+async def wait_until_ready(http: httpx.AsyncClient, path: str, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await http.get(path)).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.5)
+    raise RuntimeError(f"le serveur ne répond pas sur {path}")
+
+async def run_load(http: httpx.AsyncClient, path: str, total: int, concurrency: int) -> dict:
+    latencies = []
+    errors = 0
+    remaining = total
+
+    async def client():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            try:
+                response = await http.get(path)
+                if response.status_code != 200:
+                    errors += 1
+            except httpx.TransportError:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    percentile = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50": percentile(0.50),
+        "p95": percentile(0.95),
+        "p99": percentile(0.99),
+        "errors": errors
+    }
+
+async def bench(workers: int, args) -> dict:
+    env = {**os.environ, "WEB_CONCURRENCY": str(workers), "PORT": str(args.port)}
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "server:app"],
+        cwd=ROOT_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", limits=limits, timeout=30) as http:
+            await wait_until_ready(http, args.path)
+            await run_load(http, args.path, min(args.requests, 500), args.concurrency)  # warm-up: caches, pools
+            return await run_load(http, args.path, args.requests, args.concurrency)
+    finally:
+        process.terminate()
+        process.wait()
+
+async def main():
+    parser = argparse.ArgumentParser(description="Débit du backend selon WEB_CONCURRENCY")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--path", default="/api/products")
+    parser.add_argument("--port", type=int, default=8099)
+    args = parser.parse_args()
+
+    if len(args.workers) > 1 and not os.getenv("CACHE_URL", "").startswith(("redis://", "rediss://")):
+        print("⚠️  CACHE_URL ne pointe pas vers Redis : chaque worker aura son propre cache")
+
+    print(f"🚀 {args.requests} requêtes GET {args.path}, {args.concurrency} clients simultanés")
+    baseline = None
+    for workers in args.workers:
+        result = await bench(workers, args)
+        baseline = baseline or result['rps']
+        print(
+            f"   {workers} worker(s): {result['rps']:8.0f} req/s (x{result['rps'] / baseline:.2f})"
+            f"  p50 {result['p50']:.1f} ms  p95 {result['p95']:.1f} ms  p99 {result['p99']:.1f} ms"
+            + (f"  ⚠️  {result['errors']} erreur(s)" if result['errors'] else "")
+        )
+
+if __name__ == "__main__":
+    asyncio.run(main())
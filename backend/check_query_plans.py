@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+Vérifie que les requêtes des routes critiques utilisent un index
+Usage: MONGO_URL=mongodb://localhost:27017 python3 check_query_plans.py
+Code de sortie 1 si une requête fait un scan complet de collection (pour la CI)
+"""
+
+import asyncio
+import sys
+
+from server import client, ensure_indexes, explain_query_plans
+
+async def main():
+    await ensure_indexes()
+    report = await explain_query_plans()
+    client.close()
+    
+    collection_scans = 0
+    for route, plan in report.items():
+        if plan["collection_scan"]:
+            collection_scans += 1
+            status = "❌ COLLSCAN"
+        elif plan["in_memory_sort"]:
+            status = "⚠️  SORT"
+        else:
+            status = "✅"
+        print(f"{status} {route} ({plan['collection']}): {' <- '.join(plan['stages'])}")
+    
+    return 1 if collection_scans else 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,23 @@
+"""
+Configuration gunicorn pour le mode multi-processus
+Usage: gunicorn -c gunicorn.conf.py server:app
+
+Chaque worker importe server.py après le fork et ouvre son propre pool MongoDB
+(MONGO_MAX_POOL_SIZE connexions au plus). Au-delà d'un worker, définir CACHE_URL
+(redis://...) pour que les caches et leurs invalidations soient partagés.
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8001')}"
+workers = int(os.getenv('WEB_CONCURRENCY', '1'))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Long-polls (/checkout/status?wait=) and large uploads keep requests open
+timeout = 120
+graceful_timeout = 30
+keepalive = 5
+
+# No preload: the app (and its Mongo client, process pools) is created in each worker
+preload_app = False
+accesslog = "-"
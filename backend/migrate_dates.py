@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Convertit les dates stockées en chaînes ISO (anciennes versions) en dates BSON natives
+Usage: MONGO_URL=mongodb://localhost:27017 python3 migrate_dates.py [--batch-size 1000]
+Reprenable: seuls les documents contenant encore une date texte sont traités,
+une exécution interrompue peut donc simplement être relancée.
+"""
+
+import argparse
+import asyncio
+from datetime import timezone
+
+from pymongo import UpdateOne
+
+from server import client, db, parse_datetime
+
+DATE_FIELDS = {
+    "users": ["created_at"],
+    "products": ["created_at"],
+    "carts": ["created_at"],
+    "orders": ["created_at"],
+    "payment_transactions": ["created_at"],
+    "email_verifications": ["expires_at"],
+}
+
+def parse_stored_date(value: str):
+    """Anciennes dates texte : avec décalage (isoformat d'un datetime UTC) ou sans, écrites en UTC (utcnow)"""
+    parsed = parse_datetime(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+async def migrate_collection(name: str, fields: list, batch_size: int) -> dict:
+    collection = db[name]
+    query = {"$or": [{field: {"$type": "string"}} for field in fields]}
+    total = await collection.count_documents(query)
+    converted, invalid = 0, 0
+    if not total:
+        print(f"✅ {name}: rien à convertir")
+        return {"converted": 0, "invalid": 0}
+
+    last_id = None
+    while True:
+        batch_query = {**query, "_id": {"$gt": last_id}} if last_id is not None else query
+        documents = await collection.find(batch_query, {"_id": 1, **{field: 1 for field in fields}}) \
+            .sort("_id", 1) \
+            .limit(batch_size) \
+            .to_list(batch_size)
+        if not documents:
+            break
+        last_id = documents[-1]['_id']
+
+        updates = []
+        for document in documents:
+            values = {}
+            for field in fields:
+                if isinstance(document.get(field), str):
+                    try:
+                        values[field] = parse_stored_date(document[field])
+                    except ValueError:
+                        invalid += 1
+            if values:
+                updates.append(UpdateOne({"_id": document['_id'], **{field: document[field] for field in values}}, {"$set": values}))
+        if updates:
+            result = await collection.bulk_write(updates, ordered=False)
+            converted += result.modified_count
+        print(f"   {name}: {converted}/{total}")
+
+    print(f"✅ {name}: {converted} document(s) converti(s)" + (f", ⚠️  {invalid} date(s) illisible(s) laissée(s) telle(s) quelle(s)" if invalid else ""))
+    return {"converted": converted, "invalid": invalid}
+
+async def main():
+    parser = argparse.ArgumentParser(description="Migration des dates texte vers des dates BSON")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    print("🕒 Migration des dates...")
+    for name, fields in DATE_FIELDS.items():
+        await migrate_collection(name, fields, args.batch_size)
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+"""
+Recalcule les statistiques du tableau de bord (totaux, revenus par jour et par mois) à partir des commandes payées
+Usage: MONGO_URL=mongodb://localhost:27017 python3 rebuild_order_stats.py
+À lancer serveurs arrêtés: un paiement enregistré pendant le recalcul serait perdu lors du remplacement.
+"""
+
+import asyncio
+
+from server import client, db, ensure_indexes, rebuild_order_stats
+
+async def main():
+    print("📊 Recalcul des statistiques des commandes...")
+    await ensure_indexes()
+    await rebuild_order_stats()
+    totals = await db.order_stats.find_one({"_id": "total"})
+    client.close()
+    print(f"✅ {totals['paid_orders']} commande(s) payée(s), {totals['revenue']:.2f} € de revenus")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Rejoue des événements webhook Stripe déjà enregistrés
+Usage: MONGO_URL=mongodb://localhost:27017 python3 replay_webhooks.py [--event-id evt_...] [--since 2024-01-01T00:00:00+00:00]
+Par défaut, rejoue les événements en échec. Le traitement est idempotent:
+une commande déjà payée n'est jamais comptée deux fois.
+"""
+
+import argparse
+import asyncio
+from datetime import datetime, timezone
+
+from server import client, db, process_webhook_batch
+
+async def main():
+    parser = argparse.ArgumentParser(description="Rejoue des événements webhook Stripe")
+    parser.add_argument("--event-id", action="append", default=[], help="événement à rejouer (répétable)")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="rejoue tous les événements reçus depuis cette date")
+    args = parser.parse_args()
+
+    if args.event_id:
+        query = {"_id": {"$in": args.event_id}}
+    elif args.since:
+        query = {"received_at": {"$gte": args.since}}
+    else:
+        query = {"status": "failed"}
+
+    result = await db.stripe_events.update_many(
+        query,
+        {"$set": {"status": "pending", "attempts": 0, "lease_until": datetime.now(timezone.utc)}}
+    )
+    print(f"🔁 {result.modified_count} événement(s) remis en file")
+
+    processed = 0
+    while handled := await process_webhook_batch():
+        processed += handled
+        print(f"   {processed} événement(s) traité(s)")
+
+    failed = await db.stripe_events.count_documents({**query, "status": {"$ne": "processed"}})
+    client.close()
+    print(f"✅ {processed} événement(s) traité(s)" + (f", ⚠️  {failed} toujours en attente ou en échec" if failed else ""))
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,22 +1,48 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, Header, UploadFile, File
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, Response, Header, UploadFile, File, Query
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.datastructures import Headers
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError, OperationFailure
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict, EmailStr
+from pydantic import BaseModel, Field, ConfigDict, EmailStr, field_validator
 from typing import List, Optional
 import uuid
 from datetime import datetime, timezone, timedelta
 import bcrypt
 import jwt
 import shutil
+import subprocess
+import sys
+import multiprocessing
+from array import array
+import asyncio
+import base64
+import json
+import re
+import hashlib
+import hmac
+from urllib.parse import quote, urlencode, urlsplit
+import zipfile
+import csv
+import io
+import mimetypes
+import anyio
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from cachetools import TTLCache
+from PIL import Image, ImageOps, features
 from emergentintegrations.payments.stripe.checkout import StripeCheckout, CheckoutSessionResponse, CheckoutStatusResponse, CheckoutSessionRequest
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail
+import httpx
+import orjson
+import requests
+import stripe
+from requests.adapters import HTTPAdapter
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -27,10 +53,53 @@ UPLOAD_DIR.mkdir(exist_ok=True)
 (UPLOAD_DIR / "images").mkdir(exist_ok=True)
 (UPLOAD_DIR / "audio_previews").mkdir(exist_ok=True)
 (UPLOAD_DIR / "audio_files").mkdir(exist_ok=True)
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MEDIA_CHUNK_SIZE = 256 * 1024
+UPLOAD_MAX_BYTES = {
+    "images": int(os.getenv('UPLOAD_MAX_IMAGE_MB', '20')) * 1024 * 1024,
+    "audio_previews": int(os.getenv('UPLOAD_MAX_PREVIEW_MB', '50')) * 1024 * 1024,
+    "audio_files": int(os.getenv('UPLOAD_MAX_AUDIO_MB', '500')) * 1024 * 1024,
+}
+UPLOAD_MAX_REQUEST_BYTES = int(os.getenv('UPLOAD_MAX_REQUEST_MB', '2048')) * 1024 * 1024  # multi-file album uploads
+# Single-file routes: the body may not exceed the file cap plus multipart framing
+UPLOAD_ROUTES = {
+    "/api/upload/image": "images",
+    "/api/upload/audio-preview": "audio_previews",
+    "/api/upload/audio-file": "audio_files",
+}
+UPLOAD_MULTIPART_OVERHEAD_BYTES = 64 * 1024
+MEDIA_GC_GRACE_HOURS = int(os.getenv('MEDIA_GC_GRACE_HOURS', '24'))  # keep fresh uploads not yet attached to a product
+MEDIA_URL_FIELDS = ["image_url", "audio_preview_url", "audio_file_url", "tracks.audio_url"]
+ORDER_MEDIA_URL_FIELDS = ["items.download_url", "items.tracks.audio_url"]
+
+# Audio processing (ffmpeg in a process pool)
+FFMPEG_BINARY = os.getenv('FFMPEG_BINARY', 'ffmpeg')
+MEDIA_PROCESS_WORKERS = int(os.getenv('MEDIA_PROCESS_WORKERS', '2'))
+AUDIO_PREVIEW_SECONDS = 30
+AUDIO_PREVIEW_BITRATE = "128k"
+AUDIO_RENDITION_BITRATES = {"low": "96k", "high": "192k"}
+WAVEFORM_SAMPLE_RATE = 8000
+WAVEFORM_POINTS = 800
+
+# Cover art derivatives
+IMAGE_WIDTHS = [320, 640, 1280]
+IMAGE_FORMATS = {"avif": ("AVIF", "image/avif", 55), "webp": ("WEBP", "image/webp", 80)}  # format, mime, quality
+mimetypes.add_type("image/avif", ".avif")
+mimetypes.add_type("image/webp", ".webp")
+media_executor = ProcessPoolExecutor(max_workers=MEDIA_PROCESS_WORKERS, mp_context=multiprocessing.get_context("spawn"))
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', '50'))  # per worker process
+MONGO_MIN_POOL_SIZE = int(os.getenv('MONGO_MIN_POOL_SIZE', '0'))
+# connect=False: no socket or monitor thread until first use, so each forked worker opens its own pool
+client = AsyncIOMotorClient(
+    mongo_url,
+    tz_aware=True,  # timestamps are stored as BSON dates and read back in UTC
+    maxPoolSize=MONGO_MAX_POOL_SIZE,
+    minPoolSize=MONGO_MIN_POOL_SIZE,
+    connect=False
+)
 db = client['music_store']
 
 # JWT Configuration
@@ -38,17 +107,134 @@ JWT_SECRET = os.getenv('JWT_SECRET', 'your-secret-key-change-in-production')
 JWT_ALGORITHM = 'HS256'
 JWT_EXPIRATION_HOURS = 24
 
+# Signed downloads
+DOWNLOAD_SECRET = os.getenv('DOWNLOAD_SECRET', JWT_SECRET).encode('utf-8')
+DOWNLOAD_URL_TTL_SECONDS = int(os.getenv('DOWNLOAD_URL_TTL_SECONDS', '300'))
+UNSAFE_FILENAME_CHARS = re.compile(r'[\\/:*?"<>|\x00-\x1f]+')
+
 # Stripe Configuration
 STRIPE_API_KEY = os.getenv('STRIPE_API_KEY', 'sk_test_emergent')
+STRIPE_API_BASE = os.getenv('STRIPE_API_BASE')  # e.g. a local stripe-mock for testing
+STRIPE_CONNECT_TIMEOUT_SECONDS = float(os.getenv('STRIPE_CONNECT_TIMEOUT_SECONDS', '3'))
+STRIPE_TIMEOUT_SECONDS = float(os.getenv('STRIPE_TIMEOUT_SECONDS', '15'))  # whole call, including retries
+STRIPE_MAX_CONNECTIONS = int(os.getenv('STRIPE_MAX_CONNECTIONS', '20'))
+STRIPE_BREAKER_THRESHOLD = 5  # consecutive failures that open the circuit
+STRIPE_BREAKER_COOLDOWN_SECONDS = 30
+STRIPE_LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
 
 # SendGrid Configuration
 SENDGRID_API_KEY = os.getenv('SENDGRID_API_KEY', '')
 SENDER_EMAIL = os.getenv('SENDER_EMAIL', 'noreply@musicstore.com')
+SENDGRID_API_HOST = os.getenv('SENDGRID_API_HOST', 'https://api.sendgrid.com')
+
+# Newsletter delivery
+NEWSLETTER_BATCH_SIZE = int(os.getenv('NEWSLETTER_BATCH_SIZE', '500'))  # personalizations per request (SendGrid max 1000)
+NEWSLETTER_CONCURRENCY = int(os.getenv('NEWSLETTER_CONCURRENCY', '4'))
+NEWSLETTER_REQUESTS_PER_SECOND = float(os.getenv('NEWSLETTER_REQUESTS_PER_SECOND', '5'))
+NEWSLETTER_MAX_RETRIES = 5
+NEWSLETTER_LEASE_SECONDS = 120
+background_tasks = set()
+
+# Stripe webhook queue
+WEBHOOK_BATCH_SIZE = int(os.getenv('WEBHOOK_BATCH_SIZE', '100'))
+WEBHOOK_POLL_SECONDS = float(os.getenv('WEBHOOK_POLL_SECONDS', '5'))  # picks up events received by other worker processes
+WEBHOOK_LEASE_SECONDS = 60
+WEBHOOK_MAX_ATTEMPTS = 5
+STARTUP_LEASE_SECONDS = 600  # maintenance at startup runs in a single worker process
+webhook_wakeup = asyncio.Event()
+
+# Checkout status long-polling
+CHECKOUT_MAX_WAIT_SECONDS = 30
+CHECKOUT_RECHECK_SECONDS = 3  # re-read the transaction in case another worker process applied the webhook
+CHECKOUT_STRIPE_FALLBACK_SECONDS = int(os.getenv('CHECKOUT_STRIPE_FALLBACK_SECONDS', '15'))  # ask Stripe only once the webhook is this late
+checkout_waiters = {}  # session_id -> [asyncio.Event, waiting requests]
+
+# Password hashing pool (bcrypt releases the GIL, so threads give real parallelism)
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', '4'))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', '64'))
+password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password")
+password_jobs_pending = 0
+
+# Cache backend: per-process memory, or Redis (redis://host:6379/0) to share caches between worker processes
+CACHE_URL = os.getenv('CACHE_URL', 'memory://')
+
+# Authenticated user cache (TTL + LRU eviction)
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '10000'))
+USER_CACHE_TTL_SECONDS = int(os.getenv('USER_CACHE_TTL_SECONDS', '60'))
+user_cache_stats = {"hits": 0, "misses": 0}
+
+# Catalog response cache (pre-serialized bodies, cleared on every catalog write)
+CATALOG_CACHE_SIZE = int(os.getenv('CATALOG_CACHE_SIZE', '1000'))
+CATALOG_CACHE_TTL_SECONDS = int(os.getenv('CATALOG_CACHE_TTL_SECONDS', '300'))  # bounds staleness from writes made by other processes
+catalog_cache_stats = {"hits": 0, "misses": 0, "not_modified": 0, "invalidations": 0}
+
+# Catalog pagination
+PRODUCTS_PAGE_SIZE = 50
+PRODUCTS_MAX_PAGE_SIZE = 200
+PRODUCT_SORTS = {
+    "recent": ("created_at", -1),
+    "ancien": ("created_at", 1),
+    "prix_asc": ("prix", 1),
+    "prix_desc": ("prix", -1),
+    "titre": ("titre", 1),
+}
+
+# Admin listings and exports
+ADMIN_PAGE_SIZE = 50
+ADMIN_MAX_PAGE_SIZE = 500
+EXPORT_BATCH_SIZE = 1000  # documents per cursor batch
+EXPORT_CHUNK_BYTES = 64 * 1024  # CSV rows are flushed to the client in chunks of this size
+USER_PROJECTION = {"_id": 0, "mot_de_passe": 0}
+USER_EXPORT_FIELDS = ["id", "prenom", "nom", "email", "adresse", "email_verifie", "role", "created_at"]
+ORDER_EXPORT_FIELDS = ["id", "user_id", "total", "payment_status", "stripe_session_id", "created_at", "items"]
+CSV_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+# Catalog search (descriptions are indexed as whole words only: their prefixes would multiply the index entries per product)
+SEARCH_MIN_PREFIX = 2
+SEARCH_MAX_PREFIX = 12
+SEARCH_FIELD_TAGS = {"titre": "t", "artiste": "a", "tracks": "m", "description": "d"}
+SEARCH_FIELD_WEIGHTS = {"titre": 10, "artiste": 8, "tracks": 4, "description": 2}  # whole-word match; a prefix match scores half
+SEARCH_PREFIX_FIELDS = {"titre", "artiste", "tracks"}  # descriptions are prose: whole words only keeps the index small
+SEARCH_INDEX_VERSION = 3  # bump when the keyword format changes; older products are re-indexed at startup
+PRODUCT_PROJECTION = {"_id": 0, "search_keywords": 0, "search_version": 0}
+CART_PRODUCT_PROJECTION = {"_id": 0, "id": 1, "titre": 1, "artiste": 1, "type": 1, "prix": 1, "image_url": 1}
+CHECKOUT_PRODUCT_PROJECTION = {"_id": 0, "id": 1, "titre": 1, "prix": 1, "audio_file_url": 1, "tracks": 1}
 
 # Security
 security = HTTPBearer()
 
-app = FastAPI()
+# JSON rendering
+def json_default(value):
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+def dump_json(content) -> bytes:
+    # The Mongo client is tz_aware, so BSON dates already carry their UTC offset
+    return orjson.dumps(content, default=json_default, option=orjson.OPT_NON_STR_KEYS)
+
+class FastJSONResponse(JSONResponse):
+    """orjson rendering; returned directly, it also skips FastAPI's jsonable_encoder pass over trusted DB documents"""
+    def render(self, content) -> bytes:
+        return dump_json(content)
+
+# Media URLs
+def media_path(url):
+    """Uploaded files are referenced by their /uploads/... path, whatever origin the client prefixed
+    (the admin UI sends REACT_APP_BACKEND_URL + path); other URLs are kept as they are"""
+    if not url:
+        return url
+    parsed = urlsplit(url)
+    if parsed.scheme in ("http", "https") and parsed.path.startswith("/uploads/") and parsed.path.split("/")[2] in UPLOAD_MAX_BYTES:
+        return parsed.path
+    return url
+
+def media_tracks(tracks):
+    if tracks is None:
+        return None
+    return [{**track, "audio_url": media_path(track['audio_url'])} if track.get('audio_url') else track for track in tracks]
+
+app = FastAPI(default_response_class=FastJSONResponse)
 api_router = APIRouter(prefix="/api")
 
 # ============= MODELS =============
@@ -87,7 +273,19 @@ class Product(BaseModel):
     audio_file_url: str  # For singles
     tracks: Optional[List[dict]] = []  # For albums: [{"numero": 1, "titre": "Track 1", "audio_url": "..."}]
     description: str
+    audio_renditions: Optional[dict] = None  # Generated: preview_url, low_url, high_url, peaks_url, duration
+    image_srcset: Optional[dict] = None  # Generated: {"image/avif": "<url> 320w, <url> 640w", "image/webp": ...}
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    
+    @field_validator("image_url", "audio_preview_url", "audio_file_url")
+    @classmethod
+    def relative_media_url(cls, url):
+        return media_path(url)
+    
+    @field_validator("tracks")
+    @classmethod
+    def relative_track_urls(cls, tracks):
+        return media_tracks(tracks)
 
 class CartItem(BaseModel):
     product_id: str
@@ -106,6 +304,17 @@ class OrderItem(BaseModel):
     prix: float
     quantite: int
     download_url: str
+    tracks: List[dict] = []  # Albums: [{"titre": ..., "audio_url": ...}] as sold, delivered even if the product changes later
+    
+    @field_validator("download_url")
+    @classmethod
+    def relative_media_url(cls, url):
+        return media_path(url)
+    
+    @field_validator("tracks")
+    @classmethod
+    def relative_track_urls(cls, tracks):
+        return media_tracks(tracks)
 
 class Order(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -140,6 +349,9 @@ class EmailVerificationToken(BaseModel):
 class CheckoutRequest(BaseModel):
     origin_url: str
 
+class OwnershipRequest(BaseModel):
+    product_ids: List[str] = Field(..., max_length=500)
+
 class NewsletterRequest(BaseModel):
     subject: str
     message: str
@@ -155,6 +367,16 @@ class ProductUpdate(BaseModel):
     audio_file_url: Optional[str] = None
     tracks: Optional[List[dict]] = None
     description: Optional[str] = None
+    
+    @field_validator("image_url", "audio_preview_url", "audio_file_url")
+    @classmethod
+    def relative_media_url(cls, url):
+        return media_path(url)
+    
+    @field_validator("tracks")
+    @classmethod
+    def relative_track_urls(cls, tracks):
+        return media_tracks(tracks)
 
 # ============= UTILITIES =============
 
@@ -164,6 +386,29 @@ def hash_password(password: str) -> str:
 def verify_password(password: str, hashed: str) -> bool:
     return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
 
+async def run_password_job(func, *args):
+    """Run a bcrypt call on the password pool, shedding load with 503 when the queue is full"""
+    global password_jobs_pending
+    if password_jobs_pending >= PASSWORD_HASH_MAX_PENDING:
+        raise HTTPException(
+            status_code=503,
+            detail="Serveur surchargé, veuillez réessayer dans quelques instants",
+            headers={"Retry-After": "1"}
+        )
+    password_jobs_pending += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(password_executor, func, *args)
+    finally:
+        password_jobs_pending -= 1
+
+def spawn_background(coroutine):
+    """Run a coroutine detached from the request, keeping a reference so it is not garbage collected"""
+    task = asyncio.create_task(coroutine)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
 def create_access_token(user_id: str, email: str) -> str:
     payload = {
         'user_id': user_id,
@@ -180,12 +425,592 @@ def decode_token(token: str) -> dict:
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Token invalide")
 
+class MemoryCache:
+    """Per-process TTL + LRU cache; every invalidation bumps a version so in-flight fills for the old version are dropped"""
+    def __init__(self, maxsize: int, ttl: int):
+        self.entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.generation = 0
+    
+    async def version(self) -> int:
+        return self.generation
+    
+    async def get(self, key: str):
+        return self.entries.get(key)
+    
+    async def set(self, key: str, value, version: Optional[int] = None):
+        if version is None or version == self.generation:
+            self.entries[key] = value
+    
+    async def delete(self, key: str):
+        self.generation += 1
+        self.entries.pop(key, None)
+    
+    async def clear(self):
+        self.generation += 1
+        self.entries.clear()
+    
+    async def info(self) -> dict:
+        return {"backend": "memory", "size": len(self.entries), "max_size": self.entries.maxsize, "ttl_seconds": self.entries.ttl}
+    
+    async def close(self):
+        pass
+
+class RedisCache:
+    """Shared by every worker process; values are JSON. A hit is a single GET: the version key is only
+    read on the fill path, where a WATCH transaction drops the write if an invalidation landed meanwhile."""
+    def __init__(self, url: str, name: str, ttl: int):
+        import redis.asyncio as redis  # only required when CACHE_URL points at Redis
+        self.redis = redis.from_url(url)
+        self.watch_error = redis.WatchError
+        self.prefix = f"musicstore:{name}"
+        self.version_key = f"{self.prefix}:version"
+        self.ttl = ttl
+    
+    def entry_key(self, key: str) -> str:
+        return f"{self.prefix}:entry:{key}"
+    
+    async def version(self) -> int:
+        return int(await self.redis.get(self.version_key) or 0)
+    
+    async def get(self, key: str):
+        value = await self.redis.get(self.entry_key(key))
+        return None if value is None else orjson.loads(value)
+    
+    async def set(self, key: str, value, version: Optional[int] = None):
+        if version is None:
+            await self.redis.set(self.entry_key(key), dump_json(value), ex=self.ttl)
+            return
+        async with self.redis.pipeline() as pipe:
+            try:
+                await pipe.watch(self.version_key)
+                if int(await pipe.get(self.version_key) or 0) != version:
+                    return
+                pipe.multi()
+                pipe.set(self.entry_key(key), dump_json(value), ex=self.ttl)
+                await pipe.execute()
+            except self.watch_error:
+                pass  # invalidated between the check and the write
+    
+    async def delete(self, key: str):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.incr(self.version_key)
+            pipe.delete(self.entry_key(key))
+            await pipe.execute()
+    
+    async def clear(self):
+        await self.redis.incr(self.version_key)
+        keys = []
+        async for key in self.redis.scan_iter(match=self.entry_key("*"), count=1000):
+            keys.append(key)
+            if len(keys) == 1000:
+                await self.redis.unlink(*keys)
+                keys = []
+        if keys:
+            await self.redis.unlink(*keys)
+    
+    async def info(self) -> dict:
+        size = 0
+        async for _ in self.redis.scan_iter(match=self.entry_key("*"), count=1000):
+            size += 1
+        return {"backend": "redis", "size": size, "max_size": None, "ttl_seconds": self.ttl}
+    
+    async def close(self):
+        await self.redis.aclose()
+
+def make_cache(name: str, maxsize: int, ttl: int):
+    if CACHE_URL.startswith(("redis://", "rediss://")):
+        return RedisCache(CACHE_URL, name, ttl)
+    return MemoryCache(maxsize, ttl)
+
+user_cache = make_cache("users", USER_CACHE_SIZE, USER_CACHE_TTL_SECONDS)
+catalog_cache = make_cache("catalog", CATALOG_CACHE_SIZE, CATALOG_CACHE_TTL_SECONDS)
+
+async def invalidate_cached_user(user_id: str):
+    await user_cache.delete(user_id)
+
+async def invalidate_catalog_cache():
+    await catalog_cache.clear()
+    catalog_cache_stats["invalidations"] += 1
+
+def catalog_cache_key(request: Request) -> str:
+    # Parameter order must not split the cache
+    return request.url.path + "?" + urlencode(sorted(request.query_params.multi_items()))
+
+async def cached_catalog_response(request: Request, build) -> Response:
+    """Serve build()'s (content, headers) from the catalog cache with ETag revalidation"""
+    key = catalog_cache_key(request)
+    entry = await catalog_cache.get(key)
+    if entry is None:
+        catalog_cache_stats["misses"] += 1
+        version = await catalog_cache.version()
+        content, headers = await build()
+        body = dump_json(content)
+        entry = {"body": body.decode('utf-8'), "etag": f'"{hashlib.sha256(body).hexdigest()[:32]}"', "headers": headers}
+        # Stored under the version read before the query, so a write that landed meanwhile is not masked
+        await catalog_cache.set(key, entry, version=version)
+    else:
+        catalog_cache_stats["hits"] += 1
+        body = entry['body'].encode('utf-8')
+    
+    etag = entry['etag']
+    headers = {**entry['headers'], "ETag": etag, "Cache-Control": "no-cache"}
+    if etag in [tag.strip().removeprefix("W/") for tag in request.headers.get("if-none-match", "").split(",")]:
+        catalog_cache_stats["not_modified"] += 1
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+def normalize_text(text: str) -> List[str]:
+    """Lowercase, accent-free word tokens (\"Été\" -> \"ete\")"""
+    text = text.lower().replace('œ', 'oe').replace('æ', 'ae')
+    text = ''.join(c for c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(c))
+    return re.findall(r'\w+', text)
+
+def product_search_fields(product: dict) -> dict:
+    texts = {field: product.get(field) or '' for field in SEARCH_FIELD_TAGS}
+    texts['tracks'] = ' '.join(track.get('titre') or '' for track in product.get('tracks') or [])
+    return {field: normalize_text(text) for field, text in texts.items()}
+
+def build_search_keywords(product: dict) -> List[str]:
+    """Field-tagged whole words ("t=midnight") and prefixes ("t:mid", except in descriptions): one
+    multikey index filters type-ahead queries and the same array feeds the in-query ranking"""
+    keywords = set()
+    for field, tokens in product_search_fields(product).items():
+        tag = SEARCH_FIELD_TAGS[field]
+        for token in tokens:
+            keywords.add(f"{tag}={token}")
+            if field not in SEARCH_PREFIX_FIELDS:
+                continue
+            for end in range(SEARCH_MIN_PREFIX, min(len(token), SEARCH_MAX_PREFIX) + 1):
+                keywords.add(f"{tag}:{token[:end]}")
+    return sorted(keywords)
+
+def search_index_fields(product: dict) -> dict:
+    return {"search_keywords": build_search_keywords(product), "search_version": SEARCH_INDEX_VERSION}
+
+def search_term_keywords(term: str) -> List[str]:
+    """Keywords any of which lets a product match the term: a prefix of a title, artist or track
+    word, or a whole description word"""
+    return [
+        f"{tag}:{term[:SEARCH_MAX_PREFIX]}" if field in SEARCH_PREFIX_FIELDS else f"{tag}={term}"
+        for field, tag in SEARCH_FIELD_TAGS.items()
+    ]
+
+def search_score_expression(terms: List[str]) -> dict:
+    """Aggregation expression scoring a product against the query terms from its keywords"""
+    scores = []
+    for term in terms:
+        for field, tag in SEARCH_FIELD_TAGS.items():
+            weight = SEARCH_FIELD_WEIGHTS[field]
+            prefix_score = {"$cond": [{"$in": [f"{tag}:{term[:SEARCH_MAX_PREFIX]}", "$search_keywords"]}, weight / 2, 0]}
+            scores.append({"$cond": [
+                {"$in": [f"{tag}={term}", "$search_keywords"]},
+                weight,
+                prefix_score if field in SEARCH_PREFIX_FIELDS else 0
+            ]})
+    return {"$add": scores}
+
+def parse_datetime(value) -> datetime:
+    """Accept both legacy ISO strings (see migrate_dates.py) and BSON dates"""
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return value
+
+def sign_download(files: List[list], filename: str) -> tuple:
+    """Self-contained download token: the [url, archive name] list, a filename and an expiry,
+    HMAC-signed so it can be checked without a database lookup"""
+    expires = int(datetime.now(timezone.utc).timestamp()) + DOWNLOAD_URL_TTL_SECONDS
+    payload = base64.urlsafe_b64encode(json.dumps({"f": files, "n": filename, "e": expires}).encode('utf-8')).decode('ascii')
+    signature = base64.urlsafe_b64encode(hmac.new(DOWNLOAD_SECRET, payload.encode('ascii'), hashlib.sha256).digest()).decode('ascii')
+    return f"{payload}.{signature}", expires
+
+def verify_download(token: str) -> dict:
+    payload, _, signature = token.partition(".")
+    try:
+        expected = base64.urlsafe_b64encode(hmac.new(DOWNLOAD_SECRET, payload.encode('ascii'), hashlib.sha256).digest()).decode('ascii')
+        if not hmac.compare_digest(signature.encode('ascii'), expected.encode('ascii')):
+            raise ValueError("bad signature")
+        grant = json.loads(base64.urlsafe_b64decode(payload.encode('ascii')))
+    except ValueError:
+        raise HTTPException(status_code=403, detail="Lien de téléchargement invalide")
+    if datetime.now(timezone.utc).timestamp() > grant['e']:
+        raise HTTPException(status_code=403, detail="Lien de téléchargement expiré")
+    return grant
+
+def download_filename(title: str, extension: str) -> str:
+    name = UNSAFE_FILENAME_CHARS.sub('', title).strip() or 'download'
+    return f"{name}.{extension}"
+
+def content_disposition(filename: str) -> str:
+    ascii_name = unicodedata.normalize('NFKD', filename).encode('ascii', 'ignore').decode('ascii')
+    return f"attachment; filename=\"{ascii_name}\"; filename*=UTF-8''{quote(filename)}"
+
+class ZipStream:
+    """Write-only, unseekable sink for zipfile whose bytes are drained as they are produced"""
+    def __init__(self):
+        self.buffer = bytearray()
+        self.position = 0
+    
+    def write(self, data):
+        self.buffer += data
+        self.position += len(data)
+        return len(data)
+    
+    def tell(self):
+        return self.position
+    
+    def flush(self):
+        pass
+    
+    def drain(self) -> bytes:
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+def stream_zip(entries: List[tuple]):
+    """Yield a ZIP archive of (archive name, path) entries chunk by chunk; audio is already compressed,
+    so entries are stored. Iterated in a worker thread by StreamingResponse."""
+    sink = ZipStream()
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+        for name, path in entries:
+            info = zipfile.ZipInfo(name, date_time=datetime.fromtimestamp(path.stat().st_mtime).timetuple()[:6])
+            info.file_size = path.stat().st_size
+            with open(path, "rb") as source, archive.open(info, mode="w") as target:
+                while chunk := source.read(MEDIA_CHUNK_SIZE):
+                    target.write(chunk)
+                    yield sink.drain()
+            yield sink.drain()
+    yield sink.drain()
+
+def encode_cursor(values: list) -> str:
+    # Dates are tagged so the keyset comparison is made against a BSON date, not a string
+    values = [{"$date": value.isoformat()} if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        if not isinstance(values, list) or len(values) != 2:
+            raise ValueError("bad cursor")
+        return [datetime.fromisoformat(value["$date"]) if isinstance(value, dict) else value for value in values]
+    except (ValueError, UnicodeError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Curseur de pagination invalide")
+
+def keyset_filter(field: str, direction: int, cursor: list) -> dict:
+    """Match documents strictly after the (field, id) cursor in the given sort direction"""
+    value, last_id = cursor
+    op = "$gt" if direction == 1 else "$lt"
+    return {"$or": [
+        {field: {op: value}},
+        {field: value, "id": {op: last_id}}
+    ]}
+
+def created_at_range(created_from: Optional[datetime], created_to: Optional[datetime]) -> List[dict]:
+    if created_from is None and created_to is None:
+        return []
+    bounds = {}
+    if created_from is not None:
+        bounds["$gte"] = created_from
+    if created_to is not None:
+        bounds["$lt"] = created_to
+    return [{"created_at": bounds}]
+
+async def admin_page(collection, conditions: List[dict], projection: dict, limit: int, after: Optional[str]) -> Response:
+    """One page of an admin listing, newest first, keyed on (created_at, id)"""
+    if after:
+        conditions = [*conditions, keyset_filter("created_at", -1, decode_cursor(after))]
+    query = {"$and": conditions} if conditions else {}
+    documents = await collection.find(query, projection) \
+        .sort([("created_at", -1), ("id", -1)]) \
+        .limit(limit + 1) \
+        .to_list(limit + 1)
+    
+    headers = {}
+    if len(documents) > limit:
+        documents = documents[:limit]
+        headers["X-Next-Cursor"] = encode_cursor([documents[-1].get('created_at'), documents[-1]['id']])
+    return FastJSONResponse(documents, headers=headers)
+
+def csv_cell(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (list, dict)):
+        return dump_json(value).decode('utf-8')
+    # Keep spreadsheet apps from evaluating user-supplied text as a formula (numbers such as -5 stay numbers)
+    if isinstance(value, str) and value.startswith(CSV_FORMULA_PREFIXES):
+        return "'" + value
+    return str(value)
+
+async def stream_export(cursor, fields: List[str], export_format: str):
+    """Pipe a Mongo cursor to the client one batch at a time (constant memory for any collection size)"""
+    if export_format == "ndjson":
+        async for document in cursor:
+            yield dump_json(document) + b"\n"
+        return
+    
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    async for document in cursor:
+        writer.writerow([csv_cell(document.get(field)) for field in fields])
+        if buffer.tell() >= EXPORT_CHUNK_BYTES:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+def export_response(collection, conditions: List[dict], fields: List[str], export_format: str, name: str) -> StreamingResponse:
+    query = {"$and": conditions} if conditions else {}
+    cursor = collection.find(query, {"_id": 0, **{field: 1 for field in fields}}) \
+        .sort([("created_at", -1), ("id", -1)]) \
+        .batch_size(EXPORT_BATCH_SIZE)
+    media_type = "application/x-ndjson" if export_format == "ndjson" else "text/csv; charset=utf-8"
+    filename = f"{name}-{datetime.now(timezone.utc):%Y%m%d-%H%M%S}.{export_format}"
+    return StreamingResponse(
+        stream_export(cursor, fields, export_format),
+        media_type=media_type,
+        headers={"Content-Disposition": content_disposition(filename)}
+    )
+
+async def find_products_by_ids(product_ids: List[str], projection: dict) -> dict:
+    """Load several products in one round trip, keyed by product id"""
+    if not product_ids:
+        return {}
+    products = await db.products.find({"id": {"$in": product_ids}}, projection).to_list(None)
+    return {product['id']: product for product in products}
+
+def order_stats_updates(created_at, total: float, sign: int = 1) -> List[UpdateOne]:
+    """$inc operations on the running totals and the day/month buckets of an order"""
+    created = parse_datetime(created_at).astimezone(timezone.utc)
+    increments = {"paid_orders": sign, "revenue": sign * total}
+    updates = [UpdateOne({"_id": "total"}, {"$inc": increments}, upsert=True)]
+    for period, key in (("day", created.strftime('%Y-%m-%d')), ("month", created.strftime('%Y-%m'))):
+        updates.append(UpdateOne(
+            {"_id": f"{period}:{key}"},
+            {"$inc": increments, "$set": {"period": period, "key": key}},
+            upsert=True
+        ))
+    return updates
+
+def purchase_upserts(order: dict) -> List[UpdateOne]:
+    """One (user_id, product_id) ownership row per purchased product, keeping the first order that bought it"""
+    return [
+        UpdateOne(
+            {"user_id": order['user_id'], "product_id": item['product_id']},
+            {"$setOnInsert": {"order_id": order['id'], "purchased_at": parse_datetime(order['created_at'])}},
+            upsert=True
+        )
+        for item in order.get('items', [])
+    ]
+
+async def mark_order_paid(order_id: str) -> bool:
+    """Flip an order to paid exactly once, count it in the dashboard stats and record ownership; True on that first flip"""
+    order = await db.orders.find_one_and_update(
+        {"id": order_id, "payment_status": {"$ne": "paid"}},
+        {"$set": {"payment_status": "paid"}},
+        projection={"_id": 0, "id": 1, "user_id": 1, "total": 1, "created_at": 1, "items.product_id": 1}
+    )
+    if order:
+        writes = [db.order_stats.bulk_write(order_stats_updates(order['created_at'], order['total']), ordered=False)]
+        if order.get('items'):
+            writes.append(db.purchases.bulk_write(purchase_upserts(order), ordered=False))
+        await asyncio.gather(*writes)
+    return order is not None
+
+async def backfill_purchases(batch_size: int = 1000) -> int:
+    """Rebuild ownership rows from paid orders (idempotent: existing rows are left as they are)"""
+    written = 0
+    updates = []
+    async for order in db.orders.find({"payment_status": "paid"}, {"_id": 0, "id": 1, "user_id": 1, "created_at": 1, "items.product_id": 1}).batch_size(batch_size):
+        updates += purchase_upserts(order)
+        if len(updates) >= batch_size:
+            result = await db.purchases.bulk_write(updates, ordered=False)
+            written += result.upserted_count
+            updates = []
+    if updates:
+        result = await db.purchases.bulk_write(updates, ordered=False)
+        written += result.upserted_count
+    return written
+
+async def rebuild_order_stats():
+    """Recompute the stats documents from the orders collection with a $group aggregation,
+    built aside and swapped in with one rename so readers never see a partial set.
+    Offline only: a payment counted by mark_order_paid between the aggregation and the rename
+    is dropped with the live collection, so run it with the servers stopped (rebuild_order_stats.py)"""
+    pipeline = [
+        {"$match": {"payment_status": "paid"}},
+        {"$group": {
+            "_id": {"$substr": [{"$toString": "$created_at"}, 0, 10]},
+            "paid_orders": {"$sum": 1},
+            "revenue": {"$sum": "$total"}
+        }}
+    ]
+    totals = {"_id": "total", "paid_orders": 0, "revenue": 0.0}
+    buckets = {}
+    async for day in db.orders.aggregate(pipeline):
+        for period, key in (("day", day['_id']), ("month", day['_id'][:7])):
+            bucket = buckets.setdefault(f"{period}:{key}", {
+                "_id": f"{period}:{key}", "period": period, "key": key, "paid_orders": 0, "revenue": 0.0
+            })
+            bucket['paid_orders'] += day['paid_orders']
+            bucket['revenue'] += day['revenue']
+        totals['paid_orders'] += day['paid_orders']
+        totals['revenue'] += day['revenue']
+    
+    staging = db[f"order_stats_rebuild_{uuid.uuid4().hex[:8]}"]
+    try:
+        await staging.insert_many([totals, *buckets.values()])
+        for collection, keys, options in INDEXES:
+            if collection == "order_stats":
+                await staging.create_index(keys, **options)
+        await staging.rename("order_stats", dropTarget=True)
+    except BaseException:
+        await staging.drop()
+        raise
+
+def order_item_tracks(product: dict) -> List[dict]:
+    """Snapshot of the downloadable tracks of an album, stored in the order item"""
+    return [
+        {"titre": track.get('titre', ''), "audio_url": track['audio_url']}
+        for track in product.get('tracks') or [] if track.get('audio_url')
+    ]
+
+async def backfill_order_tracks(batch_size: int = 1000) -> int:
+    """Snapshot album tracks into order items created before they were recorded (no-op once done).
+    Taken from the current product: the best that can be done for those orders."""
+    written = 0
+    updates = []
+    legacy = {"items": {"$elemMatch": {"tracks": {"$exists": False}}}}
+    async for order in db.orders.find(legacy, {"_id": 1, "items": 1}).batch_size(batch_size):
+        products_by_id = await find_products_by_ids([item['product_id'] for item in order['items']], {"_id": 0, "id": 1, "tracks": 1})
+        items = [
+            {**item, "tracks": order_item_tracks(products_by_id.get(item['product_id'], {}))} if 'tracks' not in item else item
+            for item in order['items']
+        ]
+        updates.append(UpdateOne({"_id": order['_id'], **legacy}, {"$set": {"items": items}}))
+        if len(updates) >= batch_size:
+            written += (await db.orders.bulk_write(updates, ordered=False)).modified_count
+            updates = []
+    if updates:
+        written += (await db.orders.bulk_write(updates, ordered=False)).modified_count
+    return written
+
+async def normalize_media_urls(batch_size: int = 1000) -> dict:
+    """Rewrite media URLs stored with an origin (before media_path) to their /uploads/ path, and look up
+    the renditions and reference counts those products missed (no-op once done)"""
+    absolute = {"$regex": r"^https?://[^/]+/uploads/"}
+    products = 0
+    urls = set()
+    async for product in db.products.find({"$or": [{field: absolute} for field in MEDIA_URL_FIELDS]}, {"_id": 0}):
+        normalized = {field: media_path(product.get(field)) for field in ("image_url", "audio_preview_url", "audio_file_url")}
+        normalized['tracks'] = media_tracks(product.get('tracks'))
+        normalized['audio_renditions'] = await find_audio_renditions({**product, **normalized})
+        normalized['image_srcset'] = await find_image_srcset({**product, **normalized})
+        await db.products.update_one({"id": product['id']}, {"$set": normalized})
+        urls |= product_media_urls(normalized)
+        products += 1
+    
+    orders = 0
+    updates = []
+    async for order in db.orders.find({"$or": [{field: absolute} for field in ORDER_MEDIA_URL_FIELDS]}, {"_id": 1, "items": 1}).batch_size(batch_size):
+        items = [
+            {**item, "download_url": media_path(item.get('download_url')), **({"tracks": media_tracks(item['tracks'])} if 'tracks' in item else {})}
+            for item in order['items']
+        ]
+        updates.append(UpdateOne({"_id": order['_id']}, {"$set": {"items": items}}))
+        for item in items:
+            urls |= {item['download_url']} | {track.get('audio_url') for track in item.get('tracks') or []}
+        if len(updates) >= batch_size:
+            orders += (await db.orders.bulk_write(updates, ordered=False)).modified_count
+            updates = []
+    if updates:
+        orders += (await db.orders.bulk_write(updates, ordered=False)).modified_count
+    
+    await refresh_media_refs({url for url in urls if url and url.startswith("/uploads/")})
+    if products:
+        await invalidate_catalog_cache()
+    return {"products": products, "orders": orders}
+
+def product_media_urls(product: dict) -> set:
+    """Locally stored files a product document points at"""
+    urls = {product.get(field) for field in ("image_url", "audio_preview_url", "audio_file_url")}
+    urls |= {track.get('audio_url') for track in product.get('tracks') or []}
+    return {url for url in urls if url and url.startswith("/uploads/")}
+
+async def refresh_media_refs(urls: set):
+    """Recount how many products and orders reference each stored file"""
+    async def refresh(url):
+        product_refs, order_refs = await asyncio.gather(
+            db.products.count_documents({"$or": [{field: url} for field in MEDIA_URL_FIELDS]}),
+            db.orders.count_documents({"$or": [{field: url} for field in ORDER_MEDIA_URL_FIELDS]})
+        )
+        await db.media.update_one({"_id": url}, {"$set": {"ref_count": product_refs + order_refs}})
+    
+    await asyncio.gather(*(refresh(url) for url in urls))
+
+def find_orphan_files(referenced: set, grace_seconds: float) -> List[Path]:
+    cutoff = datetime.now(timezone.utc).timestamp() - grace_seconds
+    orphans = []
+    for path in UPLOAD_DIR.rglob("*"):
+        if not path.is_file() or path.stat().st_mtime > cutoff:
+            continue
+        url = f"/uploads/{path.relative_to(UPLOAD_DIR).as_posix()}"
+        if url not in referenced:
+            orphans.append(path)
+    return orphans
+
+async def collect_unreferenced_media(dry_run: bool = True) -> dict:
+    """Delete uploaded files that no product or order references any more"""
+    referenced = set()
+    async for product in db.products.find({}, {"_id": 0, **{field: 1 for field in MEDIA_URL_FIELDS}}):
+        referenced |= product_media_urls(product)
+    async for product in db.products.find({"audio_renditions": {"$ne": None}}, {"_id": 0, "audio_renditions": 1}):
+        referenced |= {url for key, url in product['audio_renditions'].items() if key.endswith("_url")}
+    async for product in db.products.find({"image_srcset": {"$ne": None}}, {"_id": 0, "image_srcset": 1}):
+        for srcset in product['image_srcset'].values():
+            referenced |= {candidate.strip().split(" ")[0] for candidate in srcset.split(",")}
+    async for order in db.orders.find({}, {"_id": 0, **{field: 1 for field in ORDER_MEDIA_URL_FIELDS}}):
+        for item in order.get('items', []):
+            referenced |= {item.get('download_url')} | {track.get('audio_url') for track in item.get('tracks') or []}
+    # Generated files live as long as their source, so db.media never points at deleted renditions
+    async for media in db.media.find({"$or": [{"renditions": {"$ne": None}}, {"srcset": {"$ne": None}}]}, {"renditions": 1, "srcset": 1}):
+        if media['_id'] in referenced:
+            referenced |= {url for key, url in (media.get('renditions') or {}).items() if key.endswith("_url")}
+            for srcset in (media.get('srcset') or {}).values():
+                referenced |= {candidate.strip().split(" ")[0] for candidate in srcset.split(",")}
+    
+    orphans = await asyncio.to_thread(find_orphan_files, referenced, MEDIA_GC_GRACE_HOURS * 3600)
+    orphan_urls = [f"/uploads/{path.relative_to(UPLOAD_DIR).as_posix()}" for path in orphans]
+    freed_bytes = sum(path.stat().st_size for path in orphans)
+    if not dry_run:
+        await asyncio.to_thread(lambda: [path.unlink(missing_ok=True) for path in orphans])
+        await db.media.delete_many({"_id": {"$in": orphan_urls}})
+    
+    return {
+        "dry_run": dry_run,
+        "referenced": len(referenced),
+        "orphans": orphan_urls,
+        "freed_bytes": freed_bytes
+    }
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     token = credentials.credentials
     payload = decode_token(token)
-    user = await db.users.find_one({"id": payload['user_id']}, {"_id": 0})
+    user_id = payload['user_id']
+    
+    cached_user = await user_cache.get(user_id)
+    if cached_user is not None:
+        user_cache_stats["hits"] += 1
+        return User(**cached_user)
+    user_cache_stats["misses"] += 1
+    
+    version = await user_cache.version()
+    user = await db.users.find_one({"id": user_id}, {"_id": 0, "mot_de_passe": 0})
     if not user:
         raise HTTPException(status_code=404, detail="Utilisateur non trouvé")
+    # A role change or deletion invalidated meanwhile: don't cache the document read before it
+    await user_cache.set(user_id, user, version=version)
     return User(**user)
 
 async def get_admin_user(current_user: User = Depends(get_current_user)):
@@ -212,15 +1037,16 @@ async def register(user_data: UserRegister):
     )
     
     user_dict = user.model_dump()
-    user_dict['mot_de_passe'] = hash_password(user_data.mot_de_passe)
-    user_dict['created_at'] = user_dict['created_at'].isoformat()
+    user_dict['mot_de_passe'] = await run_password_job(hash_password, user_data.mot_de_passe)
     
-    await db.users.insert_one(user_dict)
+    try:
+        await db.users.insert_one(user_dict)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Cet email est déjà utilisé")
     
     # Create verification token
     verification = EmailVerificationToken(user_id=user.id)
     verification_dict = verification.model_dump()
-    verification_dict['expires_at'] = verification_dict['expires_at'].isoformat()
     await db.email_verifications.insert_one(verification_dict)
     
     # In production, send email with verification link
@@ -239,7 +1065,7 @@ async def verify_email(token: str):
         raise HTTPException(status_code=400, detail="Token de vérification invalide")
     
     # Check expiration
-    expires_at = datetime.fromisoformat(verification['expires_at'])
+    expires_at = parse_datetime(verification['expires_at'])
     if datetime.now(timezone.utc) > expires_at:
         raise HTTPException(status_code=400, detail="Token expiré")
     
@@ -248,6 +1074,7 @@ async def verify_email(token: str):
         {"id": verification['user_id']},
         {"$set": {"email_verifie": True}}
     )
+    await invalidate_cached_user(verification['user_id'])
     
     # Delete verification token
     await db.email_verifications.delete_one({"token": token})
@@ -257,7 +1084,7 @@ async def verify_email(token: str):
 @api_router.post("/auth/login")
 async def login(credentials: UserLogin):
     user = await db.users.find_one({"email": credentials.email}, {"_id": 0})
-    if not user or not verify_password(credentials.mot_de_passe, user['mot_de_passe']):
+    if not user or not await run_password_job(verify_password, credentials.mot_de_passe, user['mot_de_passe']):
         raise HTTPException(status_code=401, detail="Email ou mot de passe incorrect")
     
     if not user.get('email_verifie', False):
@@ -292,28 +1119,99 @@ async def get_me(current_user: User = Depends(get_current_user)):
 # ============= PRODUCTS ROUTES =============
 
 @api_router.get("/products", response_model=List[Product])
-async def get_products():
-    products = await db.products.find({}, {"_id": 0}).to_list(1000)
-    for product in products:
-        if isinstance(product.get('created_at'), str):
-            product['created_at'] = datetime.fromisoformat(product['created_at'])
-    return products
+async def get_products(
+    request: Request,
+    limit: int = Query(PRODUCTS_PAGE_SIZE, ge=1, le=PRODUCTS_MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    type: Optional[str] = None,
+    artiste: Optional[str] = None,
+    prix_min: Optional[float] = Query(None, ge=0),
+    prix_max: Optional[float] = Query(None, ge=0),
+    sort: str = "recent"
+):
+    if sort not in PRODUCT_SORTS:
+        raise HTTPException(status_code=400, detail="Tri invalide")
+    sort_field, direction = PRODUCT_SORTS[sort]
+    
+    conditions = []
+    if type:
+        conditions.append({"type": type})
+    if artiste:
+        conditions.append({"artiste": artiste})
+    if prix_min is not None or prix_max is not None:
+        price_range = {}
+        if prix_min is not None:
+            price_range["$gte"] = prix_min
+        if prix_max is not None:
+            price_range["$lte"] = prix_max
+        conditions.append({"prix": price_range})
+    if after:
+        conditions.append(keyset_filter(sort_field, direction, decode_cursor(after)))
+    query = {"$and": conditions} if conditions else {}
+    
+    async def build():
+        # Fetch one extra document to know whether another page exists
+        products = await db.products.find(query, PRODUCT_PROJECTION) \
+            .sort([(sort_field, direction), ("id", direction)]) \
+            .limit(limit + 1) \
+            .to_list(limit + 1)
+        
+        headers = {}
+        if len(products) > limit:
+            products = products[:limit]
+            last = products[-1]
+            headers["X-Next-Cursor"] = encode_cursor([last.get(sort_field), last['id']])
+        # Documents written through Product are trusted: serialize them as stored
+        return products, headers
+    
+    return await cached_catalog_response(request, build)
+
+@api_router.get("/products/search", response_model=List[Product])
+async def search_products(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=100),
+    type: Optional[str] = None
+):
+    # Single letters are not indexed as prefixes, so only longer terms filter candidates
+    terms = normalize_text(q)
+    indexed_terms = [term for term in terms if len(term) >= SEARCH_MIN_PREFIX]
+    if not indexed_terms:
+        return []
+    
+    # Every term must prefix a title, artist or track word, or be a word of the description
+    conditions = [{"search_keywords": {"$in": search_term_keywords(term)}} for term in indexed_terms]
+    if type:
+        conditions.append({"type": type})
+    # Ranked in the query: $sort + $limit keeps only the top results, over every match
+    products = await db.products.aggregate([
+        {"$match": {"$and": conditions}},
+        {"$addFields": {"search_score": search_score_expression(terms)}},
+        {"$sort": {"search_score": -1, "titre": 1, "id": 1}},
+        {"$limit": limit},
+        {"$project": {**PRODUCT_PROJECTION, "search_score": 0}}
+    ]).to_list(limit)
+    return FastJSONResponse(products)
 
 @api_router.get("/products/{product_id}", response_model=Product)
-async def get_product(product_id: str):
-    product = await db.products.find_one({"id": product_id}, {"_id": 0})
-    if not product:
-        raise HTTPException(status_code=404, detail="Produit non trouvé")
-    if isinstance(product.get('created_at'), str):
-        product['created_at'] = datetime.fromisoformat(product['created_at'])
-    return Product(**product)
+async def get_product(product_id: str, request: Request):
+    async def build():
+        product = await db.products.find_one({"id": product_id}, PRODUCT_PROJECTION)
+        if not product:
+            raise HTTPException(status_code=404, detail="Produit non trouvé")
+        return product, {}
+    
+    return await cached_catalog_response(request, build)
 
 # Admin route to add products (for testing)
 @api_router.post("/products", response_model=Product)
 async def create_product(product: Product):
     product_dict = product.model_dump()
-    product_dict['created_at'] = product_dict['created_at'].isoformat()
+    product_dict.update(search_index_fields(product_dict))
+    product_dict['audio_renditions'] = product.audio_renditions = await find_audio_renditions(product_dict)
+    product_dict['image_srcset'] = product.image_srcset = await find_image_srcset(product_dict)
     await db.products.insert_one(product_dict)
+    await invalidate_catalog_cache()
+    await refresh_media_refs(product_media_urls(product_dict))
     return product
 
 # ============= CART ROUTES =============
@@ -324,62 +1222,64 @@ async def get_cart(current_user: User = Depends(get_current_user)):
     if not cart:
         return {"items": []}
     
-    # Get product details for each item
-    items_with_details = []
-    for item in cart.get('items', []):
-        product = await db.products.find_one({"id": item['product_id']}, {"_id": 0})
-        if product:
-            items_with_details.append({
-                **item,
-                "product": product
-            })
+    # Get product details for every item in a single query
+    items = cart.get('items', [])
+    products_by_id = await find_products_by_ids([item['product_id'] for item in items], CART_PRODUCT_PROJECTION)
+    
+    items_with_details = [
+        {**item, "product": products_by_id[item['product_id']]}
+        for item in items
+        if item['product_id'] in products_by_id
+    ]
     
     return {"items": items_with_details}
 
 @api_router.post("/cart/add")
 async def add_to_cart(item: CartItem, current_user: User = Depends(get_current_user)):
     # Verify product exists
-    product = await db.products.find_one({"id": item.product_id})
+    product = await db.products.find_one({"id": item.product_id}, {"_id": 1})
     if not product:
         raise HTTPException(status_code=404, detail="Produit non trouvé")
     
-    cart = await db.carts.find_one({"user_id": current_user.id})
-    
-    if not cart:
-        # Create new cart
-        new_cart = Cart(user_id=current_user.id, items=[item])
-        cart_dict = new_cart.model_dump()
-        cart_dict['created_at'] = cart_dict['created_at'].isoformat()
-        await db.carts.insert_one(cart_dict)
-    else:
-        # Update existing cart
-        items = cart.get('items', [])
-        existing_item = next((i for i in items if i['product_id'] == item.product_id), None)
-        
-        if existing_item:
-            existing_item['quantite'] += item.quantite
-        else:
-            items.append(item.model_dump())
-        
-        await db.carts.update_one(
-            {"user_id": current_user.id},
-            {"$set": {"items": items}}
+    # Each step is a single atomic update, so concurrent adds never lose quantities
+    for _ in range(3):
+        # Product already in cart: increment its quantity in place
+        result = await db.carts.update_one(
+            {"user_id": current_user.id, "items.product_id": item.product_id},
+            {"$inc": {"items.$.quantite": item.quantite}}
         )
+        if result.matched_count:
+            break
+        
+        # Otherwise append the line, creating the cart if needed. If another request
+        # added the same product meanwhile, the filter misses, the upsert collides with
+        # the unique user_id index and we go back to the increment.
+        new_cart = Cart(user_id=current_user.id)
+        try:
+            await db.carts.update_one(
+                {"user_id": current_user.id, "items.product_id": {"$ne": item.product_id}},
+                {
+                    "$push": {"items": item.model_dump()},
+                    "$setOnInsert": {"id": new_cart.id, "created_at": new_cart.created_at}
+                },
+                upsert=True
+            )
+            break
+        except DuplicateKeyError:
+            continue
+    else:
+        raise HTTPException(status_code=409, detail="Panier modifié simultanément, veuillez réessayer")
     
     return {"message": "Produit ajouté au panier"}
 
 @api_router.delete("/cart/remove/{product_id}")
 async def remove_from_cart(product_id: str, current_user: User = Depends(get_current_user)):
-    cart = await db.carts.find_one({"user_id": current_user.id})
-    if not cart:
-        raise HTTPException(status_code=404, detail="Panier vide")
-    
-    items = [i for i in cart.get('items', []) if i['product_id'] != product_id]
-    
-    await db.carts.update_one(
+    result = await db.carts.update_one(
         {"user_id": current_user.id},
-        {"$set": {"items": items}}
+        {"$pull": {"items": {"product_id": product_id}}}
     )
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Panier vide")
     
     return {"message": "Produit retiré du panier"}
 
@@ -390,6 +1290,100 @@ async def clear_cart(current_user: User = Depends(get_current_user)):
 
 # ============= CHECKOUT & PAYMENT ROUTES =============
 
+def stripe_outage(error: Exception) -> bool:
+    """Timeouts, network errors and Stripe 5xx: only these say Stripe is unwell and count toward the breaker"""
+    if isinstance(error, stripe.StripeError):
+        return isinstance(error, (stripe.APIConnectionError, stripe.APIError)) or (error.http_status or 0) >= 500
+    return isinstance(error, (asyncio.TimeoutError, ConnectionError))
+
+class PaymentClient:
+    """Shared Stripe access: keep-alive transport, per-call timeout, circuit breaker and latency histograms"""
+    def __init__(self):
+        self.checkouts = {}
+        self.session = None
+        self.failures = 0
+        self.open_until = 0.0
+        self.trial_running = False
+        self.latency = {}
+    
+    def start(self):
+        # StripeCheckout goes through the stripe SDK, whose global HTTP client we make pooled and bounded
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=STRIPE_MAX_CONNECTIONS))
+        stripe.default_http_client = stripe.RequestsClient(
+            timeout=(STRIPE_CONNECT_TIMEOUT_SECONDS, STRIPE_TIMEOUT_SECONDS),
+            session=self.session,
+            async_fallback_client=stripe.HTTPXClient(timeout=STRIPE_TIMEOUT_SECONDS)
+        )
+        if STRIPE_API_BASE:
+            stripe.api_base = STRIPE_API_BASE
+    
+    async def close(self):
+        if stripe.default_http_client is not None:
+            await stripe.default_http_client.close_async()
+        if self.session is not None:
+            self.session.close()
+    
+    def checkout(self, webhook_url: str = "https://example.com/webhook") -> StripeCheckout:
+        # One instance per webhook URL (in practice one per frontend origin)
+        if webhook_url not in self.checkouts:
+            self.checkouts[webhook_url] = StripeCheckout(api_key=STRIPE_API_KEY, webhook_url=webhook_url)
+        return self.checkouts[webhook_url]
+    
+    async def call(self, operation: str, coroutine):
+        loop = asyncio.get_running_loop()
+        if loop.time() < self.open_until or self.trial_running:
+            coroutine.close()
+            raise HTTPException(status_code=503, detail="Service de paiement temporairement indisponible")
+        # Once the cooldown is over, a single trial call decides whether the circuit closes again
+        trial = self.failures >= STRIPE_BREAKER_THRESHOLD
+        self.trial_running = trial
+        
+        started = loop.time()
+        try:
+            result = await asyncio.wait_for(coroutine, STRIPE_TIMEOUT_SECONDS)
+        except Exception as e:
+            if isinstance(e, stripe.StripeError) and not stripe_outage(e):
+                # Stripe answered and refused this request (invalid parameters, declined card...): it is up
+                logging.warning(f"Stripe rejected {operation}: {str(e)}")
+                raise HTTPException(status_code=400, detail="Paiement refusé par le service de paiement")
+            if stripe_outage(e):
+                self.failures += 1
+                if self.failures >= STRIPE_BREAKER_THRESHOLD:
+                    self.open_until = loop.time() + STRIPE_BREAKER_COOLDOWN_SECONDS
+                    logging.error(f"Stripe circuit open after {self.failures} failures: {str(e)}")
+            raise HTTPException(status_code=502, detail="Erreur du service de paiement")
+        else:
+            self.failures = 0
+            return result
+        finally:
+            self.trial_running = False
+            self.observe(operation, loop.time() - started)
+    
+    def observe(self, operation: str, seconds: float):
+        histogram = self.latency.setdefault(operation, {"buckets": [0] * (len(STRIPE_LATENCY_BUCKETS) + 1), "count": 0, "sum": 0.0})
+        index = next((i for i, bound in enumerate(STRIPE_LATENCY_BUCKETS) if seconds <= bound), len(STRIPE_LATENCY_BUCKETS))
+        histogram['buckets'][index] += 1
+        histogram['count'] += 1
+        histogram['sum'] += seconds
+    
+    def stats(self) -> dict:
+        labels = [f"le_{bound}" for bound in STRIPE_LATENCY_BUCKETS] + ["le_inf"]
+        return {
+            "circuit": "open" if asyncio.get_running_loop().time() < self.open_until else "closed",
+            "consecutive_failures": self.failures,
+            "latency_seconds": {
+                operation: {
+                    "count": histogram['count'],
+                    "avg": round(histogram['sum'] / histogram['count'], 4),
+                    "buckets": dict(zip(labels, histogram['buckets']))
+                }
+                for operation, histogram in self.latency.items()
+            }
+        }
+
+payments = PaymentClient()
+
 @api_router.post("/checkout/create-session")
 async def create_checkout_session(request: CheckoutRequest, current_user: User = Depends(get_current_user)):
     # Get user's cart
@@ -397,12 +1391,17 @@ async def create_checkout_session(request: CheckoutRequest, current_user: User =
     if not cart or not cart.get('items'):
         raise HTTPException(status_code=400, detail="Panier vide")
     
-    # Calculate total
+    # Price every item from a single read of the catalog
+    products_by_id = await find_products_by_ids(
+        [item['product_id'] for item in cart['items']],
+        CHECKOUT_PRODUCT_PROJECTION
+    )
+    
     total = 0.0
     order_items = []
     
     for item in cart['items']:
-        product = await db.products.find_one({"id": item['product_id']}, {"_id": 0})
+        product = products_by_id.get(item['product_id'])
         if product:
             item_total = product['prix'] * item['quantite']
             total += item_total
@@ -411,13 +1410,14 @@ async def create_checkout_session(request: CheckoutRequest, current_user: User =
                 titre=product['titre'],
                 prix=product['prix'],
                 quantite=item['quantite'],
-                download_url=product['audio_file_url']
+                download_url=product['audio_file_url'],
+                tracks=order_item_tracks(product)
             ))
     
     if total == 0:
         raise HTTPException(status_code=400, detail="Le panier ne contient aucun produit valide")
     
-    # Create order
+    # The order id is generated locally, so Stripe can be called before anything is written
     order = Order(
         user_id=current_user.id,
         items=order_items,
@@ -425,13 +1425,8 @@ async def create_checkout_session(request: CheckoutRequest, current_user: User =
         stripe_session_id="",
         payment_status="pending"
     )
-    order_dict = order.model_dump()
-    order_dict['created_at'] = order_dict['created_at'].isoformat()
-    await db.orders.insert_one(order_dict)
     
-    # Initialize Stripe
-    webhook_url = f"{request.origin_url}/api/webhook/stripe"
-    stripe_checkout = StripeCheckout(api_key=STRIPE_API_KEY, webhook_url=webhook_url)
+    stripe_checkout = payments.checkout(f"{request.origin_url}/api/webhook/stripe")
     
     # Create checkout session
     success_url = f"{request.origin_url}/success?session_id={{{{CHECKOUT_SESSION_ID}}}}"
@@ -448,13 +1443,8 @@ async def create_checkout_session(request: CheckoutRequest, current_user: User =
         }
     )
     
-    session: CheckoutSessionResponse = await stripe_checkout.create_checkout_session(checkout_request)
-    
-    # Update order with session_id
-    await db.orders.update_one(
-        {"id": order.id},
-        {"$set": {"stripe_session_id": session.session_id}}
-    )
+    session: CheckoutSessionResponse = await payments.call("create_checkout_session", stripe_checkout.create_checkout_session(checkout_request))
+    order.stripe_session_id = session.session_id
     
     # Create payment transaction
     transaction = PaymentTransaction(
@@ -467,113 +1457,295 @@ async def create_checkout_session(request: CheckoutRequest, current_user: User =
         payment_status="unpaid",
         metadata={"user_id": current_user.id, "order_id": order.id}
     )
-    transaction_dict = transaction.model_dump()
-    transaction_dict['created_at'] = transaction_dict['created_at'].isoformat()
-    await db.payment_transactions.insert_one(transaction_dict)
+    
+    # Write the order and its transaction together
+    await asyncio.gather(
+        db.orders.insert_one(order.model_dump()),
+        db.payment_transactions.insert_one(transaction.model_dump())
+    )
     
     return {"url": session.url, "session_id": session.session_id}
 
-@api_router.get("/checkout/status/{session_id}")
-async def get_checkout_status(session_id: str, current_user: User = Depends(get_current_user)):
-    # Check if already processed
-    transaction = await db.payment_transactions.find_one({"session_id": session_id}, {"_id": 0})
-    if not transaction:
-        raise HTTPException(status_code=404, detail="Transaction non trouvée")
-    
-    # If already paid, return immediately
-    if transaction['payment_status'] == 'paid':
-        return {
-            "status": "complete",
-            "payment_status": "paid",
-            "order_id": transaction['order_id']
-        }
-    
-    # Check Stripe status
-    webhook_url = f"https://example.com/webhook"  # Not used for status check
-    stripe_checkout = StripeCheckout(api_key=STRIPE_API_KEY, webhook_url=webhook_url)
-    
-    checkout_status: CheckoutStatusResponse = await stripe_checkout.get_checkout_status(session_id)
-    
-    # Update transaction and order
-    if checkout_status.payment_status == 'paid' and transaction['payment_status'] != 'paid':
-        # Update transaction
-        await db.payment_transactions.update_one(
-            {"session_id": session_id},
-            {"$set": {
-                "status": "completed",
-                "payment_status": "paid"
-            }}
-        )
-        
-        # Update order
-        await db.orders.update_one(
-            {"id": transaction['order_id']},
-            {"$set": {"payment_status": "paid"}}
-        )
-        
-        # Clear cart
-        await db.carts.delete_one({"user_id": current_user.id})
-    
+def notify_checkout(session_ids):
+    for session_id in session_ids:
+        waiter = checkout_waiters.pop(session_id, None)
+        if waiter:
+            waiter[0].set()
+
+async def wait_for_checkout(session_id: str, timeout: float):
+    waiter = checkout_waiters.setdefault(session_id, [asyncio.Event(), 0])
+    waiter[1] += 1
+    try:
+        await asyncio.wait_for(waiter[0].wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        waiter[1] -= 1
+        if not waiter[1] and checkout_waiters.get(session_id) is waiter:
+            del checkout_waiters[session_id]
+
+async def complete_paid_sessions(session_ids: List[str]):
+    """Paid transition for checkout sessions; idempotent, the cart is emptied only on the order's first flip"""
+    await db.payment_transactions.update_many(
+        {"session_id": {"$in": session_ids}, "payment_status": {"$ne": "paid"}},
+        {"$set": {
+            "status": "completed",
+            "payment_status": "paid"
+        }}
+    )
+    transactions = await db.payment_transactions.find({"session_id": {"$in": session_ids}}, {"_id": 0, "order_id": 1, "user_id": 1}).to_list(None)
+    flipped = await asyncio.gather(*(mark_order_paid(transaction['order_id']) for transaction in transactions))
+    buyers = [transaction['user_id'] for transaction, first in zip(transactions, flipped) if first]
+    if buyers:
+        await db.carts.delete_many({"user_id": {"$in": buyers}})
+    notify_checkout(session_ids)
+
+def checkout_state(transaction: dict) -> dict:
+    paid = transaction['payment_status'] == 'paid'
     return {
-        "status": checkout_status.status,
-        "payment_status": checkout_status.payment_status,
+        "status": "complete" if paid else transaction.get('checkout_status') or "open",
+        "payment_status": transaction['payment_status'],
         "order_id": transaction['order_id']
     }
 
+async def refresh_checkout_from_stripe(transaction: dict) -> dict:
+    """Fallback for a late webhook: at most one Stripe call per session per staleness window, across all pollers"""
+    now = datetime.now(timezone.utc)
+    last_checked = transaction.get('stripe_checked_at') or transaction['created_at']
+    if now - parse_datetime(last_checked) < timedelta(seconds=CHECKOUT_STRIPE_FALLBACK_SECONDS):
+        return transaction
+    claimed = await db.payment_transactions.update_one(
+        {"session_id": transaction['session_id'], "stripe_checked_at": transaction.get('stripe_checked_at')},
+        {"$set": {"stripe_checked_at": now}}
+    )
+    if not claimed.modified_count:
+        return transaction
+    
+    try:
+        checkout_status: CheckoutStatusResponse = await payments.call("get_checkout_status", payments.checkout().get_checkout_status(transaction['session_id']))
+    except HTTPException as e:
+        # Stripe down or circuit open: the poller keeps the local state and the webhook may still arrive
+        logging.warning(f"Stripe status fallback failed for {transaction['session_id']}: {e.detail}")
+        return transaction
+    await db.payment_transactions.update_one(
+        {"session_id": transaction['session_id']},
+        {"$set": {"checkout_status": checkout_status.status}}
+    )
+    if checkout_status.payment_status == 'paid':
+        await complete_paid_sessions([transaction['session_id']])
+        return {**transaction, "payment_status": "paid"}
+    return {**transaction, "checkout_status": checkout_status.status}
+
+@api_router.get("/checkout/status/{session_id}")
+async def get_checkout_status(
+    session_id: str,
+    wait: float = Query(0, ge=0, le=CHECKOUT_MAX_WAIT_SECONDS),
+    current_user: User = Depends(get_current_user)
+):
+    # Served from the state the webhook maintains; with ?wait=N the request is held until it changes
+    deadline = asyncio.get_running_loop().time() + wait
+    projection = {"_id": 0, "session_id": 1, "order_id": 1, "payment_status": 1, "checkout_status": 1, "stripe_checked_at": 1, "created_at": 1}
+    while True:
+        transaction = await db.payment_transactions.find_one({"session_id": session_id, "user_id": current_user.id}, projection)
+        if not transaction:
+            raise HTTPException(status_code=404, detail="Transaction non trouvée")
+        if transaction['payment_status'] != 'paid':
+            transaction = await refresh_checkout_from_stripe(transaction)
+        
+        remaining = deadline - asyncio.get_running_loop().time()
+        if transaction['payment_status'] == 'paid' or transaction.get('checkout_status') == 'expired' or remaining <= 0:
+            return checkout_state(transaction)
+        await wait_for_checkout(session_id, min(remaining, CHECKOUT_RECHECK_SECONDS))
+
 # ============= ORDERS ROUTES =============
 
 @api_router.get("/orders")
 async def get_my_orders(current_user: User = Depends(get_current_user)):
     orders = await db.orders.find({"user_id": current_user.id}, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    for order in orders:
-        if isinstance(order.get('created_at'), str):
-            order['created_at'] = datetime.fromisoformat(order['created_at'])
-    return orders
+    return FastJSONResponse(orders)
 
 @api_router.get("/orders/{order_id}")
 async def get_order(order_id: str, current_user: User = Depends(get_current_user)):
     order = await db.orders.find_one({"id": order_id, "user_id": current_user.id}, {"_id": 0})
     if not order:
         raise HTTPException(status_code=404, detail="Commande non trouvée")
-    if isinstance(order.get('created_at'), str):
-        order['created_at'] = datetime.fromisoformat(order['created_at'])
     return order
 
+@api_router.post("/purchases/ownership")
+async def check_ownership(request: OwnershipRequest, current_user: User = Depends(get_current_user)):
+    # Covered by the (user_id, product_id) index: no document is fetched
+    owned = await db.purchases.find(
+        {"user_id": current_user.id, "product_id": {"$in": request.product_ids}},
+        {"_id": 0, "product_id": 1}
+    ).to_list(None)
+    return {"owned": [purchase['product_id'] for purchase in owned]}
+
+@api_router.get("/orders/{order_id}/download/{product_id}")
+async def get_download_link(order_id: str, product_id: str, current_user: User = Depends(get_current_user)):
+    order = await db.orders.find_one(
+        {"id": order_id, "user_id": current_user.id, "payment_status": "paid"},
+        {"_id": 0, "items": 1}
+    )
+    item = next((i for i in order.get('items', []) if i['product_id'] == product_id), None) if order else None
+    if not item:
+        raise HTTPException(status_code=404, detail="Achat non trouvé")
+    
+    # Albums are delivered as a ZIP of the tracks recorded in the order, whatever became of the product since.
+    # Paths are normalized again in case the order predates media_path: uploads are only reachable signed
+    download_url = media_path(item['download_url'])
+    tracks = media_tracks(item.get('tracks')) or []
+    if tracks:
+        files = [
+            [track['audio_url'], download_filename(f"{index:02d} - {track.get('titre', '')}", track['audio_url'].rsplit(".", 1)[-1])]
+            for index, track in enumerate(tracks, start=1)
+        ]
+        filename = download_filename(item['titre'], "zip")
+    else:
+        filename = download_filename(item['titre'], download_url.rsplit(".", 1)[-1])
+        files = [[download_url, filename]]
+    
+    # Files hosted elsewhere (seed data) cannot be signed
+    if not all(url.startswith("/uploads/") for url, _ in files):
+        return {"url": download_url, "expires_at": None}
+    
+    token, expires = sign_download(files, filename)
+    return {"url": f"/api/downloads/{token}", "expires_at": datetime.fromtimestamp(expires, timezone.utc)}
+
+@api_router.api_route("/downloads/{token}", methods=["GET", "HEAD"])
+async def download_file(token: str, request: Request):
+    grant = verify_download(token)
+    entries = [(name, UPLOAD_DIR / url.removeprefix("/uploads/")) for url, name in grant['f']]
+    if not all(path.is_file() for _, path in entries):
+        raise HTTPException(status_code=404, detail="Fichier non trouvé")
+    disposition = {"Content-Disposition": content_disposition(grant['n'])}
+    
+    if len(entries) == 1:
+        path = entries[0][1]
+        stat = path.stat()
+        return file_response(request, path, f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"', "private, no-store", disposition)
+    
+    return StreamingResponse(stream_zip(entries), media_type="application/zip", headers=disposition)
+
 # ============= WEBHOOK =============
 
 @api_router.post("/webhook/stripe")
 async def stripe_webhook(request: Request, stripe_signature: str = Header(None)):
     body = await request.body()
     
-    webhook_url = "https://example.com/webhook"
-    stripe_checkout = StripeCheckout(api_key=STRIPE_API_KEY, webhook_url=webhook_url)
-    
+    # Signature verification is local, so it bypasses the circuit breaker
     try:
-        webhook_response = await stripe_checkout.handle_webhook(body, stripe_signature)
-        
-        # Update transaction and order based on webhook
-        if webhook_response.payment_status == 'paid':
-            session_id = webhook_response.session_id
-            
-            await db.payment_transactions.update_one(
-                {"session_id": session_id},
-                {"$set": {
-                    "status": "completed",
-                    "payment_status": "paid"
-                }}
-            )
-            
-            transaction = await db.payment_transactions.find_one({"session_id": session_id})
-            if transaction:
-                await db.orders.update_one(
-                    {"id": transaction['order_id']},
-                    {"$set": {"payment_status": "paid"}}
-                )
-        
-        return {"status": "success"}
+        event = await payments.checkout().handle_webhook(body, stripe_signature)
     except Exception as e:
         logging.error(f"Webhook error: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
+    
+    # Persist and ack; the event id is the _id, so Stripe retries are absorbed here
+    now = datetime.now(timezone.utc)
+    try:
+        await db.stripe_events.insert_one({
+            "_id": event.event_id,
+            "type": event.event_type,
+            "session_id": event.session_id,
+            "payment_status": event.payment_status,
+            "payload": body.decode('utf-8', 'replace'),
+            "status": "pending",
+            "attempts": 0,
+            "lease_until": now,
+            "received_at": now
+        })
+    except DuplicateKeyError:
+        return {"status": "duplicate"}
+    
+    webhook_wakeup.set()
+    return {"status": "success"}
+
+async def claim_webhook_events() -> List[dict]:
+    """Lease a batch of due events so concurrent workers never apply the same one at once"""
+    now = datetime.now(timezone.utc)
+    due = {"status": {"$in": ["pending", "processing"]}, "lease_until": {"$lte": now}}
+    candidates = await db.stripe_events.find(due, {"_id": 1}) \
+        .sort("lease_until", 1) \
+        .limit(WEBHOOK_BATCH_SIZE) \
+        .to_list(WEBHOOK_BATCH_SIZE)
+    if not candidates:
+        return []
+    
+    ids = [event['_id'] for event in candidates]
+    claim = str(uuid.uuid4())
+    await db.stripe_events.update_many(
+        {"_id": {"$in": ids}, **due},
+        {
+            "$set": {"status": "processing", "claim": claim, "lease_until": now + timedelta(seconds=WEBHOOK_LEASE_SECONDS)},
+            "$inc": {"attempts": 1}
+        }
+    )
+    return await db.stripe_events.find(
+        {"_id": {"$in": ids}, "claim": claim},
+        {"_id": 1, "type": 1, "session_id": 1, "payment_status": 1, "attempts": 1}
+    ).to_list(None)
+
+async def apply_webhook_events(events: List[dict]):
+    """State transitions for a batch of events; safe to repeat since mark_order_paid applies once"""
+    paid_sessions = list({event['session_id'] for event in events if event.get('payment_status') == 'paid' and event.get('session_id')})
+    expired_sessions = list({event['session_id'] for event in events if event.get('type') == 'checkout.session.expired' and event.get('session_id')})
+    if paid_sessions:
+        await complete_paid_sessions(paid_sessions)
+    if expired_sessions:
+        await db.payment_transactions.update_many(
+            {"session_id": {"$in": expired_sessions}, "payment_status": {"$ne": "paid"}},
+            {"$set": {"checkout_status": "expired"}}
+        )
+        notify_checkout(expired_sessions)
+
+async def process_webhook_batch() -> int:
+    """Claim and apply one batch; returns the number of events handled"""
+    events = await claim_webhook_events()
+    if not events:
+        return 0
+    
+    failures = {}
+    try:
+        await apply_webhook_events(events)
+    except Exception as e:
+        # Isolate the culprit: one malformed event must not hold back the rest of its batch
+        logging.error(f"Webhook batch failed ({len(events)} events), applying them one by one: {str(e)}")
+        for event in events:
+            try:
+                await apply_webhook_events([event])
+            except Exception as event_error:
+                failures[event['_id']] = (event['attempts'], str(event_error))
+    
+    now = datetime.now(timezone.utc)
+    updates = [
+        UpdateOne(
+            {"_id": event['_id']},
+            {"$set": {"status": "processed", "processed_at": now}, "$unset": {"error": ""}}
+        )
+        for event in events if event['_id'] not in failures
+    ]
+    for event_id, (attempts, error) in failures.items():
+        logging.error(f"Webhook event {event_id} failed (attempt {attempts}): {error}")
+        # Retry with backoff; events that keep failing are parked for replay_webhooks.py
+        if attempts >= WEBHOOK_MAX_ATTEMPTS:
+            retry = {"status": "failed", "error": error}
+        else:
+            retry = {"status": "pending", "error": error, "lease_until": now + timedelta(seconds=min(2 ** attempts, 300))}
+        updates.append(UpdateOne({"_id": event_id, "status": "processing"}, {"$set": retry}))
+    await db.stripe_events.bulk_write(updates, ordered=False)
+    return len(events)
+
+async def run_webhook_worker():
+    while True:
+        webhook_wakeup.clear()
+        try:
+            if await process_webhook_batch():
+                continue
+        except Exception as e:
+            logging.error(f"Webhook worker error: {str(e)}")
+        try:
+            await asyncio.wait_for(webhook_wakeup.wait(), WEBHOOK_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
 
 # ============= SEED DATA FOR TESTING =============
 
@@ -647,30 +1819,71 @@ async def seed_products():
     
     for product in products:
         product_dict = product.model_dump()
-        product_dict['created_at'] = product_dict['created_at'].isoformat()
+        product_dict.update(search_index_fields(product_dict))
         await db.products.insert_one(product_dict)
+    await invalidate_catalog_cache()
     
     return {"message": f"{len(products)} produits créés avec succès"}
 
 # ============= FILE UPLOAD ROUTES =============
 
+def write_upload(source, subdir: str, file_extension: str, max_bytes: int) -> dict:
+    """Stream an upload to a temp file in chunks, hashing on the fly, then move it to its
+    content-addressed path. Identical content is stored once. Runs in a worker thread so
+    large files never block the event loop."""
+    digest = hashlib.sha256()
+    size = 0
+    tmp_path = UPLOAD_DIR / subdir / f".{uuid.uuid4()}.part"
+    try:
+        with open(tmp_path, "wb") as buffer:
+            while chunk := source.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"Fichier trop volumineux (maximum {max_bytes // (1024 * 1024)} Mo)"
+                    )
+                digest.update(chunk)
+                buffer.write(chunk)
+        
+        sha256 = digest.hexdigest()
+        relative_path = f"{subdir}/{sha256[:2]}/{sha256}.{file_extension}"
+        destination = UPLOAD_DIR / relative_path
+        deduplicated = destination.exists()
+        if deduplicated:
+            tmp_path.unlink()
+            # Fresh again for the media GC grace period, like a new upload not yet attached to a product
+            os.utime(destination)
+        else:
+            destination.parent.mkdir(exist_ok=True)
+            os.replace(tmp_path, destination)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    return {"url": f"/uploads/{relative_path}", "size": size, "sha256": sha256, "deduplicated": deduplicated}
+
+async def save_upload(file: UploadFile, subdir: str) -> dict:
+    file_extension = re.sub(r'[^a-z0-9]', '', file.filename.split(".")[-1].lower())[:10] or "bin"
+    saved = await asyncio.to_thread(write_upload, file.file, subdir, file_extension, UPLOAD_MAX_BYTES[subdir])
+    await db.media.update_one(
+        {"_id": saved['url']},
+        {"$setOnInsert": {
+            "sha256": saved['sha256'],
+            "size": saved['size'],
+            "ref_count": 0,
+            "created_at": datetime.now(timezone.utc)
+        }},
+        upsert=True
+    )
+    return saved
+
 @api_router.post("/upload/image")
 async def upload_image(file: UploadFile = File(...), admin: User = Depends(get_admin_user)):
     # Validate file type
     if not file.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="Le fichier doit être une image")
     
-    # Generate unique filename
-    file_extension = file.filename.split(".")[-1]
-    unique_filename = f"{uuid.uuid4()}.{file_extension}"
-    file_path = UPLOAD_DIR / "images" / unique_filename
-    
-    # Save file
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
-    # Return URL
-    return {"url": f"/uploads/images/{unique_filename}"}
+    return schedule_image_processing(await save_upload(file, "images"))
 
 @api_router.post("/upload/audio-preview")
 async def upload_audio_preview(file: UploadFile = File(...), admin: User = Depends(get_admin_user)):
@@ -678,17 +1891,8 @@ async def upload_audio_preview(file: UploadFile = File(...), admin: User = Depen
     if not file.content_type.startswith("audio/"):
         raise HTTPException(status_code=400, detail="Le fichier doit être un audio")
     
-    # Generate unique filename
-    file_extension = file.filename.split(".")[-1]
-    unique_filename = f"{uuid.uuid4()}.{file_extension}"
-    file_path = UPLOAD_DIR / "audio_previews" / unique_filename
-    
-    # Save file
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
-    # Return URL
-    return {"url": f"/uploads/audio_previews/{unique_filename}"}
+    # Renditions are made from the full track (audio_file_url), not from a hand-cut preview
+    return await save_upload(file, "audio_previews")
 
 @api_router.post("/upload/audio-file")
 async def upload_audio_file(file: UploadFile = File(...), admin: User = Depends(get_admin_user)):
@@ -696,74 +1900,447 @@ async def upload_audio_file(file: UploadFile = File(...), admin: User = Depends(
     if not file.content_type.startswith("audio/"):
         raise HTTPException(status_code=400, detail="Le fichier doit être un audio")
     
-    # Generate unique filename
-    file_extension = file.filename.split(".")[-1]
-    unique_filename = f"{uuid.uuid4()}.{file_extension}"
-    file_path = UPLOAD_DIR / "audio_files" / unique_filename
-    
-    # Save file
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
-    # Return URL
-    return {"url": f"/uploads/audio_files/{unique_filename}"}
+    return schedule_audio_processing(await save_upload(file, "audio_files"))
 
 @api_router.post("/upload/multiple-audio-files")
 async def upload_multiple_audio_files(files: List[UploadFile] = File(...), admin: User = Depends(get_admin_user)):
     """Upload multiple audio files for an album"""
-    uploaded_files = []
+    audio_files = [file for file in files if file.content_type.startswith("audio/")]
+    saved_files = await asyncio.gather(*(save_upload(file, "audio_files") for file in audio_files))
+    # Only the first track becomes the album's audio_file_url, whose renditions are recorded (primary_audio_url)
+    if saved_files:
+        schedule_audio_processing(saved_files[0])
+    
+    uploaded_files = [
+        {"original_name": file.filename, **saved}
+        for file, saved in zip(audio_files, saved_files)
+    ]
     
-    for file in files:
-        # Validate file type
-        if not file.content_type.startswith("audio/"):
-            continue
+    return {"files": uploaded_files}
+
+# ============= AUDIO PROCESSING =============
+
+def waveform_peaks(source: str) -> tuple:
+    """Decode to mono 16-bit PCM and reduce it to WAVEFORM_POINTS normalized peaks"""
+    window = WAVEFORM_SAMPLE_RATE // 10
+    process = subprocess.Popen(
+        [FFMPEG_BINARY, "-nostdin", "-v", "error", "-i", source, "-ac", "1", "-ar", str(WAVEFORM_SAMPLE_RATE), "-f", "s16le", "-"],
+        stdout=subprocess.PIPE
+    )
+    window_peaks = []
+    samples = 0
+    pending = b""
+    while True:
+        chunk = process.stdout.read(window * 2 * 64)
+        pending += chunk
+        usable = len(pending) if not chunk else len(pending) - len(pending) % (window * 2)
+        data = array('h', pending[:usable - usable % 2])
+        pending = pending[usable:]
+        if sys.byteorder == "big":
+            data.byteswap()
+        for start in range(0, len(data), window):
+            part = data[start:start + window]
+            window_peaks.append(max(max(part), -min(part)))
+        samples += len(data)
+        if not chunk:
+            break
+    if process.wait() != 0:
+        raise subprocess.CalledProcessError(process.returncode, FFMPEG_BINARY)
+    
+    group = max(1, -(-len(window_peaks) // WAVEFORM_POINTS))
+    peaks = [round(max(window_peaks[i:i + group]) / 32768, 3) for i in range(0, len(window_peaks), group)]
+    return peaks, samples / WAVEFORM_SAMPLE_RATE
+
+def render_audio(source: str, output_dir: str) -> dict:
+    """Cut the preview clip, encode the renditions and compute waveform peaks; runs in the process pool"""
+    output_path = Path(output_dir)
+    tmp_dir = output_path.with_name(f".{output_path.name}.{uuid.uuid4()}.tmp")
+    tmp_dir.mkdir(parents=True)
+    try:
+        encode = [FFMPEG_BINARY, "-nostdin", "-v", "error", "-y", "-i", source, "-vn", "-map_metadata", "-1", "-codec:a", "libmp3lame"]
+        subprocess.run(
+            [*encode, "-t", str(AUDIO_PREVIEW_SECONDS), "-b:a", AUDIO_PREVIEW_BITRATE, str(tmp_dir / "preview.mp3")],
+            check=True, capture_output=True
+        )
+        for name, bitrate in AUDIO_RENDITION_BITRATES.items():
+            subprocess.run([*encode, "-b:a", bitrate, str(tmp_dir / f"{name}.mp3")], check=True, capture_output=True)
+        peaks, duration = waveform_peaks(source)
+        (tmp_dir / "peaks.json").write_text(json.dumps({"duration": round(duration, 2), "peaks": peaks}))
         
-        # Generate unique filename
-        file_extension = file.filename.split(".")[-1]
-        unique_filename = f"{uuid.uuid4()}.{file_extension}"
-        file_path = UPLOAD_DIR / "audio_files" / unique_filename
+        try:
+            os.replace(tmp_dir, output_path)
+        except OSError:
+            # Same content already rendered by another upload
+            shutil.rmtree(tmp_dir)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    return {"duration": round(duration, 2)}
+
+def primary_audio_url(product: dict) -> Optional[str]:
+    """The file a product's renditions are generated from: the single, or an album's first track"""
+    if product.get('audio_file_url'):
+        return product['audio_file_url']
+    tracks = product.get('tracks') or []
+    return tracks[0].get('audio_url') if tracks else None
+
+async def find_audio_renditions(product: dict) -> Optional[dict]:
+    url = primary_audio_url(product)
+    if not url:
+        return None
+    media = await db.media.find_one({"_id": url}, {"renditions": 1})
+    return media.get('renditions') if media else None
+
+async def process_audio_upload(url: str, sha256: str):
+    media = await db.media.find_one({"_id": url}, {"renditions": 1})
+    if media and media.get('renditions'):
+        return
+    
+    base = f"renditions/{sha256[:2]}/{sha256}"
+    await db.media.update_one({"_id": url}, {"$set": {"processing": "running"}})
+    try:
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(media_executor, render_audio, str(UPLOAD_DIR / url.removeprefix("/uploads/")), str(UPLOAD_DIR / base))
+    except FileNotFoundError:
+        logging.warning(f"ffmpeg not found ({FFMPEG_BINARY}), skipping audio processing for {url}")
+        await db.media.update_one({"_id": url}, {"$set": {"processing": "unavailable"}})
+        return
+    except Exception as e:
+        logging.error(f"Audio processing failed for {url}: {str(e)}")
+        await db.media.update_one({"_id": url}, {"$set": {"processing": "failed"}})
+        return
+    
+    renditions = {
+        "preview_url": f"/uploads/{base}/preview.mp3",
+        **{f"{name}_url": f"/uploads/{base}/{name}.mp3" for name in AUDIO_RENDITION_BITRATES},
+        "peaks_url": f"/uploads/{base}/peaks.json",
+        "duration": result['duration']
+    }
+    await db.media.update_one({"_id": url}, {"$set": {"processing": "done", "renditions": renditions}})
+    # Products created while processing was running
+    await db.products.update_many(
+        {"$or": [
+            {"audio_file_url": url},
+            {"audio_file_url": {"$in": ["", None]}, "tracks.0.audio_url": url}
+        ]},
+        {"$set": {"audio_renditions": renditions}}
+    )
+    await invalidate_catalog_cache()
+
+def schedule_audio_processing(saved: dict) -> dict:
+    spawn_background(process_audio_upload(saved['url'], saved['sha256']))
+    return saved
+
+# ============= IMAGE PROCESSING =============
+
+def render_image(source: str, output_dir: str) -> dict:
+    """Resize cover art to each of IMAGE_WIDTHS (never upscaling) in every supported modern format;
+    runs in the process pool"""
+    output_path = Path(output_dir)
+    tmp_dir = output_path.with_name(f".{output_path.name}.{uuid.uuid4()}.tmp")
+    tmp_dir.mkdir(parents=True)
+    try:
+        with Image.open(source) as original:
+            image = ImageOps.exif_transpose(original)
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        widths = sorted({min(width, image.width) for width in IMAGE_WIDTHS})
+        formats = {ext: spec for ext, spec in IMAGE_FORMATS.items() if features.check(ext)}
         
-        # Save file
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        for width in widths:
+            height = max(1, round(image.height * width / image.width))
+            resized = image.resize((width, height), Image.Resampling.LANCZOS) if width != image.width else image
+            for ext, (pil_format, _, quality) in formats.items():
+                resized.save(tmp_dir / f"{width}.{ext}", pil_format, quality=quality)
         
-        uploaded_files.append({
-            "original_name": file.filename,
-            "url": f"/uploads/audio_files/{unique_filename}"
-        })
+        try:
+            os.replace(tmp_dir, output_path)
+        except OSError:
+            # Same content already rendered by another upload
+            shutil.rmtree(tmp_dir)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    return {"widths": widths, "formats": list(formats)}
+
+async def find_image_srcset(product: dict) -> Optional[dict]:
+    url = product.get('image_url')
+    if not url or not url.startswith("/uploads/"):
+        return None
+    media = await db.media.find_one({"_id": url}, {"srcset": 1})
+    return media.get('srcset') if media else None
+
+async def process_image_upload(url: str, sha256: str):
+    media = await db.media.find_one({"_id": url}, {"srcset": 1})
+    if media and media.get('srcset'):
+        return
+    
+    base = f"derivatives/{sha256[:2]}/{sha256}"
+    await db.media.update_one({"_id": url}, {"$set": {"processing": "running"}})
+    try:
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(media_executor, render_image, str(UPLOAD_DIR / url.removeprefix("/uploads/")), str(UPLOAD_DIR / base))
+    except Exception as e:
+        logging.error(f"Image processing failed for {url}: {str(e)}")
+        await db.media.update_one({"_id": url}, {"$set": {"processing": "failed"}})
+        return
     
-    return {"files": uploaded_files}
+    srcset = {
+        IMAGE_FORMATS[ext][1]: ", ".join(f"/uploads/{base}/{width}.{ext} {width}w" for width in result['widths'])
+        for ext in result['formats']
+    }
+    await db.media.update_one({"_id": url}, {"$set": {"processing": "done", "srcset": srcset}})
+    await db.products.update_many({"image_url": url}, {"$set": {"image_srcset": srcset}})
+    await invalidate_catalog_cache()
+
+def schedule_image_processing(saved: dict) -> dict:
+    spawn_background(process_image_upload(saved['url'], saved['sha256']))
+    return saved
+
+def file_sha256(path: Path) -> str:
+    with open(path, "rb") as source:
+        return hashlib.file_digest(source, "sha256").hexdigest()
+
+async def backfill_image_srcsets() -> dict:
+    """Generate derivatives for products whose cover art was uploaded before the pipeline existed"""
+    processed, skipped = 0, 0
+    query = {"image_url": {"$regex": "^/uploads/"}, "image_srcset": None}
+    async for product in db.products.find(query, {"_id": 0, "image_url": 1}):
+        url = product['image_url']
+        path = UPLOAD_DIR / url.removeprefix("/uploads/")
+        if not path.is_file():
+            skipped += 1
+            continue
+        sha256 = await asyncio.to_thread(file_sha256, path)
+        await db.media.update_one(
+            {"_id": url},
+            {"$setOnInsert": {"sha256": sha256, "size": path.stat().st_size, "ref_count": 0, "created_at": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+        # Several products may share one cover: count them like any other upload
+        await refresh_media_refs({url})
+        await process_image_upload(url, sha256)
+        processed += 1
+    return {"processed": processed, "skipped": skipped}
+
+# ============= NEWSLETTER DELIVERY =============
+
+def newsletter_recipients_query(send_to: str) -> dict:
+    return {"email_verifie": True} if send_to == "verified" else {}
+
+def newsletter_html(message: str) -> str:
+    # "-prenom-" is substituted per recipient by SendGrid
+    return f"""
+    <html>
+        <body style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
+            <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 40px; text-align: center;">
+                <h1 style="color: white; margin: 0;">🎵 MusicStore</h1>
+            </div>
+            <div style="padding: 40px; background-color: #f9f9f9;">
+                <p>Bonjour -prenom-,</p>
+                <div style="background: white; padding: 30px; border-radius: 10px; margin: 20px 0;">
+                    {message}
+                </div>
+                <p style="color: #666; font-size: 14px;">
+                    Merci de faire partie de notre communauté musicale !
+                </p>
+            </div>
+            <div style="background: #333; color: white; padding: 20px; text-align: center; font-size: 12px;">
+                <p>© 2025 MusicStore - Tous droits réservés</p>
+            </div>
+        </body>
+    </html>
+    """
+
+class RateLimiter:
+    """Spaces request starts evenly so no more than `rate` are issued per second"""
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self.next_slot = 0.0
+        self.lock = asyncio.Lock()
+    
+    async def wait(self):
+        loop = asyncio.get_running_loop()
+        async with self.lock:
+            now = loop.time()
+            delay = self.next_slot - now
+            self.next_slot = max(now, self.next_slot) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+async def send_newsletter_batch(http: httpx.AsyncClient, limiter: RateLimiter, job: dict, recipients: List[dict]) -> bool:
+    """One SendGrid request with a personalization per recipient, retried on transient errors"""
+    payload = {
+        "personalizations": [
+            {"to": [{"email": user['email']}], "substitutions": {"-prenom-": user.get('prenom') or 'Cher membre'}}
+            for user in recipients
+        ],
+        "from": {"email": SENDER_EMAIL},
+        "subject": job['subject'],
+        "content": [{"type": "text/html", "value": newsletter_html(job['message'])}]
+    }
+    
+    for attempt in range(NEWSLETTER_MAX_RETRIES):
+        await limiter.wait()
+        try:
+            response = await http.post("/v3/mail/send", json=payload)
+        except httpx.TransportError as e:
+            logging.warning(f"Newsletter {job['id']}: transport error ({str(e)}), attempt {attempt + 1}")
+        else:
+            if response.status_code < 300:
+                return True
+            if response.status_code != 429 and response.status_code < 500:
+                logging.error(f"Newsletter {job['id']}: batch rejected ({response.status_code}): {response.text}")
+                return False
+            logging.warning(f"Newsletter {job['id']}: SendGrid returned {response.status_code}, attempt {attempt + 1}")
+        await asyncio.sleep(min(2 ** attempt, 30))
+    return False
+
+async def run_newsletter_job(job_id: str):
+    # Claim the job with a lease so only one worker process delivers it
+    now = datetime.now(timezone.utc)
+    job = await db.newsletter_jobs.find_one_and_update(
+        {"id": job_id, "status": {"$in": ["queued", "running"]}, "lease_until": {"$lte": now}},
+        {"$set": {"status": "running", "lease_until": now + timedelta(seconds=NEWSLETTER_LEASE_SECONDS)}},
+        return_document=ReturnDocument.AFTER
+    )
+    if not job:
+        return
+    
+    limiter = RateLimiter(NEWSLETTER_REQUESTS_PER_SECOND)
+    query = {**newsletter_recipients_query(job['send_to']), "id": {"$gt": job['last_recipient_id']}}
+    recipients = db.users.find(query, {"_id": 0, "id": 1, "email": 1, "prenom": 1}).sort("id", 1)
+    
+    async def send_wave(http, batches):
+        # Batches of a wave run concurrently; progress is checkpointed once the whole wave is done
+        results = await asyncio.gather(*(send_newsletter_batch(http, limiter, job, batch) for batch in batches))
+        sent = sum(len(batch) for batch, ok in zip(batches, results) if ok)
+        failed = sum(len(batch) for batch, ok in zip(batches, results) if not ok)
+        await db.newsletter_jobs.update_one(
+            {"id": job_id},
+            {
+                "$inc": {"sent": sent, "failed": failed},
+                "$set": {
+                    "last_recipient_id": batches[-1][-1]['id'],
+                    "lease_until": datetime.now(timezone.utc) + timedelta(seconds=NEWSLETTER_LEASE_SECONDS)
+                }
+            }
+        )
+    
+    try:
+        async with httpx.AsyncClient(
+            base_url=SENDGRID_API_HOST,
+            headers={"Authorization": f"Bearer {SENDGRID_API_KEY}"},
+            timeout=30.0
+        ) as http:
+            batches = [[]]
+            async for user in recipients:
+                batches[-1].append(user)
+                if len(batches[-1]) == NEWSLETTER_BATCH_SIZE:
+                    if len(batches) == NEWSLETTER_CONCURRENCY:
+                        await send_wave(http, batches)
+                        batches = []
+                    batches.append([])
+            batches = [batch for batch in batches if batch]
+            if batches:
+                await send_wave(http, batches)
+        
+        await db.newsletter_jobs.update_one(
+            {"id": job_id},
+            {"$set": {"status": "completed", "finished_at": datetime.now(timezone.utc)}}
+        )
+    except Exception as e:
+        logging.error(f"Newsletter {job_id} failed: {str(e)}")
+        await db.newsletter_jobs.update_one(
+            {"id": job_id},
+            {"$set": {"status": "failed", "error": str(e), "finished_at": datetime.now(timezone.utc)}}
+        )
+
+def start_newsletter_job(job_id: str, delay: float = 0):
+    async def run():
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await run_newsletter_job(job_id)
+    
+    spawn_background(run())
+
+async def resume_newsletter_jobs():
+    """Pick up jobs interrupted by a restart once the previous worker's lease has expired"""
+    now = datetime.now(timezone.utc)
+    async for job in db.newsletter_jobs.find({"status": {"$in": ["queued", "running"]}}, {"_id": 0, "id": 1, "lease_until": 1}):
+        remaining = (parse_datetime(job['lease_until']) - now).total_seconds()
+        start_newsletter_job(job['id'], delay=max(remaining, 0))
 
 # ============= ADMIN ROUTES =============
 
 # Dashboard Stats
 @api_router.get("/admin/stats")
 async def get_admin_stats(admin: User = Depends(get_admin_user)):
-    total_users = await db.users.count_documents({})
-    total_products = await db.products.count_documents({})
-    total_orders = await db.orders.count_documents({})
-    paid_orders = await db.orders.count_documents({"payment_status": "paid"})
-    
-    # Calculate total revenue
-    orders = await db.orders.find({"payment_status": "paid"}, {"_id": 0, "total": 1}).to_list(1000)
-    total_revenue = sum(order.get('total', 0) for order in orders)
+    # Collection counts come from metadata; paid orders and revenue from the maintained stats document
+    total_users, total_products, total_orders, totals = await asyncio.gather(
+        db.users.estimated_document_count(),
+        db.products.estimated_document_count(),
+        db.orders.estimated_document_count(),
+        db.order_stats.find_one({"_id": "total"})
+    )
+    totals = totals or {}
     
     return {
         "total_users": total_users,
         "total_products": total_products,
         "total_orders": total_orders,
-        "paid_orders": paid_orders,
-        "total_revenue": round(total_revenue, 2)
+        "paid_orders": totals.get('paid_orders', 0),
+        "total_revenue": round(totals.get('revenue', 0.0), 2)
     }
 
+@api_router.get("/admin/stats/revenue")
+async def get_revenue_history(
+    period: str = "day",
+    limit: int = Query(30, ge=1, le=366),
+    admin: User = Depends(get_admin_user)
+):
+    if period not in ["day", "month"]:
+        raise HTTPException(status_code=400, detail="Période invalide")
+    
+    buckets = await db.order_stats.find({"period": period}, {"_id": 0, "period": 0}) \
+        .sort("key", -1) \
+        .to_list(limit)
+    for bucket in buckets:
+        bucket['revenue'] = round(bucket['revenue'], 2)
+    return buckets
+
 # User Management
+def user_filters(role: Optional[str], email_verifie: Optional[bool], created_from: Optional[datetime], created_to: Optional[datetime]) -> List[dict]:
+    conditions = created_at_range(created_from, created_to)
+    if role:
+        conditions.append({"role": role})
+    if email_verifie is not None:
+        conditions.append({"email_verifie": email_verifie})
+    return conditions
+
 @api_router.get("/admin/users")
-async def get_all_users(admin: User = Depends(get_admin_user)):
-    users = await db.users.find({}, {"_id": 0, "mot_de_passe": 0}).to_list(1000)
-    for user in users:
-        if isinstance(user.get('created_at'), str):
-            user['created_at'] = datetime.fromisoformat(user['created_at'])
-    return users
+async def get_all_users(
+    limit: int = Query(ADMIN_PAGE_SIZE, ge=1, le=ADMIN_MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    role: Optional[str] = None,
+    email_verifie: Optional[bool] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    admin: User = Depends(get_admin_user)
+):
+    conditions = user_filters(role, email_verifie, created_from, created_to)
+    return await admin_page(db.users, conditions, USER_PROJECTION, limit, after)
+
+@api_router.get("/admin/users/export")
+async def export_users(
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    role: Optional[str] = None,
+    email_verifie: Optional[bool] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    admin: User = Depends(get_admin_user)
+):
+    conditions = user_filters(role, email_verifie, created_from, created_to)
+    return export_response(db.users, conditions, USER_EXPORT_FIELDS, format, "utilisateurs")
 
 @api_router.patch("/admin/users/{user_id}/role")
 async def update_user_role(user_id: str, role: str, admin: User = Depends(get_admin_user)):
@@ -777,6 +2354,7 @@ async def update_user_role(user_id: str, role: str, admin: User = Depends(get_ad
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Utilisateur non trouvé")
+    await invalidate_cached_user(user_id)
     
     return {"message": "Rôle mis à jour avec succès"}
 
@@ -787,12 +2365,21 @@ async def delete_user(user_id: str, admin: User = Depends(get_admin_user)):
         raise HTTPException(status_code=400, detail="Vous ne pouvez pas supprimer votre propre compte")
     
     result = await db.users.delete_one({"id": user_id})
+    await invalidate_cached_user(user_id)
     
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Utilisateur non trouvé")
     
-    # Also delete user's orders and cart
+    # Remove the user's paid orders from the dashboard stats before deleting them
+    stats_updates = []
+    async for order in db.orders.find({"user_id": user_id, "payment_status": "paid"}, {"_id": 0, "total": 1, "created_at": 1}):
+        stats_updates += order_stats_updates(order['created_at'], order['total'], sign=-1)
+    if stats_updates:
+        await db.order_stats.bulk_write(stats_updates, ordered=False)
+    
+    # Also delete user's orders, purchases and cart
     await db.orders.delete_many({"user_id": user_id})
+    await db.purchases.delete_many({"user_id": user_id})
     await db.carts.delete_one({"user_id": user_id})
     
     return {"message": "Utilisateur supprimé avec succès"}
@@ -805,28 +2392,39 @@ async def update_product(product_id: str, product_update: ProductUpdate, admin:
         raise HTTPException(status_code=404, detail="Produit non trouvé")
     
     update_data = {k: v for k, v in product_update.model_dump().items() if v is not None}
+    if update_data.keys() & SEARCH_FIELD_TAGS.keys():
+        update_data.update(search_index_fields({**product, **update_data}))
+    if update_data.keys() & {"audio_file_url", "tracks"}:
+        update_data['audio_renditions'] = await find_audio_renditions({**product, **update_data})
+    if "image_url" in update_data:
+        update_data['image_srcset'] = await find_image_srcset({**product, **update_data})
     
     if update_data:
         await db.products.update_one(
             {"id": product_id},
             {"$set": update_data}
         )
+        await invalidate_catalog_cache()
+        await refresh_media_refs(product_media_urls(product) | product_media_urls({**product, **update_data}))
     
-    updated_product = await db.products.find_one({"id": product_id}, {"_id": 0})
-    if isinstance(updated_product.get('created_at'), str):
-        updated_product['created_at'] = datetime.fromisoformat(updated_product['created_at'])
-    
-    return updated_product
+    return await db.products.find_one({"id": product_id}, PRODUCT_PROJECTION)
 
 @api_router.delete("/admin/products/{product_id}")
 async def delete_product(product_id: str, admin: User = Depends(get_admin_user)):
-    result = await db.products.delete_one({"id": product_id})
+    product = await db.products.find_one_and_delete({"id": product_id}, projection={"_id": 0, **{field: 1 for field in MEDIA_URL_FIELDS}})
     
-    if result.deleted_count == 0:
+    if not product:
         raise HTTPException(status_code=404, detail="Produit non trouvé")
+    await invalidate_catalog_cache()
+    await refresh_media_refs(product_media_urls(product))
     
     return {"message": "Produit supprimé avec succès"}
 
+# Media storage
+@api_router.post("/admin/media/gc")
+async def collect_media_garbage(dry_run: bool = True, admin: User = Depends(get_admin_user)):
+    return await collect_unreferenced_media(dry_run=dry_run)
+
 # Newsletter / Email to Members
 @api_router.post("/admin/send-newsletter")
 async def send_newsletter(newsletter: NewsletterRequest, admin: User = Depends(get_admin_user)):
@@ -836,76 +2434,366 @@ async def send_newsletter(newsletter: NewsletterRequest, admin: User = Depends(g
             detail="SendGrid n'est pas configuré. Ajoutez SENDGRID_API_KEY et SENDER_EMAIL dans .env"
         )
     
-    # Get users based on filter
-    query = {}
-    if newsletter.send_to == "verified":
-        query["email_verifie"] = True
-    
-    users = await db.users.find(query, {"_id": 0, "email": 1, "prenom": 1, "nom": 1}).to_list(1000)
-    
-    if not users:
+    total = await db.users.count_documents(newsletter_recipients_query(newsletter.send_to))
+    if not total:
         raise HTTPException(status_code=404, detail="Aucun utilisateur trouvé")
     
-    # Send emails
-    sg = SendGridAPIClient(SENDGRID_API_KEY)
-    sent_count = 0
-    failed_count = 0
+    # Delivery runs in the background; the admin polls the job for progress
+    job = {
+        "id": str(uuid.uuid4()),
+        "subject": newsletter.subject,
+        "message": newsletter.message,
+        "send_to": newsletter.send_to,
+        "status": "queued",
+        "total": total,
+        "sent": 0,
+        "failed": 0,
+        "last_recipient_id": "",
+        "lease_until": datetime.now(timezone.utc),
+        "created_at": datetime.now(timezone.utc),
+        "finished_at": None,
+        "error": None
+    }
+    await db.newsletter_jobs.insert_one(job)
+    start_newsletter_job(job['id'])
     
-    for user in users:
-        try:
-            message = Mail(
-                from_email=SENDER_EMAIL,
-                to_emails=user['email'],
-                subject=newsletter.subject,
-                html_content=f"""
-                <html>
-                    <body style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-                        <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 40px; text-align: center;">
-                            <h1 style="color: white; margin: 0;">🎵 MusicStore</h1>
-                        </div>
-                        <div style="padding: 40px; background-color: #f9f9f9;">
-                            <p>Bonjour {user.get('prenom', 'Cher membre')},</p>
-                            <div style="background: white; padding: 30px; border-radius: 10px; margin: 20px 0;">
-                                {newsletter.message}
-                            </div>
-                            <p style="color: #666; font-size: 14px;">
-                                Merci de faire partie de notre communauté musicale !
-                            </p>
-                        </div>
-                        <div style="background: #333; color: white; padding: 20px; text-align: center; font-size: 12px;">
-                            <p>© 2025 MusicStore - Tous droits réservés</p>
-                        </div>
-                    </body>
-                </html>
-                """
-            )
-            sg.send(message)
-            sent_count += 1
-        except Exception as e:
-            logging.error(f"Failed to send email to {user['email']}: {str(e)}")
-            failed_count += 1
+    return {
+        "message": "Newsletter en cours d'envoi",
+        "job_id": job['id'],
+        "total": total
+    }
+
+@api_router.get("/admin/newsletter/{job_id}")
+async def get_newsletter_job(job_id: str, admin: User = Depends(get_admin_user)):
+    job = await db.newsletter_jobs.find_one({"id": job_id}, {"_id": 0, "message": 0, "lease_until": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Envoi non trouvé")
+    return job
+
+# Payment provider health
+@api_router.get("/admin/payment-stats")
+async def get_payment_stats(admin: User = Depends(get_admin_user)):
+    return payments.stats()
+
+# Cache metrics
+@api_router.get("/admin/cache-stats")
+async def get_cache_stats(admin: User = Depends(get_admin_user)):
+    # Hit counters are per worker process; size is the backend's (shared with Redis)
+    async def describe(cache, stats: dict) -> dict:
+        lookups = stats["hits"] + stats["misses"]
+        return {
+            **stats,
+            **await cache.info(),
+            "worker_pid": os.getpid(),
+            "hit_rate": round(stats["hits"] / lookups, 4) if lookups else 0.0
+        }
     
     return {
-        "message": f"Newsletter envoyée avec succès",
-        "sent": sent_count,
-        "failed": failed_count,
-        "total": len(users)
+        "user_cache": await describe(user_cache, user_cache_stats),
+        "catalog_cache": await describe(catalog_cache, catalog_cache_stats)
     }
 
 # Get all orders for admin
+def order_filters(payment_status: Optional[str], created_from: Optional[datetime], created_to: Optional[datetime]) -> List[dict]:
+    conditions = created_at_range(created_from, created_to)
+    if payment_status:
+        conditions.append({"payment_status": payment_status})
+    return conditions
+
 @api_router.get("/admin/orders")
-async def get_all_orders(admin: User = Depends(get_admin_user)):
-    orders = await db.orders.find({}, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    for order in orders:
-        if isinstance(order.get('created_at'), str):
-            order['created_at'] = datetime.fromisoformat(order['created_at'])
-    return orders
+async def get_all_orders(
+    limit: int = Query(ADMIN_PAGE_SIZE, ge=1, le=ADMIN_MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    payment_status: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    admin: User = Depends(get_admin_user)
+):
+    conditions = order_filters(payment_status, created_from, created_to)
+    return await admin_page(db.orders, conditions, {"_id": 0}, limit, after)
+
+@api_router.get("/admin/orders/export")
+async def export_orders(
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    payment_status: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    admin: User = Depends(get_admin_user)
+):
+    conditions = order_filters(payment_status, created_from, created_to)
+    return export_response(db.orders, conditions, ORDER_EXPORT_FIELDS, format, "commandes")
+
+# ============= INDEXES & QUERY PLANS =============
+
+# (collection, keys, options) for every hot query key
+INDEXES = [
+    ("users", [("id", 1)], {"unique": True}),
+    ("users", [("email", 1)], {"unique": True}),
+    # Admin listing: newest first, optionally filtered by role
+    ("users", [("created_at", -1), ("id", -1)], {}),
+    ("users", [("role", 1), ("created_at", -1), ("id", -1)], {}),
+    ("products", [("id", 1)], {"unique": True}),
+    # Catalog listing: one index per sort key, prefixed by the equality filters
+    ("products", [("created_at", -1), ("id", -1)], {}),
+    ("products", [("prix", 1), ("id", 1)], {}),
+    ("products", [("titre", 1), ("id", 1)], {}),
+    ("products", [("type", 1), ("created_at", -1), ("id", -1)], {}),
+    ("products", [("type", 1), ("prix", 1), ("id", 1)], {}),
+    ("products", [("type", 1), ("titre", 1), ("id", 1)], {}),
+    ("products", [("artiste", 1), ("created_at", -1), ("id", -1)], {}),
+    ("products", [("artiste", 1), ("prix", 1), ("id", 1)], {}),
+    ("products", [("artiste", 1), ("titre", 1), ("id", 1)], {}),
+    ("products", [("search_keywords", 1)], {}),
+    # Media reference counting
+    ("products", [("image_url", 1)], {}),
+    ("products", [("audio_preview_url", 1)], {}),
+    ("products", [("audio_file_url", 1)], {}),
+    ("products", [("tracks.audio_url", 1)], {}),
+    ("orders", [("items.download_url", 1)], {}),
+    ("orders", [("items.tracks.audio_url", 1)], {}),
+    # Product ownership, written when an order is paid
+    ("purchases", [("user_id", 1), ("product_id", 1)], {"unique": True}),
+    # One cart per user: cart upserts rely on this to detect concurrent creation
+    ("carts", [("user_id", 1)], {"unique": True}),
+    ("orders", [("id", 1)], {"unique": True}),
+    ("orders", [("user_id", 1), ("created_at", -1)], {}),
+    ("orders", [("created_at", -1), ("id", -1)], {}),
+    ("orders", [("payment_status", 1), ("created_at", -1), ("id", -1)], {}),
+    ("order_stats", [("period", 1), ("key", -1)], {}),
+    ("newsletter_jobs", [("id", 1)], {"unique": True}),
+    ("newsletter_jobs", [("status", 1)], {}),
+    ("payment_transactions", [("session_id", 1)], {"unique": True}),
+    ("email_verifications", [("token", 1)], {"unique": True}),
+    ("email_verifications", [("expires_at", 1)], {"expireAfterSeconds": 0}),
+    # Webhook queue: due events are claimed oldest lease first
+    ("stripe_events", [("status", 1), ("lease_until", 1)], {}),
+]
+
+# Representative query of each hot route: (collection, filter, sort)
+QUERY_PLANS = {
+    "get_current_user": ("users", {"id": "_"}, None),
+    "login": ("users", {"email": "_"}, None),
+    "get_products": ("products", {}, [("created_at", -1), ("id", -1)]),
+    "get_products?type": ("products", {"type": "album"}, [("created_at", -1), ("id", -1)]),
+    "get_products?sort=prix_asc": ("products", {}, [("prix", 1), ("id", 1)]),
+    "get_products?type&sort=titre": ("products", {"type": "album"}, [("titre", 1), ("id", 1)]),
+    "get_products?artiste&sort=prix_desc": ("products", {"artiste": "_"}, [("prix", -1), ("id", -1)]),
+    "get_products?artiste&sort=titre": ("products", {"artiste": "_"}, [("titre", 1), ("id", 1)]),
+    "search_products": ("products", {"$and": [{"search_keywords": {"$in": ["t:_", "a:_"]}}]}, None),
+    "get_product": ("products", {"id": "_"}, None),
+    "get_cart": ("carts", {"user_id": "_"}, None),
+    "get_my_orders": ("orders", {"user_id": "_"}, [("created_at", -1)]),
+    "get_order": ("orders", {"id": "_", "user_id": "_"}, None),
+    "check_ownership": ("purchases", {"user_id": "_", "product_id": {"$in": ["_"]}}, None),
+    "get_all_users": ("users", {}, [("created_at", -1), ("id", -1)]),
+    "get_all_users?role": ("users", {"role": "admin"}, [("created_at", -1), ("id", -1)]),
+    "get_all_orders": ("orders", {}, [("created_at", -1), ("id", -1)]),
+    "get_all_orders?payment_status": ("orders", {"payment_status": "paid"}, [("created_at", -1), ("id", -1)]),
+    "get_revenue_history": ("order_stats", {"period": "day"}, [("key", -1)]),
+    "get_checkout_status": ("payment_transactions", {"session_id": "_"}, None),
+    "claim_webhook_events": ("stripe_events", {"status": {"$in": ["pending", "processing"]}, "lease_until": {"$lte": "_"}}, [("lease_until", 1)]),
+    "verify_email": ("email_verifications", {"token": "_"}, None),
+}
+
+async def ensure_indexes():
+    """Idempotently create every index in INDEXES; failures are logged, not fatal"""
+    for collection, keys, options in INDEXES:
+        try:
+            await db[collection].create_index(keys, **options)
+        except OperationFailure as e:
+            logging.error(f"Index creation failed on {collection} {keys}: {str(e)}")
+
+def plan_stages(plan: dict) -> List[str]:
+    stages = [plan.get('stage', '')]
+    if 'inputStage' in plan:
+        stages += plan_stages(plan['inputStage'])
+    for child in plan.get('inputStages', []):
+        stages += plan_stages(child)
+    return stages
+
+async def explain_query_plans() -> dict:
+    report = {}
+    for route, (collection, query, sort) in QUERY_PLANS.items():
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explanation = await cursor.explain()
+        winning_plan = explanation['queryPlanner']['winningPlan']
+        stages = plan_stages(winning_plan.get('queryPlan', winning_plan))
+        report[route] = {
+            "collection": collection,
+            "stages": stages,
+            "collection_scan": "COLLSCAN" in stages,
+            "in_memory_sort": "SORT" in stages
+        }
+    return report
+
+@api_router.get("/admin/query-plans")
+async def get_query_plans(admin: User = Depends(get_admin_user)):
+    report = await explain_query_plans()
+    return {
+        "ok": not any(plan["collection_scan"] for plan in report.values()),
+        "routes": report
+    }
 
 # Include router
 app.include_router(api_router)
 
-# Mount static files for uploads
-app.mount("/uploads", StaticFiles(directory="/app/uploads"), name="uploads")
+# ============= MEDIA SERVING =============
+
+# "<sha[:2]>/<sha>.<ext>" for uploads, "<sha[:2]>/<sha>/<name>.<ext>" for files derived from them
+CONTENT_ADDRESSED_NAME = re.compile(r'^([0-9a-f]{2})/(\1[0-9a-f]{62})(?:\.[a-z0-9]+|/([a-z0-9_-]+)\.[a-z0-9]+)$')
+
+class MediaFileResponse(Response):
+    """Streams a byte range of a file in MEDIA_CHUNK_SIZE reads, without loading it in memory"""
+    def __init__(self, path: Path, start: int, end: int, status_code: int, headers: dict, send_body: bool = True):
+        super().__init__(status_code=status_code, headers=headers)
+        self.path = path
+        self.start = start
+        self.end = end
+        self.send_body = send_body
+    
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        count = self.end - self.start + 1 if self.send_body else 0
+        if count <= 0:
+            await send({"type": "http.response.body", "body": b""})
+            return
+        
+        async with await anyio.open_file(self.path, "rb") as file:
+            await file.seek(self.start)
+            remaining = count
+            while remaining > 0:
+                chunk = await file.read(min(MEDIA_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                # File shrank while streaming: end the response rather than hang
+                await send({"type": "http.response.body", "body": b""})
+
+def parse_range(range_header: str, size: int) -> Optional[tuple]:
+    """Single "bytes=" range -> (start, end) inclusive; None to serve the whole file; raises 416 if unsatisfiable.
+    An invalid range ("bytes=5-3", "bytes=x-") is ignored like an absent one (RFC 9110 14.2)"""
+    unit, _, ranges = range_header.partition("=")
+    if unit.strip() != "bytes" or "," in ranges:
+        return None
+    start_text, _, end_text = (text.strip() for text in ranges.partition("-"))
+    if not (start_text or end_text) or not all(text.isdigit() for text in (start_text, end_text) if text):
+        return None
+    if start_text:
+        start = int(start_text)
+        if end_text and int(end_text) < start:
+            return None
+        end = min(int(end_text), size - 1) if end_text else size - 1
+    else:
+        # Suffix range: the last N bytes ("bytes=-0" asks for none, so it is unsatisfiable)
+        start, end = size - min(int(end_text), size), size - 1
+    if start > end:
+        raise HTTPException(status_code=416, detail="Plage non satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+def file_response(request: Request, path: Path, etag: str, cache_control: str, extra_headers: Optional[dict] = None) -> Response:
+    """200/206/304/416 response for a file on disk, honouring Range, If-Range and If-None-Match"""
+    stat = path.stat()
+    headers = {
+        "ETag": etag,
+        "Cache-Control": cache_control,
+        "Accept-Ranges": "bytes",
+        "Last-Modified": datetime.fromtimestamp(stat.st_mtime, timezone.utc).strftime('%a, %d %b %Y %H:%M:%S GMT'),
+        **(extra_headers or {})
+    }
+    if_none_match = request.headers.get("if-none-match")
+    # Weak comparison, as for the catalog: a W/ validator still identifies these bytes
+    if if_none_match and (if_none_match.strip() == "*" or etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+    
+    headers["Content-Type"] = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+    start, end, status_code = 0, stat.st_size - 1, 200
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and stat.st_size and (not if_range or if_range.strip() == etag):
+        byte_range = parse_range(range_header, stat.st_size)
+        if byte_range:
+            start, end = byte_range
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+    headers["Content-Length"] = str(end - start + 1)
+    
+    return MediaFileResponse(path, start, end, status_code, headers, send_body=request.method != "HEAD")
+
+def is_public_media(relative_path: str) -> bool:
+    """Purchased masters and their full-length renditions are only reachable through signed downloads"""
+    if relative_path.startswith("audio_files/"):
+        return False
+    if relative_path.startswith("renditions/"):
+        return relative_path.rsplit("/", 1)[-1] in ("preview.mp3", "peaks.json")
+    return True
+
+@app.api_route("/uploads/{file_path:path}", methods=["GET", "HEAD"])
+async def serve_media(file_path: str, request: Request):
+    upload_root = UPLOAD_DIR.resolve()
+    path = (UPLOAD_DIR / file_path).resolve()
+    if not path.is_relative_to(upload_root) or path.name.startswith(".") or not path.is_file():
+        raise HTTPException(status_code=404, detail="Fichier non trouvé")
+    relative_path = path.relative_to(upload_root).as_posix()
+    if not is_public_media(relative_path):
+        raise HTTPException(status_code=404, detail="Fichier non trouvé")
+    
+    # Content-addressed files never change, so their hash is the ETag and they can be cached forever
+    match = CONTENT_ADDRESSED_NAME.match(relative_path.split("/", 1)[-1])
+    if match:
+        etag = f'"{match.group(2)}-{match.group(3)}"' if match.group(3) else f'"{match.group(2)}"'
+        cache_control = "public, max-age=31536000, immutable"
+    else:
+        stat = path.stat()
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        cache_control = "public, max-age=3600"
+    
+    return file_response(request, path, etag, cache_control)
+
+def upload_request_limit(path: str) -> tuple:
+    """(file cap shown to the client, body limit enforced) for an upload route"""
+    subdir = UPLOAD_ROUTES.get(path.rstrip("/"))
+    if not subdir:
+        return UPLOAD_MAX_REQUEST_BYTES, UPLOAD_MAX_REQUEST_BYTES
+    return UPLOAD_MAX_BYTES[subdir], UPLOAD_MAX_BYTES[subdir] + UPLOAD_MULTIPART_OVERHEAD_BYTES
+
+class UploadSizeLimitMiddleware:
+    """Enforces each upload route's body limit before Starlette spools the multipart body to disk:
+    from Content-Length up front, and by counting received bytes for chunked requests.
+    Plain ASGI (not BaseHTTPMiddleware) so streamed media responses pass through untouched."""
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith("/api/upload/"):
+            await self.app(scope, receive, send)
+            return
+        
+        max_bytes, limit = upload_request_limit(scope["path"])
+        too_large = f"Fichier trop volumineux (maximum {max_bytes // (1024 * 1024)} Mo)"
+        content_length = Headers(scope=scope).get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > limit:
+            response = JSONResponse(status_code=413, content={"detail": too_large}, headers={"Connection": "close"})
+            await response(scope, receive, send)
+            return
+        
+        received = 0
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Raised inside the body parser: the handler never runs and the 413 is rendered as usual
+                    raise HTTPException(status_code=413, detail=too_large, headers={"Connection": "close"})
+            return message
+        
+        await self.app(scope, limited_receive, send)
+
+app.add_middleware(UploadSizeLimitMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -913,6 +2801,7 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
 logging.basicConfig(
@@ -921,6 +2810,52 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def create_indexes():
+    payments.start()
+    # With several worker processes, one runs the maintenance while the others start serving
+    if await acquire_lease("startup-maintenance", STARTUP_LEASE_SECONDS):
+        try:
+            await ensure_indexes()
+            await backfill_search_keywords()
+            await normalize_media_urls()
+            await backfill_order_tracks()
+            # First start with counters only: nothing live to lose yet, later rebuilds are offline
+            if not await db.order_stats.find_one({"_id": "total"}):
+                await rebuild_order_stats()
+        finally:
+            await release_lease("startup-maintenance")
+    await resume_newsletter_jobs()
+    spawn_background(run_webhook_worker())
+
+async def acquire_lease(name: str, seconds: int) -> bool:
+    """Cluster-wide lock held until released or until the lease runs out (if its holder died)"""
+    now = datetime.now(timezone.utc)
+    try:
+        await db.leases.update_one(
+            {"_id": name, "lease_until": {"$lte": now}},
+            {"$set": {"lease_until": now + timedelta(seconds=seconds), "holder": os.getpid()}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        return False
+    return True
+
+async def release_lease(name: str):
+    await db.leases.update_one({"_id": name, "holder": os.getpid()}, {"$set": {"lease_until": datetime.now(timezone.utc)}})
+
+async def backfill_search_keywords():
+    """Index products created before search, or under an older keyword format (no-op once all are current)"""
+    async for product in db.products.find({"search_version": {"$ne": SEARCH_INDEX_VERSION}}, {"_id": 1, **{field: 1 for field in SEARCH_FIELD_TAGS}}):
+        await db.products.update_one(
+            {"_id": product['_id']},
+            {"$set": search_index_fields(product)}
+        )
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    client.close()
+    await payments.close()
+    await asyncio.gather(user_cache.close(), catalog_cache.close())
+    password_executor.shutdown(wait=False)
+    media_executor.shutdown(wait=False, cancel_futures=True)
\ No newline at end of file
@@ -53,7 +53,7 @@ async def create_admin():
         'mot_de_passe': hashed,
         'email_verifie': True,
         'role': 'admin',
-        'created_at': datetime.now(timezone.utc).isoformat()
+        'created_at': datetime.now(timezone.utc)
     }
     
     await db.users.insert_one(admin_user)
@@ -15,6 +15,13 @@ import { Toaster } from '@/components/ui/sonner';
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 export const API = `${BACKEND_URL}/api`;
 
+// Purchased files are served through short-lived signed links
+export const downloadPurchase = async (orderId, productId) => {
+  const response = await axios.get(`${API}/orders/${orderId}/download/${productId}`);
+  const { url } = response.data;
+  window.location.href = url.startsWith('/') ? `${BACKEND_URL}${url}` : url;
+};
+
 // Auth Context
 export const AuthContext = createContext();
 
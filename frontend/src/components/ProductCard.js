@@ -1,12 +1,13 @@
 import React, { useState } from 'react';
 import { Link } from 'react-router-dom';
-import { Play, Pause, ShoppingCart } from 'lucide-react';
+import { Play, Pause, ShoppingCart, Check } from 'lucide-react';
 import { Button } from '@/components/ui/button';
 import { Badge } from '@/components/ui/badge';
+import { mediaUrl, mediaSrcSet } from '@/lib/utils';
 
-export const ProductCard = ({ product, onAddToCart, showAddButton = true }) => {
+export const ProductCard = ({ product, onAddToCart, showAddButton = true, owned = false }) => {
   const [isPlaying, setIsPlaying] = useState(false);
-  const [audio] = useState(new Audio(product.audio_preview_url));
+  const [audio] = useState(new Audio(mediaUrl(product.audio_renditions?.preview_url || product.audio_preview_url)));
 
   const togglePlay = (e) => {
     e.preventDefault();
@@ -33,12 +34,23 @@ export const ProductCard = ({ product, onAddToCart, showAddButton = true }) => {
       <div className="glass rounded-2xl overflow-hidden hover-lift animate-fadeIn group">
         {/* Image */}
         <div className="relative h-64 overflow-hidden">
-          <img
-            src={product.image_url}
-            alt={product.titre}
-            className="w-full h-full object-cover group-hover:scale-110 transition-transform duration-500"
-            data-testid="product-image"
-          />
+          <picture>
+            {Object.entries(product.image_srcset || {}).map(([type, srcSet]) => (
+              <source
+                key={type}
+                type={type}
+                srcSet={mediaSrcSet(srcSet)}
+                sizes="(min-width: 1024px) 33vw, (min-width: 768px) 50vw, 100vw"
+              />
+            ))}
+            <img
+              src={mediaUrl(product.image_url)}
+              alt={product.titre}
+              loading="lazy"
+              className="w-full h-full object-cover group-hover:scale-110 transition-transform duration-500"
+              data-testid="product-image"
+            />
+          </picture>
           <div className="absolute inset-0 bg-gradient-to-t from-black/60 to-transparent" />
           
           {/* Play button */}
@@ -55,10 +67,15 @@ export const ProductCard = ({ product, onAddToCart, showAddButton = true }) => {
           </button>
 
           {/* Type badge */}
-          <div className="absolute top-4 left-4">
+          <div className="absolute top-4 left-4 flex gap-2">
             <Badge className="bg-purple-600 text-white" data-testid="product-type">
               {product.type === 'album' ? 'Album' : 'Single'}
             </Badge>
+            {owned && (
+              <Badge className="bg-green-500 text-white" data-testid="product-owned">
+                Acheté
+              </Badge>
+            )}
           </div>
 
           {/* Price */}
@@ -81,7 +98,12 @@ export const ProductCard = ({ product, onAddToCart, showAddButton = true }) => {
             {product.description}
           </p>
 
-          {showAddButton && (
+          {showAddButton && (owned ? (
+            <Button variant="outline" className="w-full mt-4" disabled data-testid="owned-btn">
+              <Check className="w-4 h-4 mr-2" />
+              Déjà dans votre collection
+            </Button>
+          ) : (
             <Button
               onClick={handleAddToCart}
               className="w-full mt-4"
@@ -90,7 +112,7 @@ export const ProductCard = ({ product, onAddToCart, showAddButton = true }) => {
               <ShoppingCart className="w-4 h-4 mr-2" />
               Ajouter au panier
             </Button>
-          )}
+          ))}
         </div>
       </div>
     </Link>
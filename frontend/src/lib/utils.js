@@ -4,3 +4,15 @@ import { twMerge } from "tailwind-merge"
 export function cn(...inputs) {
   return twMerge(clsx(inputs));
 }
+
+// Uploaded media are stored as /uploads/... paths, served by the backend
+export function mediaUrl(url) {
+  return url && url.startsWith("/uploads/") ? `${process.env.REACT_APP_BACKEND_URL}${url}` : url;
+}
+
+export function mediaSrcSet(srcSet) {
+  return srcSet.split(",").map((candidate) => {
+    const [url, ...descriptor] = candidate.trim().split(" ");
+    return [mediaUrl(url), ...descriptor].join(" ");
+  }).join(", ");
+}
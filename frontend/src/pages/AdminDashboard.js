@@ -2,7 +2,7 @@ import React, { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
 import axios from 'axios';
 import { API, useAuth } from '@/App';
-import { Users, Package, ShoppingBag, TrendingUp, Mail, Settings, Plus, Edit, Trash2, Shield } from 'lucide-react';
+import { Users, Package, ShoppingBag, TrendingUp, Mail, Settings, Plus, Edit, Trash2, Shield, Download } from 'lucide-react';
 import { Button } from '@/components/ui/button';
 import { Tabs, TabsContent, TabsList, TabsTrigger } from '@/components/ui/tabs';
 import { Input } from '@/components/ui/input';
@@ -12,6 +12,7 @@ import { Dialog, DialogContent, DialogHeader, DialogTitle, DialogFooter } from '
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from '@/components/ui/select';
 import { Badge } from '@/components/ui/badge';
 import { toast } from 'sonner';
+import { mediaUrl } from '@/lib/utils';
 
 export const AdminDashboard = () => {
   const { user } = useAuth();
@@ -22,6 +23,13 @@ export const AdminDashboard = () => {
   const [orders, setOrders] = useState([]);
   const [loading, setLoading] = useState(true);
   
+  // Paginated listings
+  const [productsCursor, setProductsCursor] = useState(null);
+  const [usersCursor, setUsersCursor] = useState(null);
+  const [ordersCursor, setOrdersCursor] = useState(null);
+  const [userFilters, setUserFilters] = useState({ role: 'all', email_verifie: 'all' });
+  const [orderFilters, setOrderFilters] = useState({ payment_status: 'all' });
+  
   // Modals
   const [editProductModal, setEditProductModal] = useState(false);
   const [addProductModal, setAddProductModal] = useState(false);
@@ -63,19 +71,35 @@ export const AdminDashboard = () => {
     fetchAdminData();
   }, [user]);
 
+  useEffect(() => {
+    if (!loading) fetchUsers();
+  }, [userFilters]);
+
+  useEffect(() => {
+    if (!loading) fetchOrders();
+  }, [orderFilters]);
+
+  // 'all' means no server-side filter
+  const listParams = (filters) => Object.fromEntries(
+    Object.entries(filters).filter(([, value]) => value !== 'all')
+  );
+
   const fetchAdminData = async () => {
     try {
       const [statsRes, usersRes, productsRes, ordersRes] = await Promise.all([
         axios.get(`${API}/admin/stats`),
-        axios.get(`${API}/admin/users`),
+        axios.get(`${API}/admin/users`, { params: listParams(userFilters) }),
         axios.get(`${API}/products`),
-        axios.get(`${API}/admin/orders`)
+        axios.get(`${API}/admin/orders`, { params: listParams(orderFilters) })
       ]);
       
       setStats(statsRes.data);
       setUsers(usersRes.data);
+      setUsersCursor(usersRes.headers['x-next-cursor'] || null);
       setProducts(productsRes.data);
+      setProductsCursor(productsRes.headers['x-next-cursor'] || null);
       setOrders(ordersRes.data);
+      setOrdersCursor(ordersRes.headers['x-next-cursor'] || null);
     } catch (error) {
       if (error.response?.status === 403) {
         toast.error('Accès réservé aux administrateurs');
@@ -88,6 +112,58 @@ export const AdminDashboard = () => {
     }
   };
 
+  const fetchProducts = async (after = null) => {
+    try {
+      const params = after ? { after } : {};
+      const response = await axios.get(`${API}/products`, { params });
+      setProducts(prev => (after ? [...prev, ...response.data] : response.data));
+      setProductsCursor(response.headers['x-next-cursor'] || null);
+    } catch (error) {
+      toast.error('Erreur lors du chargement des produits');
+    }
+  };
+
+  const fetchUsers = async (after = null) => {
+    try {
+      const params = listParams(userFilters);
+      if (after) params.after = after;
+      const response = await axios.get(`${API}/admin/users`, { params });
+      setUsers(prev => (after ? [...prev, ...response.data] : response.data));
+      setUsersCursor(response.headers['x-next-cursor'] || null);
+    } catch (error) {
+      toast.error('Erreur lors du chargement des utilisateurs');
+    }
+  };
+
+  const fetchOrders = async (after = null) => {
+    try {
+      const params = listParams(orderFilters);
+      if (after) params.after = after;
+      const response = await axios.get(`${API}/admin/orders`, { params });
+      setOrders(prev => (after ? [...prev, ...response.data] : response.data));
+      setOrdersCursor(response.headers['x-next-cursor'] || null);
+    } catch (error) {
+      toast.error('Erreur lors du chargement des commandes');
+    }
+  };
+
+  const handleExport = async (resource, filters, format) => {
+    try {
+      const response = await axios.get(`${API}/admin/${resource}/export`, {
+        params: { ...listParams(filters), format },
+        responseType: 'blob'
+      });
+      const url = URL.createObjectURL(response.data);
+      const link = document.createElement('a');
+      link.href = url;
+      link.download = `${resource}.${format}`;
+      link.click();
+      URL.revokeObjectURL(url);
+    } catch (error) {
+      toast.error('Erreur lors de l\'export');
+    }
+  };
+
   const handleAddProduct = async (e) => {
     e.preventDefault();
     setUploading(true);
@@ -105,7 +181,7 @@ export const AdminDashboard = () => {
         const response = await axios.post(`${API}/upload/image`, formData, {
           headers: { 'Content-Type': 'multipart/form-data' }
         });
-        image_url = `${process.env.REACT_APP_BACKEND_URL}${response.data.url}`;
+        image_url = response.data.url;
       }
       
       // Upload audio preview if file selected
@@ -115,7 +191,7 @@ export const AdminDashboard = () => {
         const response = await axios.post(`${API}/upload/audio-preview`, formData, {
           headers: { 'Content-Type': 'multipart/form-data' }
         });
-        audio_preview_url = `${process.env.REACT_APP_BACKEND_URL}${response.data.url}`;
+        audio_preview_url = response.data.url;
       }
       
       // If it's an album with multiple files
@@ -133,7 +209,7 @@ export const AdminDashboard = () => {
         tracks = response.data.files.map((file, index) => ({
           numero: index + 1,
           titre: trackTitles[index] || file.original_name.replace(/\.[^/.]+$/, ""),
-          audio_url: `${process.env.REACT_APP_BACKEND_URL}${file.url}`
+          audio_url: file.url
         }));
         
         // Use first track as audio_file_url for compatibility
@@ -146,7 +222,7 @@ export const AdminDashboard = () => {
         const response = await axios.post(`${API}/upload/audio-file`, formData, {
           headers: { 'Content-Type': 'multipart/form-data' }
         });
-        audio_file_url = `${process.env.REACT_APP_BACKEND_URL}${response.data.url}`;
+        audio_file_url = response.data.url;
       }
       
       // Create product with uploaded URLs
@@ -199,7 +275,7 @@ export const AdminDashboard = () => {
         const response = await axios.post(`${API}/upload/image`, formData, {
           headers: { 'Content-Type': 'multipart/form-data' }
         });
-        updates.image_url = `${process.env.REACT_APP_BACKEND_URL}${response.data.url}`;
+        updates.image_url = response.data.url;
       }
       
       // Upload new audio preview if file selected
@@ -209,7 +285,7 @@ export const AdminDashboard = () => {
         const response = await axios.post(`${API}/upload/audio-preview`, formData, {
           headers: { 'Content-Type': 'multipart/form-data' }
         });
-        updates.audio_preview_url = `${process.env.REACT_APP_BACKEND_URL}${response.data.url}`;
+        updates.audio_preview_url = response.data.url;
       }
       
       // Upload new audio file if file selected
@@ -219,7 +295,7 @@ export const AdminDashboard = () => {
         const response = await axios.post(`${API}/upload/audio-file`, formData, {
           headers: { 'Content-Type': 'multipart/form-data' }
         });
-        updates.audio_file_url = `${process.env.REACT_APP_BACKEND_URL}${response.data.url}`;
+        updates.audio_file_url = response.data.url;
       }
       
       await axios.put(`${API}/admin/products/${selectedProduct.id}`, updates);
@@ -275,7 +351,7 @@ export const AdminDashboard = () => {
     e.preventDefault();
     try {
       const response = await axios.post(`${API}/admin/send-newsletter`, newsletterForm);
-      toast.success(`Newsletter envoyée à ${response.data.sent} utilisateurs`);
+      toast.success(`Newsletter en cours d'envoi à ${response.data.total} utilisateurs`);
       setNewsletterModal(false);
       setNewsletterForm({ subject: '', message: '', send_to: 'all' });
     } catch (error) {
@@ -392,7 +468,7 @@ export const AdminDashboard = () => {
               <div className="space-y-4" data-testid="products-list">
                 {products.map((product) => (
                   <div key={product.id} className="flex items-center gap-4 p-4 bg-white rounded-xl hover:shadow-md transition-shadow" data-testid={`product-item-${product.id}`}>
-                    <img src={product.image_url} alt={product.titre} className="w-20 h-20 rounded-lg object-cover" />
+                    <img src={mediaUrl(product.image_url)} alt={product.titre} className="w-20 h-20 rounded-lg object-cover" />
                     <div className="flex-1">
                       <h3 className="font-bold text-lg">{product.titre}</h3>
                       <p className="text-gray-600">{product.artiste}</p>
@@ -412,13 +488,53 @@ export const AdminDashboard = () => {
                   </div>
                 ))}
               </div>
+              
+              {productsCursor && (
+                <div className="text-center mt-6">
+                  <Button variant="outline" onClick={() => fetchProducts(productsCursor)} data-testid="load-more-products">
+                    Charger plus
+                  </Button>
+                </div>
+              )}
             </div>
           </TabsContent>
 
           {/* Users Tab */}
           <TabsContent value="users">
             <div className="glass rounded-2xl p-6">
-              <h2 className="text-2xl font-bold mb-6">Gestion des Utilisateurs</h2>
+              <div className="flex flex-wrap justify-between items-center gap-4 mb-6">
+                <h2 className="text-2xl font-bold">Gestion des Utilisateurs</h2>
+                <div className="flex flex-wrap gap-2">
+                  <Select value={userFilters.role} onValueChange={(role) => setUserFilters({ ...userFilters, role })}>
+                    <SelectTrigger className="w-36" data-testid="users-role-filter">
+                      <SelectValue />
+                    </SelectTrigger>
+                    <SelectContent>
+                      <SelectItem value="all">Tous les rôles</SelectItem>
+                      <SelectItem value="user">User</SelectItem>
+                      <SelectItem value="admin">Admin</SelectItem>
+                    </SelectContent>
+                  </Select>
+                  <Select value={userFilters.email_verifie} onValueChange={(email_verifie) => setUserFilters({ ...userFilters, email_verifie })}>
+                    <SelectTrigger className="w-36" data-testid="users-verified-filter">
+                      <SelectValue />
+                    </SelectTrigger>
+                    <SelectContent>
+                      <SelectItem value="all">Tous</SelectItem>
+                      <SelectItem value="true">Vérifiés</SelectItem>
+                      <SelectItem value="false">Non vérifiés</SelectItem>
+                    </SelectContent>
+                  </Select>
+                  <Button variant="outline" onClick={() => handleExport('users', userFilters, 'csv')} data-testid="export-users-csv">
+                    <Download className="w-4 h-4 mr-2" />
+                    CSV
+                  </Button>
+                  <Button variant="outline" onClick={() => handleExport('users', userFilters, 'ndjson')} data-testid="export-users-ndjson">
+                    <Download className="w-4 h-4 mr-2" />
+                    NDJSON
+                  </Button>
+                </div>
+              </div>
               
               <div className="space-y-4" data-testid="users-list">
                 {users.map((u) => (
@@ -452,13 +568,43 @@ export const AdminDashboard = () => {
                   </div>
                 ))}
               </div>
+              
+              {usersCursor && (
+                <div className="text-center mt-6">
+                  <Button variant="outline" onClick={() => fetchUsers(usersCursor)} data-testid="load-more-users">
+                    Charger plus
+                  </Button>
+                </div>
+              )}
             </div>
           </TabsContent>
 
           {/* Orders Tab */}
           <TabsContent value="orders">
             <div className="glass rounded-2xl p-6">
-              <h2 className="text-2xl font-bold mb-6">Toutes les Commandes</h2>
+              <div className="flex flex-wrap justify-between items-center gap-4 mb-6">
+                <h2 className="text-2xl font-bold">Toutes les Commandes</h2>
+                <div className="flex flex-wrap gap-2">
+                  <Select value={orderFilters.payment_status} onValueChange={(payment_status) => setOrderFilters({ ...orderFilters, payment_status })}>
+                    <SelectTrigger className="w-36" data-testid="orders-status-filter">
+                      <SelectValue />
+                    </SelectTrigger>
+                    <SelectContent>
+                      <SelectItem value="all">Toutes</SelectItem>
+                      <SelectItem value="paid">Payées</SelectItem>
+                      <SelectItem value="pending">En attente</SelectItem>
+                    </SelectContent>
+                  </Select>
+                  <Button variant="outline" onClick={() => handleExport('orders', orderFilters, 'csv')} data-testid="export-orders-csv">
+                    <Download className="w-4 h-4 mr-2" />
+                    CSV
+                  </Button>
+                  <Button variant="outline" onClick={() => handleExport('orders', orderFilters, 'ndjson')} data-testid="export-orders-ndjson">
+                    <Download className="w-4 h-4 mr-2" />
+                    NDJSON
+                  </Button>
+                </div>
+              </div>
               
               <div className="space-y-4" data-testid="orders-list">
                 {orders.map((order) => (
@@ -483,6 +629,14 @@ export const AdminDashboard = () => {
                   </div>
                 ))}
               </div>
+              
+              {ordersCursor && (
+                <div className="text-center mt-6">
+                  <Button variant="outline" onClick={() => fetchOrders(ordersCursor)} data-testid="load-more-orders">
+                    Charger plus
+                  </Button>
+                </div>
+              )}
             </div>
           </TabsContent>
         </Tabs>
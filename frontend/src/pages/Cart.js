@@ -5,6 +5,7 @@ import { API, useAuth } from '@/App';
 import { Trash2, ShoppingBag, ArrowRight } from 'lucide-react';
 import { Button } from '@/components/ui/button';
 import { toast } from 'sonner';
+import { mediaUrl } from '@/lib/utils';
 
 export const Cart = () => {
   const { user, fetchCartCount } = useAuth();
@@ -124,7 +125,7 @@ export const Cart = () => {
                 <div key={item.product_id} className="glass rounded-2xl p-6 hover-lift animate-fadeIn" data-testid={`cart-item-${item.product_id}`}>
                   <div className="flex gap-6">
                     <img
-                      src={item.product.image_url}
+                      src={mediaUrl(item.product.image_url)}
                       alt={item.product.titre}
                       className="w-24 h-24 rounded-xl object-cover"
                       data-testid="cart-item-image"
@@ -3,8 +3,9 @@ import axios from 'axios';
 import { API, useAuth } from '@/App';
 import ProductCard from '@/components/ProductCard';
 import { toast } from 'sonner';
-import { Filter } from 'lucide-react';
+import { Filter, Search } from 'lucide-react';
 import { Button } from '@/components/ui/button';
+import { Input } from '@/components/ui/input';
 import {
   Select,
   SelectContent,
@@ -14,37 +15,78 @@ import {
 } from '@/components/ui/select';
 
 export const Catalog = () => {
-  const [products, setProducts] = useState([]);
   const [filteredProducts, setFilteredProducts] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [filterType, setFilterType] = useState('all');
+  const [searchQuery, setSearchQuery] = useState('');
+  const [ownedIds, setOwnedIds] = useState(new Set());
   const { user, fetchCartCount } = useAuth();
 
-  useEffect(() => {
-    fetchProducts();
-  }, []);
+  // One query answers ownership for a whole page of products
+  const fetchOwnership = async (products) => {
+    if (!user || products.length === 0) return;
+    try {
+      const response = await axios.post(`${API}/purchases/ownership`, {
+        product_ids: products.map(product => product.id)
+      });
+      setOwnedIds(prev => new Set([...prev, ...response.data.owned]));
+    } catch (error) {
+      console.error('Error checking purchases:', error);
+    }
+  };
 
   useEffect(() => {
-    if (filterType === 'all') {
-      setFilteredProducts(products);
-    } else {
-      setFilteredProducts(products.filter(p => p.type === filterType));
+    const query = searchQuery.trim();
+    if (query.length < 2) {
+      setLoading(true);
+      fetchProducts();
+      return;
     }
-  }, [filterType, products]);
+    const timeout = setTimeout(() => searchProducts(query), 250);
+    return () => clearTimeout(timeout);
+  }, [filterType, searchQuery]);
 
-  const fetchProducts = async () => {
+  const searchProducts = async (query) => {
     try {
-      const response = await axios.get(`${API}/products`);
-      setProducts(response.data);
+      const params = { q: query };
+      if (filterType !== 'all') params.type = filterType;
+      const response = await axios.get(`${API}/products/search`, { params });
       setFilteredProducts(response.data);
+      fetchOwnership(response.data);
+      setNextCursor(null);
+    } catch (error) {
+      console.error('Error searching products:', error);
+      toast.error('Erreur lors de la recherche');
+    } finally {
+      setLoading(false);
+    }
+  };
+
+  const fetchProducts = async (after = null) => {
+    try {
+      const params = {};
+      if (filterType !== 'all') params.type = filterType;
+      if (after) params.after = after;
+      const response = await axios.get(`${API}/products`, { params });
+      setFilteredProducts(prev => (after ? [...prev, ...response.data] : response.data));
+      setNextCursor(response.headers['x-next-cursor'] || null);
+      fetchOwnership(response.data);
     } catch (error) {
       console.error('Error fetching products:', error);
       toast.error('Erreur lors du chargement des produits');
     } finally {
       setLoading(false);
+      setLoadingMore(false);
     }
   };
 
+  const handleLoadMore = () => {
+    setLoadingMore(true);
+    fetchProducts(nextCursor);
+  };
+
   const handleAddToCart = async (product) => {
     if (!user) {
       toast.error('Veuillez vous connecter pour ajouter au panier');
@@ -89,8 +131,18 @@ export const Catalog = () => {
                 <SelectItem value="single" data-testid="filter-single">Singles</SelectItem>
               </SelectContent>
             </Select>
+            <div className="relative flex-1 max-w-sm">
+              <Search className="absolute left-3 top-1/2 -translate-y-1/2 w-4 h-4 text-gray-400" />
+              <Input
+                value={searchQuery}
+                onChange={(e) => setSearchQuery(e.target.value)}
+                placeholder="Titre, artiste, morceau..."
+                className="pl-9"
+                data-testid="search-input"
+              />
+            </div>
             <span className="text-sm text-gray-500" data-testid="products-count">
-              {filteredProducts.length} produit{filteredProducts.length > 1 ? 's' : ''}
+              {filteredProducts.length}{nextCursor ? '+' : ''} produit{filteredProducts.length > 1 ? 's' : ''}
             </span>
           </div>
         </div>
@@ -108,11 +160,19 @@ export const Catalog = () => {
           <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 gap-8" data-testid="products-grid">
             {filteredProducts.map((product, index) => (
               <div key={product.id} style={{ animationDelay: `${index * 0.05}s` }}>
-                <ProductCard product={product} onAddToCart={handleAddToCart} />
+                <ProductCard product={product} onAddToCart={handleAddToCart} owned={ownedIds.has(product.id)} />
               </div>
             ))}
           </div>
         )}
+
+        {!loading && nextCursor && (
+          <div className="text-center mt-12">
+            <Button onClick={handleLoadMore} disabled={loadingMore} data-testid="load-more-button">
+              {loadingMore ? 'Chargement...' : 'Charger plus'}
+            </Button>
+          </div>
+        )}
       </div>
     </div>
   );
@@ -19,7 +19,7 @@ export const Home = () => {
 
   const fetchProducts = async () => {
     try {
-      const response = await axios.get(`${API}/products`);
+      const response = await axios.get(`${API}/products`, { params: { limit: 3 } });
       setFeaturedProducts(response.data.slice(0, 3));
     } catch (error) {
       console.error('Error fetching products:', error);
@@ -1,7 +1,8 @@
 import React, { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
 import axios from 'axios';
-import { API, useAuth } from '@/App';
+import { toast } from 'sonner';
+import { API, useAuth, downloadPurchase } from '@/App';
 import { User, Package, Download } from 'lucide-react';
 import { Button } from '@/components/ui/button';
 import { Tabs, TabsContent, TabsList, TabsTrigger } from '@/components/ui/tabs';
@@ -39,6 +40,14 @@ export const MyAccount = () => {
 
   if (!user) return null;
 
+  const handleDownload = async (orderId, productId) => {
+    try {
+      await downloadPurchase(orderId, productId);
+    } catch (error) {
+      toast.error(error.response?.data?.detail || 'Erreur lors du téléchargement');
+    }
+  };
+
   return (
     <div className="min-h-screen pt-24 px-4 pb-12" data-testid="account-page">
       <div className="max-w-6xl mx-auto">
@@ -182,15 +191,15 @@ export const MyAccount = () => {
                                 {(item.prix * item.quantite).toFixed(2)} €
                               </p>
                               {order.payment_status === 'paid' && (
-                                <a
-                                  href={item.download_url}
-                                  download
+                                <button
+                                  type="button"
+                                  onClick={() => handleDownload(order.id, item.product_id)}
                                   className="inline-flex items-center text-sm text-purple-600 hover:text-purple-700 mt-1"
                                   data-testid={`download-link-${index}`}
                                 >
                                   <Download className="w-4 h-4 mr-1" />
                                   Télécharger
-                                </a>
+                                </button>
                               )}
                             </div>
                           </div>
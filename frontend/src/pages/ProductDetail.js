@@ -6,6 +6,7 @@ import { Play, Pause, ShoppingCart, ArrowLeft } from 'lucide-react';
 import { Button } from '@/components/ui/button';
 import { Badge } from '@/components/ui/badge';
 import { toast } from 'sonner';
+import { mediaUrl } from '@/lib/utils';
 
 export const ProductDetail = () => {
   const { id } = useParams();
@@ -27,7 +28,7 @@ export const ProductDetail = () => {
     try {
       const response = await axios.get(`${API}/products/${id}`);
       setProduct(response.data);
-      audio.src = response.data.audio_preview_url;
+      audio.src = mediaUrl(response.data.audio_renditions?.preview_url || response.data.audio_preview_url);
     } catch (error) {
       console.error('Error fetching product:', error);
       toast.error('Produit non trouvé');
@@ -96,7 +97,7 @@ export const ProductDetail = () => {
             <div className="glass rounded-3xl overflow-hidden">
               <div className="relative aspect-square">
                 <img
-                  src={product.image_url}
+                  src={mediaUrl(product.image_url)}
                   alt={product.titre}
                   className="w-full h-full object-cover"
                   data-testid="product-detail-image"
@@ -1,7 +1,8 @@
 import React, { useState, useEffect } from 'react';
 import { useNavigate, useSearchParams } from 'react-router-dom';
 import axios from 'axios';
-import { API, useAuth } from '@/App';
+import { toast } from 'sonner';
+import { API, useAuth, downloadPurchase } from '@/App';
 import { CheckCircle, Download, Loader } from 'lucide-react';
 import { Button } from '@/components/ui/button';
 
@@ -12,7 +13,6 @@ export const Success = () => {
   const { user, fetchCartCount } = useAuth();
   const [status, setStatus] = useState('checking'); // checking, success, error
   const [order, setOrder] = useState(null);
-  const [attempts, setAttempts] = useState(0);
   const maxAttempts = 5;
 
   useEffect(() => {
@@ -27,14 +27,16 @@ export const Success = () => {
     }
   }, [sessionId, user]);
 
-  const pollPaymentStatus = async () => {
-    if (attempts >= maxAttempts) {
+  // The attempt count is passed along: a state value read here would be the first render's, forever 0
+  const pollPaymentStatus = async (attempt = 0) => {
+    if (attempt >= maxAttempts) {
       setStatus('error');
       return;
     }
 
     try {
-      const response = await axios.get(`${API}/checkout/status/${sessionId}`);
+      // Long-poll: the server holds the request until the payment is confirmed or `wait` elapses
+      const response = await axios.get(`${API}/checkout/status/${sessionId}`, { params: { wait: 25 } });
       
       if (response.data.payment_status === 'paid') {
         setStatus('success');
@@ -46,13 +48,19 @@ export const Success = () => {
         setStatus('error');
       } else {
         // Continue polling
-        setAttempts(prev => prev + 1);
-        setTimeout(pollPaymentStatus, 2000);
+        pollPaymentStatus(attempt + 1);
       }
     } catch (error) {
       console.error('Error checking payment status:', error);
-      setAttempts(prev => prev + 1);
-      setTimeout(pollPaymentStatus, 2000);
+      setTimeout(() => pollPaymentStatus(attempt + 1), 2000);
+    }
+  };
+
+  const handleDownload = async (orderId, productId) => {
+    try {
+      await downloadPurchase(orderId, productId);
+    } catch (error) {
+      toast.error(error.response?.data?.detail || 'Erreur lors du téléchargement');
     }
   };
 
@@ -120,15 +128,15 @@ export const Success = () => {
                       <p className="font-bold text-purple-600" data-testid={`item-price-${index}`}>
                         {(item.prix * item.quantite).toFixed(2)} €
                       </p>
-                      <a
-                        href={item.download_url}
-                        download
+                      <button
+                        type="button"
+                        onClick={() => handleDownload(order.id, item.product_id)}
                         className="inline-flex items-center text-sm text-purple-600 hover:text-purple-700 mt-2"
                         data-testid={`download-btn-${index}`}
                       >
                         <Download className="w-4 h-4 mr-1" />
                         Télécharger
-                      </a>
+                      </button>
                     </div>
                   </div>
                 ))}
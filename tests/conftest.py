@@ -0,0 +1,87 @@
+"""
+Fixtures partagées par les tests du backend
+
+Dépendances : pip install -r backend/requirements-dev.txt
+
+Par défaut, MongoDB est remplacé par mongomock-motor (en mémoire, un seul fil
+d'exécution). Avec TEST_MONGO_URL=mongodb://localhost:27017, chaque test tourne
+sur une base jetable d'un vrai serveur, ce qui exerce aussi les vraies
+concurrences (tests de panier, file de webhooks).
+"""
+
+import os
+import sys
+import uuid
+from pathlib import Path
+
+import httpx
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+
+import server  # noqa: E402
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.fixture
+async def db(monkeypatch):
+    test_mongo_url = os.getenv("TEST_MONGO_URL")
+    if test_mongo_url:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        mongo = AsyncIOMotorClient(test_mongo_url, tz_aware=True)
+        database = mongo[f"music_store_test_{uuid.uuid4().hex[:8]}"]
+    else:
+        from mongomock_motor import AsyncMongoMockClient
+        mongo = AsyncMongoMockClient(tz_aware=True)
+        database = mongo["music_store"]
+
+    monkeypatch.setattr(server, "db", database)
+    monkeypatch.setattr(server, "user_cache", server.MemoryCache(100, 60))
+    monkeypatch.setattr(server, "catalog_cache", server.MemoryCache(100, 60))
+    await server.ensure_indexes()
+    yield database
+
+    if test_mongo_url:
+        await mongo.drop_database(database.name)
+        mongo.close()
+
+@pytest.fixture
+def upload_dir(tmp_path, monkeypatch):
+    for subdir in server.UPLOAD_MAX_BYTES:
+        (tmp_path / subdir).mkdir()
+    monkeypatch.setattr(server, "UPLOAD_DIR", tmp_path)
+    return tmp_path
+
+@pytest.fixture
+async def api(db):
+    # No lifespan: the webhook worker and the Stripe client are not started
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+        yield http
+
+async def create_user(database, role: str = "user", **fields) -> dict:
+    """Insert a verified user and return it with ready-to-use auth headers"""
+    user = server.User(
+        prenom=fields.pop("prenom", "Test"),
+        nom="Utilisateur",
+        email=fields.pop("email", f"{uuid.uuid4().hex[:8]}@example.com"),
+        adresse="1 rue de Test",
+        email_verifie=True,
+        role=role,
+        **fields
+    )
+    await database.users.insert_one({**user.model_dump(), "mot_de_passe": "x"})
+    token = server.create_access_token(user.id, user.email)
+    return {**user.model_dump(), "headers": {"Authorization": f"Bearer {token}"}}
+
+@pytest.fixture
+async def user(db):
+    return await create_user(db)
+
+@pytest.fixture
+async def admin(db):
+    return await create_user(db, role="admin")
@@ -0,0 +1,96 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+async def insert_orders(db, count: int) -> list:
+    orders = []
+    for index in range(count):
+        item = server.OrderItem(product_id="p1", titre="Single", prix=1.0, quantite=1, download_url="/uploads/a.mp3")
+        # Pairs share a timestamp: the id breaks the tie
+        order = server.Order(
+            user_id=f"u{index}", items=[item], total=float(index), stripe_session_id=f"cs_{index}",
+            payment_status="paid" if index % 3 else "pending", created_at=START + timedelta(minutes=index // 2)
+        )
+        orders.append(order.model_dump())
+    await db.orders.insert_many([dict(order) for order in orders])
+    return orders
+
+async def walk(api, admin, path: str, **params) -> list:
+    documents, after, pages = [], None, 0
+    while True:
+        response = await api.get(path, params={**params, **({"after": after} if after else {})}, headers=admin['headers'])
+        assert response.status_code == 200
+        documents += response.json()
+        pages += 1
+        after = response.headers.get("x-next-cursor")
+        if not after:
+            return documents, pages
+
+async def test_order_pages_cover_every_order_once_newest_first(api, db, admin):
+    orders = await insert_orders(db, 25)
+
+    listed, pages = await walk(api, admin, "/api/admin/orders", limit=4)
+    assert pages == 7
+    expected = sorted(orders, key=lambda order: (order['created_at'], order['id']), reverse=True)
+    assert [order['id'] for order in listed] == [order['id'] for order in expected]
+
+    paid, _ = await walk(api, admin, "/api/admin/orders", limit=4, payment_status="paid", created_from=(START + timedelta(minutes=3)).isoformat())
+    assert {order['id'] for order in paid} == {
+        order['id'] for order in orders if order['payment_status'] == "paid" and order['created_at'] >= START + timedelta(minutes=3)
+    }
+
+async def test_user_pages_never_expose_passwords(api, db, admin):
+    listed, _ = await walk(api, admin, "/api/admin/users", limit=1)
+    assert [user['id'] for user in listed] == [admin['id']]
+    assert "mot_de_passe" not in listed[0]
+
+async def test_invalid_cursor_is_rejected(api, admin):
+    response = await api.get("/api/admin/orders", params={"after": "pas-un-curseur"}, headers=admin['headers'])
+    assert response.status_code == 400
+
+async def test_listings_and_exports_are_admin_only(api, user):
+    for path in ("/api/admin/orders", "/api/admin/users", "/api/admin/orders/export", "/api/admin/users/export"):
+        assert (await api.get(path, headers=user['headers'])).status_code == 403
+
+async def test_csv_export_escapes_formulas_but_not_numbers(api, db, admin, monkeypatch):
+    monkeypatch.setattr(server, "EXPORT_CHUNK_BYTES", 256)
+    orders = await insert_orders(db, 30)
+    await db.orders.update_one({"id": orders[0]['id']}, {"$set": {"total": -5.0, "stripe_session_id": "=HYPERLINK(\"http://evil\")"}})
+
+    response = await api.get("/api/admin/orders/export", headers=admin['headers'])
+    assert response.status_code == 200
+    assert response.headers['content-type'] == "text/csv; charset=utf-8"
+    assert response.headers['content-disposition'].startswith('attachment; filename="commandes-')
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert len(rows) == 30 and list(rows[0]) == server.ORDER_EXPORT_FIELDS
+    refund = next(row for row in rows if row['id'] == orders[0]['id'])
+    assert refund['total'] == "-5.0"
+    assert refund['stripe_session_id'] == "'=HYPERLINK(\"http://evil\")"
+    assert refund['created_at'] == START.isoformat()
+    assert json.loads(refund['items'])[0]['download_url'] == "/uploads/a.mp3"
+
+async def test_ndjson_export_applies_the_listing_filters(api, db, admin):
+    orders = await insert_orders(db, 12)
+
+    response = await api.get("/api/admin/orders/export", params={"format": "ndjson", "payment_status": "pending"}, headers=admin['headers'])
+    assert response.headers['content-type'] == "application/x-ndjson"
+    exported = [json.loads(line) for line in response.text.splitlines()]
+    assert [order['id'] for order in exported] == [
+        order['id'] for order in sorted(orders, key=lambda order: (order['created_at'], order['id']), reverse=True) if order['payment_status'] == "pending"
+    ]
+    assert set(exported[0]) == set(server.ORDER_EXPORT_FIELDS)
+
+async def test_user_export_escapes_formulas_and_leaves_out_passwords(api, db, admin):
+    await db.users.update_one({"id": admin['id']}, {"$set": {"prenom": "+33 Admin"}})
+    users = list(csv.DictReader(io.StringIO((await api.get("/api/admin/users/export", headers=admin['headers'])).text)))
+    assert [(row['email'], row['prenom']) for row in users] == [(admin['email'], "'+33 Admin")]
+    assert "mot_de_passe" not in users[0]
@@ -0,0 +1,114 @@
+import asyncio
+import json
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+BACKEND = "https://api.musicstore.test"
+
+@pytest.fixture
+def renders(monkeypatch, upload_dir):
+    """render_audio replaced by a stand-in writing the same files (no ffmpeg needed), run in a thread"""
+    sources = []
+    def fake_render_audio(source: str, output_dir: str) -> dict:
+        sources.append(Path(source).name)
+        output = Path(output_dir)
+        output.mkdir(parents=True, exist_ok=True)
+        for name in ("preview", *server.AUDIO_RENDITION_BITRATES):
+            (output / f"{name}.mp3").write_bytes(b"mp3")
+        (output / "peaks.json").write_text(json.dumps({"duration": 12.5, "peaks": [0.5]}))
+        return {"duration": 12.5}
+    executor = ThreadPoolExecutor(1)
+    monkeypatch.setattr(server, "media_executor", executor)
+    monkeypatch.setattr(server, "render_audio", fake_render_audio)
+    yield sources
+    executor.shutdown()
+
+async def settle():
+    await asyncio.gather(*server.background_tasks)
+
+def audio_upload(name: str, content: bytes):
+    return ("files", (name, content, "audio/mpeg"))
+
+async def test_single_renditions_are_recorded_on_the_product(api, db, admin, renders):
+    upload = await api.post("/api/upload/audio-file", files={"file": ("single.mp3", b"single", "audio/mpeg")}, headers=admin['headers'])
+    url = upload.json()['url']
+    # Created while the upload is still being processed, with the URL shape the admin UI used to send
+    response = await api.post("/api/products", json={
+        "titre": "Single", "artiste": "Test", "type": "single", "prix": 1.0, "description": "",
+        "image_url": "", "audio_preview_url": "", "audio_file_url": f"{BACKEND}{url}"
+    })
+    await settle()
+
+    sha256 = upload.json()['sha256']
+    product = await db.products.find_one({"id": response.json()['id']})
+    assert product['audio_renditions'] == {
+        "preview_url": f"/uploads/renditions/{sha256[:2]}/{sha256}/preview.mp3",
+        "low_url": f"/uploads/renditions/{sha256[:2]}/{sha256}/low.mp3",
+        "high_url": f"/uploads/renditions/{sha256[:2]}/{sha256}/high.mp3",
+        "peaks_url": f"/uploads/renditions/{sha256[:2]}/{sha256}/peaks.json",
+        "duration": 12.5
+    }
+    # A product created after processing picks the renditions up from db.media
+    response = await api.post("/api/products", json={
+        "titre": "Single 2", "artiste": "Test", "type": "single", "prix": 1.0, "description": "",
+        "image_url": "", "audio_preview_url": "", "audio_file_url": url
+    })
+    assert response.json()['audio_renditions'] == product['audio_renditions']
+
+async def test_only_the_album_track_that_is_recorded_gets_encoded(api, db, admin, upload_dir, renders):
+    upload = await api.post(
+        "/api/upload/multiple-audio-files",
+        files=[audio_upload(f"track{index}.mp3", f"track {index}".encode()) for index in range(3)],
+        headers=admin['headers']
+    )
+    files = upload.json()['files']
+    await settle()
+    assert renders == [Path(files[0]['url']).name]
+
+    tracks = [{"numero": index + 1, "titre": f"Track {index}", "audio_url": file['url']} for index, file in enumerate(files)]
+    response = await api.post("/api/products", json={
+        "titre": "Album", "artiste": "Test", "type": "album", "prix": 9.99, "description": "",
+        "image_url": "", "audio_preview_url": "", "audio_file_url": files[0]['url'], "tracks": tracks
+    })
+    renditions = response.json()['audio_renditions']
+    assert renditions['duration'] == 12.5
+
+    # Every generated file is referenced: the GC leaves the album untouched
+    assert (await server.collect_unreferenced_media(dry_run=True))['orphans'] == []
+
+async def test_renditions_of_a_sold_track_outlive_its_product(api, db, admin, upload_dir, renders, monkeypatch):
+    monkeypatch.setattr(server, "MEDIA_GC_GRACE_HOURS", 0)
+    upload = await api.post("/api/upload/audio-file", files={"file": ("single.mp3", b"sold", "audio/mpeg")}, headers=admin['headers'])
+    url = upload.json()['url']
+    await settle()
+    product = (await api.post("/api/products", json={
+        "titre": "Single", "artiste": "Test", "type": "single", "prix": 1.0, "description": "",
+        "image_url": "", "audio_preview_url": "", "audio_file_url": url
+    })).json()
+    item = server.OrderItem(product_id=product['id'], titre="Single", prix=1.0, quantite=1, download_url=url)
+    await db.orders.insert_one(server.Order(user_id="u1", items=[item], total=1.0, stripe_session_id="cs_1", payment_status="paid").model_dump())
+    await api.delete(f"/api/admin/products/{product['id']}", headers=admin['headers'])
+
+    assert (await server.collect_unreferenced_media(dry_run=True))['orphans'] == []
+    media = await db.media.find_one({"_id": url})
+    assert all((upload_dir / rendition.removeprefix("/uploads/")).is_file() for key, rendition in media['renditions'].items() if key.endswith("_url"))
+
+@pytest.mark.skipif(not shutil.which(server.FFMPEG_BINARY), reason="ffmpeg not installed")
+def test_render_audio_encodes_every_output(tmp_path):
+    source = tmp_path / "tone.wav"
+    subprocess.run([server.FFMPEG_BINARY, "-v", "error", "-f", "lavfi", "-i", "sine=frequency=440:duration=2", str(source)], check=True)
+
+    result = server.render_audio(str(source), str(tmp_path / "out"))
+
+    assert 1.9 <= result['duration'] <= 2.1
+    assert sorted(path.name for path in (tmp_path / "out").iterdir()) == ["high.mp3", "low.mp3", "peaks.json", "preview.mp3"]
+    peaks = json.loads((tmp_path / "out" / "peaks.json").read_text())
+    assert 0 < len(peaks['peaks']) <= server.WAVEFORM_POINTS and max(peaks['peaks']) > 0.5
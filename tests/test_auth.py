@@ -0,0 +1,72 @@
+import asyncio
+import threading
+
+import pytest
+
+import server
+from tests.conftest import create_user
+
+pytestmark = pytest.mark.anyio
+
+async def test_current_user_is_served_from_cache(api, user):
+    response = await api.get("/api/auth/me", headers=user['headers'])
+    assert response.status_code == 200
+    await server.db.users.update_one({"id": user['id']}, {"$set": {"prenom": "Changé"}})
+    # Direct writes bypass invalidation: the cached document is still served
+    assert (await api.get("/api/auth/me", headers=user['headers'])).json()['prenom'] == "Test"
+
+    await server.invalidate_cached_user(user['id'])
+    assert (await api.get("/api/auth/me", headers=user['headers'])).json()['prenom'] == "Changé"
+
+async def test_demotion_during_cache_fill_is_not_masked(api, db, monkeypatch):
+    target = await create_user(db, role="admin")
+    headers = target['headers']
+
+    # The role change lands while the request that fills the cache is reading the user
+    class DemotedDuringRead:
+        def __getattr__(self, name):
+            return getattr(db, name)
+        
+        @property
+        def users(self):
+            return self
+        
+        async def find_one(self, *args, **kwargs):
+            document = await db.users.find_one(*args, **kwargs)
+            await db.users.update_one({"id": target['id']}, {"$set": {"role": "user"}})
+            await server.invalidate_cached_user(target['id'])
+            return document
+    
+    monkeypatch.setattr(server, "db", DemotedDuringRead())
+    assert (await api.get("/api/auth/me", headers=headers)).json()['role'] == "admin"
+    monkeypatch.setattr(server, "db", db)
+
+    assert (await api.get("/api/auth/me", headers=headers)).json()['role'] == "user"
+    assert (await api.get("/api/admin/stats", headers=headers)).status_code == 403
+
+@pytest.mark.parametrize("route", ["login", "register"])
+async def test_saturated_password_pool_sheds_load_with_retry_after(api, db, monkeypatch, route):
+    monkeypatch.setattr(server, "PASSWORD_HASH_MAX_PENDING", 2)
+    release = threading.Event()
+    verify_password, hash_password = server.verify_password, server.hash_password
+    monkeypatch.setattr(server, "verify_password", lambda *args: release.wait(5) and verify_password(*args))
+    monkeypatch.setattr(server, "hash_password", lambda *args: release.wait(5) and hash_password(*args))
+    member = await create_user(db, email="membre@example.com")
+    await db.users.update_one({"id": member['id']}, {"$set": {"mot_de_passe": hash_password("secret123")}})
+    login = {"email": "membre@example.com", "mot_de_passe": "secret123"}
+
+    # Two slow bcrypt jobs fill the queue
+    blocked = [asyncio.create_task(api.post("/api/auth/login", json=login)) for _ in range(2)]
+    while server.password_jobs_pending < 2:
+        await asyncio.sleep(0.01)
+
+    payload = login if route == "login" else {"prenom": "Nouveau", "nom": "Client", "email": "nouveau@example.com", "adresse": "2 rue", "mot_de_passe": "secret123"}
+    response = await api.post(f"/api/auth/{route}", json=payload)
+    assert response.status_code == 503
+    assert response.headers['retry-after'] == "1"
+    assert await db.users.count_documents({"email": "nouveau@example.com"}) == 0
+
+    release.set()
+    assert [(await task).status_code for task in blocked] == [200, 200]
+    assert server.password_jobs_pending == 0
+    assert (await api.post("/api/auth/login", json=login)).status_code == 200
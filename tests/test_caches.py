@@ -0,0 +1,53 @@
+import fakeredis
+import pytest
+import redis.asyncio as aioredis
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture
+def redis_caches(monkeypatch):
+    """Two RedisCache instances on one Redis server, as in two gunicorn workers"""
+    shared = fakeredis.FakeServer()
+    monkeypatch.setattr(aioredis, "from_url", lambda url: fakeredis.FakeAsyncRedis(server=shared))
+    return server.RedisCache("redis://test", "users", 60), server.RedisCache("redis://test", "users", 60)
+
+async def test_redis_cache_is_shared_between_workers(redis_caches):
+    first, second = redis_caches
+    await first.set("u1", {"id": "u1", "role": "admin"})
+    assert await second.get("u1") == {"id": "u1", "role": "admin"}
+
+    await second.delete("u1")
+    assert await first.get("u1") is None
+
+    await first.set("u1", {"id": "u1"})
+    await first.set("u2", {"id": "u2"})
+    assert (await second.info())["size"] == 2
+    await second.clear()
+    assert await first.get("u1") is None and await first.get("u2") is None
+    assert (await first.info())["size"] == 0
+
+async def test_redis_cache_drops_fill_raced_by_invalidation(redis_caches):
+    first, second = redis_caches
+    version = await first.version()
+    await second.delete("u1")  # e.g. a role change handled by the other worker
+    await first.set("u1", {"id": "u1", "role": "admin"}, version=version)
+    assert await second.get("u1") is None
+
+    await first.set("u1", {"id": "u1", "role": "user"}, version=await first.version())
+    assert await second.get("u1") == {"id": "u1", "role": "user"}
+
+async def test_redis_cache_hit_is_one_round_trip(redis_caches):
+    first, _ = redis_caches
+    await first.set("u1", {"id": "u1"})
+
+    commands = []
+    execute_command = first.redis.execute_command
+    async def record(*args, **kwargs):
+        commands.append(args[0])
+        return await execute_command(*args, **kwargs)
+    first.redis.execute_command = record
+
+    assert await first.get("u1") == {"id": "u1"}
+    assert commands == ["GET"]
@@ -0,0 +1,64 @@
+import asyncio
+from collections import Counter
+
+import pytest
+
+import server
+from tests.conftest import create_user
+
+pytestmark = pytest.mark.anyio
+
+CONCURRENT_ADDS = 500
+
+async def insert_products(db, count: int) -> list:
+    products = [
+        server.Product(
+            titre=f"Produit {index}", artiste="Test", type="single", prix=1.0,
+            image_url="", audio_preview_url="", audio_file_url="", description=""
+        ).model_dump()
+        for index in range(count)
+    ]
+    await db.products.insert_many([dict(product) for product in products])
+    return [product['id'] for product in products]
+
+async def test_concurrent_adds_lose_no_items_and_create_one_cart(api, db, user):
+    product_ids = await insert_products(db, 5)
+    adds = [product_ids[index % len(product_ids)] for index in range(CONCURRENT_ADDS)]
+
+    responses = await asyncio.gather(*(
+        api.post("/api/cart/add", json={"product_id": product_id, "quantite": 1}, headers=user['headers'])
+        for product_id in adds
+    ))
+    assert [response.status_code for response in responses] == [200] * CONCURRENT_ADDS
+
+    carts = await db.carts.find({"user_id": user['id']}).to_list(None)
+    assert len(carts) == 1
+    lines = Counter(item['product_id'] for item in carts[0]['items'])
+    assert all(count == 1 for count in lines.values()), "duplicate cart lines"
+    assert {item['product_id']: item['quantite'] for item in carts[0]['items']} == Counter(adds)
+
+async def test_concurrent_first_adds_from_many_users(api, db):
+    product_id, = await insert_products(db, 1)
+    users = [await create_user(db) for _ in range(50)]
+
+    responses = await asyncio.gather(*(
+        api.post("/api/cart/add", json={"product_id": product_id, "quantite": 2}, headers=buyer['headers'])
+        for buyer in users for _ in range(CONCURRENT_ADDS // len(users))
+    ))
+    assert all(response.status_code == 200 for response in responses)
+
+    carts = await db.carts.find({}, {"_id": 0, "user_id": 1, "items": 1}).to_list(None)
+    assert sorted(cart['user_id'] for cart in carts) == sorted(buyer['id'] for buyer in users)
+    assert all(cart['items'] == [{"product_id": product_id, "quantite": 2 * CONCURRENT_ADDS // len(users)}] for cart in carts)
+
+async def test_concurrent_adds_and_removes_keep_the_cart_consistent(api, db, user):
+    kept, removed = await insert_products(db, 2)
+    await api.post("/api/cart/add", json={"product_id": removed}, headers=user['headers'])
+
+    await asyncio.gather(
+        *(api.post("/api/cart/add", json={"product_id": kept}, headers=user['headers']) for _ in range(100)),
+        api.delete(f"/api/cart/remove/{removed}", headers=user['headers'])
+    )
+
+    cart = await db.carts.find_one({"user_id": user['id']})
+    assert cart['items'] == [{"product_id": kept, "quantite": 100}]
@@ -0,0 +1,83 @@
+import io
+import zipfile
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+def store(upload_dir, relative_path: str, content: bytes) -> str:
+    path = upload_dir / relative_path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    return f"/uploads/{relative_path}"
+
+async def insert_paid_album_order(db, upload_dir, buyer: dict) -> dict:
+    tracks = [
+        {"titre": "Ouverture", "audio_url": store(upload_dir, "audio_files/aa/track1.mp3", b"un")},
+        {"titre": "Final", "audio_url": store(upload_dir, "audio_files/bb/track2.mp3", b"deux")},
+    ]
+    album = server.Product(
+        titre="Album", artiste="Test", type="album", prix=9.99, image_url="", audio_preview_url="",
+        audio_file_url=store(upload_dir, "audio_files/cc/album.mp3", b"album"), description="",
+        tracks=[{"numero": index, **track} for index, track in enumerate(tracks, start=1)]
+    ).model_dump()
+    await db.products.insert_one(dict(album))
+    item = server.OrderItem(
+        product_id=album['id'], titre="Album", prix=9.99, quantite=1,
+        download_url=album['audio_file_url'], tracks=tracks
+    )
+    order = server.Order(user_id=buyer['id'], items=[item], total=9.99, stripe_session_id="cs_1", payment_status="paid")
+    await db.orders.insert_one(order.model_dump())
+    return {"order": order.model_dump(), "product": album}
+
+async def download_archive(api, buyer: dict, order_id: str, product_id: str) -> zipfile.ZipFile:
+    link = await api.get(f"/api/orders/{order_id}/download/{product_id}", headers=buyer['headers'])
+    assert link.status_code == 200
+    response = await api.get(link.json()['url'])
+    assert response.status_code == 200
+    return zipfile.ZipFile(io.BytesIO(response.content))
+
+@pytest.mark.parametrize("change", ["edited", "deleted"])
+async def test_album_download_contains_the_tracks_sold(api, db, user, upload_dir, change):
+    sale = await insert_paid_album_order(db, upload_dir, user)
+    product_id = sale['product']['id']
+    if change == "edited":
+        remaster = store(upload_dir, "audio_files/dd/remaster.mp3", b"remaster")
+        await db.products.update_one({"id": product_id}, {"$set": {"tracks": [{"numero": 1, "titre": "Remaster", "audio_url": remaster}]}})
+    else:
+        await db.products.delete_one({"id": product_id})
+
+    archive = await download_archive(api, user, sale['order']['id'], product_id)
+    assert [(name, archive.read(name)) for name in archive.namelist()] == [("01 - Ouverture.mp3", b"un"), ("02 - Final.mp3", b"deux")]
+
+async def test_single_download_is_the_file_sold(api, db, user, upload_dir):
+    url = store(upload_dir, "audio_files/ee/single.mp3", b"single")
+    item = server.OrderItem(product_id="p1", titre="Single", prix=1.0, quantite=1, download_url=url)
+    order = server.Order(user_id=user['id'], items=[item], total=1.0, stripe_session_id="cs_2", payment_status="paid")
+    await db.orders.insert_one(order.model_dump())
+
+    link = await api.get(f"/api/orders/{order.id}/download/p1", headers=user['headers'])
+    response = await api.get(link.json()['url'])
+    assert response.content == b"single"
+
+async def test_orders_stored_with_absolute_urls_get_a_signed_link(api, db, user, upload_dir):
+    # Shape the admin UI used to store: REACT_APP_BACKEND_URL + upload path
+    url = store(upload_dir, "audio_files/ff/single.mp3", b"single")
+    item = {"product_id": "p1", "titre": "Single", "prix": 1.0, "quantite": 1, "download_url": f"https://api.musicstore.test{url}"}
+    await db.orders.insert_one({"id": "o1", "user_id": user['id'], "items": [item], "total": 1.0, "payment_status": "paid"})
+
+    link = await api.get("/api/orders/o1/download/p1", headers=user['headers'])
+    assert link.json()['url'].startswith("/api/downloads/")
+    assert (await api.get(link.json()['url'])).content == b"single"
+    # The raw upload path is not public
+    assert (await api.get(url)).status_code == 404
+
+async def test_external_files_are_linked_as_they_are(api, db, user):
+    item = server.OrderItem(product_id="p1", titre="Seed", prix=1.0, quantite=1, download_url="https://cdn.example.com/seed.mp3")
+    order = server.Order(user_id=user['id'], items=[item], total=1.0, stripe_session_id="cs_3", payment_status="paid")
+    await db.orders.insert_one(order.model_dump())
+
+    link = await api.get(f"/api/orders/{order.id}/download/p1", headers=user['headers'])
+    assert link.json() == {"url": "https://cdn.example.com/seed.mp3", "expires_at": None}
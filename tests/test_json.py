@@ -0,0 +1,19 @@
+from datetime import datetime, timezone
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+async def test_stored_dates_are_rendered_with_their_utc_offset(api, db, user):
+    created_at = datetime(2024, 3, 1, 12, 30, tzinfo=timezone.utc)
+    item = server.OrderItem(product_id="p1", titre="Single", prix=1.0, quantite=1, download_url="/uploads/a.mp3")
+    order = server.Order(user_id=user['id'], items=[item], total=1.0, stripe_session_id="cs_1", payment_status="paid", created_at=created_at)
+    await db.orders.insert_one(order.model_dump())
+
+    response = await api.get("/api/orders", headers=user['headers'])
+    assert response.json()[0]['created_at'] == "2024-03-01T12:30:00+00:00"
+
+def test_legacy_iso_strings_parse_to_aware_datetimes():
+    assert server.parse_datetime("2024-03-01T12:30:00+00:00") == datetime(2024, 3, 1, 12, 30, tzinfo=timezone.utc)
@@ -0,0 +1,194 @@
+import asyncio
+import io
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+class FakeCheckout:
+    async def create_checkout_session(self, checkout_request):
+        return server.CheckoutSessionResponse(url="https://checkout.stripe.test/cs_1", session_id="cs_1")
+
+def store(upload_dir, relative_path: str, content: bytes = b"audio", age_hours: float = 48) -> str:
+    path = upload_dir / relative_path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    old = time.time() - age_hours * 3600
+    os.utime(path, (old, old))
+    return f"/uploads/{relative_path}"
+
+async def insert_album(db, upload_dir) -> dict:
+    album = server.Product(
+        titre="Album", artiste="Test", type="album", prix=9.99,
+        image_url="", audio_preview_url="", audio_file_url=store(upload_dir, "audio_files/aa/album.zip"), description="",
+        tracks=[
+            {"numero": 1, "titre": "Ouverture", "audio_url": store(upload_dir, "audio_files/bb/track1.mp3")},
+            {"numero": 2, "titre": "Final", "audio_url": store(upload_dir, "audio_files/cc/track2.mp3")},
+        ]
+    ).model_dump()
+    await db.products.insert_one(dict(album))
+    return album
+
+@pytest.fixture
+def checkout(monkeypatch):
+    monkeypatch.setattr(server.payments, "checkout", lambda webhook_url=None: FakeCheckout())
+
+async def test_sold_album_tracks_survive_product_deletion(api, db, user, admin, upload_dir, checkout):
+    album = await insert_album(db, upload_dir)
+    await api.post("/api/cart/add", json={"product_id": album['id']}, headers=user['headers'])
+    response = await api.post("/api/checkout/create-session", json={"origin_url": "http://test"}, headers=user['headers'])
+    assert response.status_code == 200
+
+    order = await db.orders.find_one({"user_id": user['id']})
+    assert order['items'][0]['tracks'] == [
+        {"titre": "Ouverture", "audio_url": "/uploads/audio_files/bb/track1.mp3"},
+        {"titre": "Final", "audio_url": "/uploads/audio_files/cc/track2.mp3"},
+    ]
+
+    await db.media.insert_many([{"_id": track['audio_url'], "ref_count": 1} for track in album['tracks']])
+    assert (await api.delete(f"/api/admin/products/{album['id']}", headers=admin['headers'])).status_code == 200
+    assert [media['ref_count'] for media in await db.media.find({}).sort("_id").to_list(None)] == [1, 1]
+
+    result = await server.collect_unreferenced_media(dry_run=False)
+    assert result['orphans'] == []
+    assert all((upload_dir / track['audio_url'].removeprefix("/uploads/")).is_file() for track in album['tracks'])
+
+async def test_legacy_orders_get_their_tracks_snapshotted(db, upload_dir):
+    album = await insert_album(db, upload_dir)
+    item = {"product_id": album['id'], "titre": "Album", "prix": 9.99, "quantite": 1, "download_url": album['audio_file_url']}
+    await db.orders.insert_one({"id": "o1", "user_id": "u1", "items": [item], "total": 9.99, "payment_status": "paid"})
+
+    assert await server.backfill_order_tracks() == 1
+    assert await server.backfill_order_tracks() == 0
+
+    order = await db.orders.find_one({"id": "o1"})
+    assert [track['titre'] for track in order['items'][0]['tracks']] == ["Ouverture", "Final"]
+
+async def test_unreferenced_files_are_collected_after_the_grace_period(db, upload_dir):
+    orphan = store(upload_dir, "audio_files/dd/orphan.mp3")
+    fresh = store(upload_dir, "audio_files/ee/fresh.mp3", age_hours=0)
+
+    result = await server.collect_unreferenced_media(dry_run=False)
+    assert result['orphans'] == [orphan]
+    assert (upload_dir / fresh.removeprefix("/uploads/")).is_file()
+
+async def test_reuploading_existing_content_restarts_the_grace_period(db, upload_dir):
+    saved = server.write_upload(io.BytesIO(b"same audio"), "audio_files", "mp3", 1024)
+    path = upload_dir / saved['url'].removeprefix("/uploads/")
+    old = time.time() - 48 * 3600
+    os.utime(path, (old, old))
+
+    again = server.write_upload(io.BytesIO(b"same audio"), "audio_files", "mp3", 1024)
+    assert again['deduplicated'] and again['url'] == saved['url']
+    assert path.stat().st_mtime > old + 3600
+
+    # Not yet attached to a product: kept until the grace period runs out again
+    assert (await server.collect_unreferenced_media(dry_run=False))['orphans'] == []
+
+async def test_image_backfill_counts_every_product_sharing_a_cover(db, upload_dir, monkeypatch):
+    processed = []
+    async def process_image_upload(url, sha256):
+        processed.append(url)
+    monkeypatch.setattr(server, "process_image_upload", process_image_upload)
+    cover = store(upload_dir, "images/ff/cover.png", b"png")
+    for titre in ("Face A", "Face B"):
+        product = server.Product(
+            titre=titre, artiste="Test", type="single", prix=1.0, image_url=cover,
+            audio_preview_url="", audio_file_url="", description=""
+        ).model_dump()
+        await db.products.insert_one(dict(product))
+
+    assert await server.backfill_image_srcsets() == {"processed": 2, "skipped": 0}
+    media = await db.media.find_one({"_id": cover})
+    assert media['ref_count'] == 2
+    assert media['sha256'] == server.hashlib.sha256(b"png").hexdigest()
+    assert processed == [cover, cover]
+
+BACKEND = "https://api.musicstore.test"
+
+async def test_absolute_urls_from_the_admin_ui_are_stored_as_upload_paths(api, db, user, upload_dir, checkout):
+    # The admin UI used to send REACT_APP_BACKEND_URL + the upload path
+    cover = store(upload_dir, "images/aa/cover.png", b"png")
+    audio = store(upload_dir, "audio_files/bb/single.mp3")
+    response = await api.post("/api/products", json={
+        "titre": "Single", "artiste": "Test", "type": "single", "prix": 1.0, "description": "",
+        "image_url": f"{BACKEND}{cover}", "audio_preview_url": "https://cdn.example.com/preview.mp3", "audio_file_url": f"{BACKEND}{audio}"
+    })
+    product = await db.products.find_one({"id": response.json()['id']})
+    assert (product['image_url'], product['audio_file_url']) == (cover, audio)
+    assert product['audio_preview_url'] == "https://cdn.example.com/preview.mp3"
+
+    await api.post("/api/cart/add", json={"product_id": product['id']}, headers=user['headers'])
+    await api.post("/api/checkout/create-session", json={"origin_url": "http://test"}, headers=user['headers'])
+    assert (await db.orders.find_one({"user_id": user['id']}))['items'][0]['download_url'] == audio
+
+    result = await server.collect_unreferenced_media(dry_run=False)
+    assert result['orphans'] == []
+    assert (upload_dir / audio.removeprefix("/uploads/")).is_file()
+
+async def test_stored_absolute_urls_are_normalized_at_startup(db, upload_dir):
+    cover = store(upload_dir, "images/cc/cover.png", b"png")
+    track = store(upload_dir, "audio_files/dd/track1.mp3")
+    await db.products.insert_one({
+        "id": "p1", "titre": "Album", "artiste": "Test", "type": "album", "prix": 9.99, "description": "",
+        "image_url": f"{BACKEND}{cover}", "audio_preview_url": "", "audio_file_url": f"{BACKEND}{track}",
+        "tracks": [{"numero": 1, "titre": "Ouverture", "audio_url": f"{BACKEND}{track}"}]
+    })
+    item = {"product_id": "p1", "titre": "Album", "prix": 9.99, "quantite": 1, "download_url": f"{BACKEND}{track}"}
+    await db.orders.insert_one({"id": "o1", "user_id": "u1", "items": [item], "total": 9.99, "payment_status": "paid"})
+    await db.media.insert_many([{"_id": cover, "ref_count": 0}, {"_id": track, "ref_count": 0}])
+
+    assert await server.normalize_media_urls() == {"products": 1, "orders": 1}
+    assert await server.normalize_media_urls() == {"products": 0, "orders": 0}
+
+    product = await db.products.find_one({"id": "p1"})
+    assert (product['image_url'], product['tracks'][0]['audio_url']) == (cover, track)
+    order = await db.orders.find_one({"id": "o1"})
+    assert order['items'][0]['download_url'] == track and 'tracks' not in order['items'][0]
+    assert {media['_id']: media['ref_count'] for media in await db.media.find({}).to_list(None)} == {cover: 1, track: 2}
+    assert (await server.collect_unreferenced_media(dry_run=True))['orphans'] == []
+
+def png(width: int = 800, height: int = 600) -> bytes:
+    buffer = io.BytesIO()
+    server.Image.new("RGB", (width, height), (200, 40, 90)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+@pytest.fixture
+def image_worker(monkeypatch):
+    # render_image for real, in a thread instead of the spawned process pool
+    executor = ThreadPoolExecutor(1)
+    monkeypatch.setattr(server, "media_executor", executor)
+    yield
+    executor.shutdown()
+
+async def test_cover_uploaded_from_the_admin_ui_gets_its_srcset(api, db, admin, upload_dir, image_worker):
+    upload = (await api.post("/api/upload/image", files={"file": ("cover.png", png(), "image/png")}, headers=admin['headers'])).json()
+    response = await api.post("/api/products", json={
+        "titre": "Single", "artiste": "Test", "type": "single", "prix": 1.0, "description": "",
+        "image_url": f"{BACKEND}{upload['url']}", "audio_preview_url": "", "audio_file_url": ""
+    })
+    await asyncio.gather(*server.background_tasks)
+
+    product = await db.products.find_one({"id": response.json()['id']})
+    base = f"/uploads/derivatives/{upload['sha256'][:2]}/{upload['sha256']}"
+    assert product['image_srcset']['image/webp'] == f"{base}/320.webp 320w, {base}/640.webp 640w, {base}/800.webp 800w"
+    assert (upload_dir / base.removeprefix("/uploads/") / "640.webp").is_file()
+    assert (await server.collect_unreferenced_media(dry_run=True))['orphans'] == []
+
+async def test_image_backfill_finds_covers_stored_with_absolute_urls(db, upload_dir, image_worker):
+    cover = store(upload_dir, "images/dd/cover.png", png(400, 400))
+    await db.products.insert_one({
+        "id": "p1", "titre": "Single", "artiste": "Test", "type": "single", "prix": 1.0, "description": "",
+        "image_url": f"{BACKEND}{cover}", "audio_preview_url": "", "audio_file_url": "", "image_srcset": None
+    })
+
+    await server.normalize_media_urls()
+    assert await server.backfill_image_srcsets() == {"processed": 1, "skipped": 0}
+    product = await db.products.find_one({"id": "p1"})
+    assert product['image_url'] == cover
+    assert set(product['image_srcset']) == {mime for ext, (_, mime, _) in server.IMAGE_FORMATS.items() if server.features.check(ext)}
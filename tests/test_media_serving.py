@@ -0,0 +1,82 @@
+import hashlib
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+CONTENT = b"0123456789"
+
+@pytest.fixture
+def cover(upload_dir) -> dict:
+    sha256 = hashlib.sha256(CONTENT).hexdigest()
+    path = upload_dir / "images" / sha256[:2] / f"{sha256}.png"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(CONTENT)
+    return {"url": f"/uploads/images/{sha256[:2]}/{sha256}.png", "etag": f'"{sha256}"'}
+
+async def test_whole_file_is_served_with_validators(api, cover):
+    response = await api.get(cover['url'])
+    assert response.status_code == 200 and response.content == CONTENT
+    assert response.headers['etag'] == cover['etag']
+    assert response.headers['accept-ranges'] == "bytes"
+    assert response.headers['cache-control'] == "public, max-age=31536000, immutable"
+    assert response.headers['content-type'] == "image/png"
+
+    head = await api.head(cover['url'])
+    assert head.status_code == 200 and head.content == b"" and head.headers['content-length'] == "10"
+
+@pytest.mark.parametrize("byte_range, content_range, body", [
+    ("bytes=2-5", "bytes 2-5/10", b"2345"),
+    ("bytes=7-", "bytes 7-9/10", b"789"),
+    ("bytes=-3", "bytes 7-9/10", b"789"),
+    ("bytes=8-100", "bytes 8-9/10", b"89"),
+    ("bytes=-100", "bytes 0-9/10", CONTENT),
+])
+async def test_range_is_served_as_partial_content(api, cover, byte_range, content_range, body):
+    response = await api.get(cover['url'], headers={"Range": byte_range})
+    assert response.status_code == 206
+    assert response.headers['content-range'] == content_range
+    assert response.headers['content-length'] == str(len(body))
+    assert response.content == body
+
+@pytest.mark.parametrize("byte_range", ["bytes=10-", "bytes=10-20", "bytes=-0"])
+async def test_unsatisfiable_range_is_refused(api, cover, byte_range):
+    response = await api.get(cover['url'], headers={"Range": byte_range})
+    assert response.status_code == 416
+    assert response.headers['content-range'] == "bytes */10"
+
+@pytest.mark.parametrize("byte_range", ["bytes=5-3", "bytes=x-", "bytes=-", "bytes=0-1,4-5", "items=0-1"])
+async def test_invalid_or_unsupported_range_serves_the_whole_file(api, cover, byte_range):
+    response = await api.get(cover['url'], headers={"Range": byte_range})
+    assert response.status_code == 200 and response.content == CONTENT
+
+@pytest.mark.parametrize("if_none_match", ["{etag}", "W/{etag}", '"other", {etag}', "*"])
+async def test_matching_if_none_match_is_not_modified(api, cover, if_none_match):
+    response = await api.get(cover['url'], headers={"If-None-Match": if_none_match.format(etag=cover['etag'])})
+    assert response.status_code == 304 and response.content == b""
+    assert response.headers['etag'] == cover['etag']
+
+async def test_stale_if_none_match_serves_the_file(api, cover):
+    response = await api.get(cover['url'], headers={"If-None-Match": '"other"'})
+    assert response.status_code == 200 and response.content == CONTENT
+
+async def test_if_range_only_resumes_the_same_file(api, cover):
+    resumed = await api.get(cover['url'], headers={"Range": "bytes=4-", "If-Range": cover['etag']})
+    assert resumed.status_code == 206 and resumed.content == b"456789"
+
+    changed = await api.get(cover['url'], headers={"Range": "bytes=4-", "If-Range": '"previous"'})
+    assert changed.status_code == 200 and changed.content == CONTENT
+
+async def test_mutable_files_get_a_stat_etag_and_short_cache(api, upload_dir):
+    (upload_dir / "images" / "legacy.png").write_bytes(CONTENT)
+    response = await api.get("/uploads/images/legacy.png")
+    assert response.status_code == 200
+    assert response.headers['cache-control'] == "public, max-age=3600"
+    assert (await api.get("/uploads/images/legacy.png", headers={"If-None-Match": response.headers['etag']})).status_code == 304
+
+@pytest.mark.parametrize("path", ["/uploads/audio_files/master.mp3", "/uploads/%2e%2e/secret.txt", "/uploads/images/.hidden.png", "/uploads/images/missing.png"])
+async def test_private_or_missing_files_are_not_found(api, upload_dir, path):
+    (upload_dir / "audio_files" / "master.mp3").write_bytes(CONTENT)
+    (upload_dir / "images" / ".hidden.png").write_bytes(CONTENT)
+    (upload_dir.parent / "secret.txt").write_bytes(CONTENT)
+    assert (await api.get(path)).status_code == 404
@@ -0,0 +1,45 @@
+from datetime import datetime, timezone
+
+import pytest
+
+import migrate_dates
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture
+def migration_db(db, monkeypatch):
+    monkeypatch.setattr(migrate_dates, "db", db)
+    return db
+
+async def test_string_dates_become_utc_datetimes(migration_db):
+    already = datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc)
+    await migration_db.orders.insert_many([
+        {"id": "offset", "created_at": "2024-01-02T03:04:05.123456+02:00"},
+        {"id": "utc", "created_at": "2024-01-02T03:04:05+00:00"},
+        {"id": "naive", "created_at": "2024-01-02T03:04:05"},
+        {"id": "already", "created_at": already},
+        {"id": "garbage", "created_at": "hier"},
+    ])
+
+    assert await migrate_dates.migrate_collection("orders", ["created_at"], batch_size=2) == {"converted": 3, "invalid": 1}
+    dates = {order['id']: order['created_at'] async for order in migration_db.orders.find({})}
+    assert dates == {
+        "offset": datetime(2024, 1, 2, 1, 4, 5, 123000, tzinfo=timezone.utc),  # BSON dates keep milliseconds
+        "utc": datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc),
+        "naive": datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc),
+        "already": already,
+        "garbage": "hier",
+    }
+
+    # Resumable: a second run only finds the unreadable date again
+    assert await migrate_dates.migrate_collection("orders", ["created_at"], batch_size=2) == {"converted": 0, "invalid": 1}
+
+async def test_every_date_field_of_a_collection_is_converted(migration_db):
+    # In the future: the TTL index would drop an expired token
+    await migration_db.email_verifications.insert_one({"token": "t1", "expires_at": "2099-01-03T00:00:00+00:00"})
+    await migration_db.users.insert_one({"id": "u1", "created_at": datetime(2024, 1, 1, tzinfo=timezone.utc)})
+
+    assert await migrate_dates.migrate_collection("email_verifications", ["expires_at"], batch_size=10) == {"converted": 1, "invalid": 0}
+    assert await migrate_dates.migrate_collection("users", ["created_at"], batch_size=10) == {"converted": 0, "invalid": 0}
+    verification = await migration_db.email_verifications.find_one({"token": "t1"})
+    assert verification['expires_at'] == datetime(2099, 1, 3, tzinfo=timezone.utc)
@@ -0,0 +1,146 @@
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+class FakeSendGrid:
+    """Records /v3/mail/send calls; `responses` maps a recipient email to the statuses to answer in turn"""
+    def __init__(self):
+        self.requests = []
+        self.responses = {}
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        assert request.url.path == "/v3/mail/send"
+        assert request.headers["authorization"] == "Bearer SG.test"
+        payload = json.loads(request.content)
+        emails = [personalization['to'][0]['email'] for personalization in payload['personalizations']]
+        self.requests.append(emails)
+        for email in emails:
+            if self.responses.get(email):
+                status = self.responses[email].pop(0)
+                if status == "disconnect":
+                    raise httpx.ConnectError("connection reset", request=request)
+                return httpx.Response(status, json={"errors": [{"message": "test"}]})
+        return httpx.Response(202)
+
+    @property
+    def delivered(self) -> list:
+        return [email for emails in self.requests for email in emails]
+
+@pytest.fixture
+def sendgrid(monkeypatch):
+    fake = FakeSendGrid()
+    client_class = httpx.AsyncClient
+    monkeypatch.setattr(server.httpx, "AsyncClient", lambda **kwargs: client_class(transport=httpx.MockTransport(fake.handle), **kwargs))
+    monkeypatch.setattr(server, "SENDGRID_API_KEY", "SG.test")
+    monkeypatch.setattr(server, "NEWSLETTER_BATCH_SIZE", 100)
+    monkeypatch.setattr(server, "NEWSLETTER_CONCURRENCY", 4)
+    monkeypatch.setattr(server, "NEWSLETTER_REQUESTS_PER_SECOND", 10000)
+    # Retry backoff without the wait
+    sleep = asyncio.sleep
+    monkeypatch.setattr(server.asyncio, "sleep", lambda delay, *args: sleep(0))
+    return fake
+
+async def insert_members(db, count: int, verified_every: int = 1) -> list:
+    users = [
+        {"id": f"user-{index:05d}", "email": f"membre{index}@example.com", "prenom": f"Membre{index}", "email_verifie": index % verified_every == 0}
+        for index in range(count)
+    ]
+    await db.users.insert_many([dict(user) for user in users])
+    return users
+
+async def insert_job(db, **fields) -> str:
+    job = {
+        "id": "job-1", "subject": "Nouveautés", "message": "<p>Bonjour</p>", "send_to": "all",
+        "status": "queued", "total": 0, "sent": 0, "failed": 0, "last_recipient_id": "",
+        "lease_until": datetime.now(timezone.utc), "created_at": datetime.now(timezone.utc),
+        "finished_at": None, "error": None, **fields
+    }
+    await db.newsletter_jobs.insert_one(job)
+    return job['id']
+
+async def test_recipients_are_sent_in_batches_exactly_once(db, sendgrid):
+    users = await insert_members(db, 1250, verified_every=2)
+    job_id = await insert_job(db, send_to="verified")
+
+    await server.run_newsletter_job(job_id)
+
+    verified = [user['email'] for user in users if user['email_verifie']]
+    assert sorted(sendgrid.delivered) == sorted(verified)
+    assert [len(emails) for emails in sendgrid.requests] == [100] * 6 + [25]
+    job = await db.newsletter_jobs.find_one({"id": job_id})
+    assert (job['status'], job['sent'], job['failed']) == ("completed", 625, 0)
+    assert job['last_recipient_id'] == max(user['id'] for user in users if user['email_verifie'])
+
+async def test_transient_errors_are_retried_and_rejected_batches_counted(db, sendgrid):
+    await insert_members(db, 450)
+    sendgrid.responses = {
+        "membre0@example.com": [503, 429],        # retried, then accepted
+        "membre150@example.com": ["disconnect"],  # retried, then accepted
+        "membre250@example.com": [400],           # rejected: not retried
+    }
+    job_id = await insert_job(db)
+
+    await server.run_newsletter_job(job_id)
+
+    job = await db.newsletter_jobs.find_one({"id": job_id})
+    assert (job['status'], job['sent'], job['failed']) == ("completed", 350, 100)
+    assert len(sendgrid.requests) == 5 + 3
+    assert sum("membre250@example.com" in emails for emails in sendgrid.requests) == 1
+
+async def test_batches_that_exhaust_retries_are_counted_as_failed(db, sendgrid):
+    await insert_members(db, 150)
+    sendgrid.responses = {"membre120@example.com": [500] * server.NEWSLETTER_MAX_RETRIES}
+    job_id = await insert_job(db)
+
+    await server.run_newsletter_job(job_id)
+
+    job = await db.newsletter_jobs.find_one({"id": job_id})
+    assert (job['status'], job['sent'], job['failed']) == ("completed", 100, 50)
+    assert len(sendgrid.requests) == 1 + server.NEWSLETTER_MAX_RETRIES
+
+async def test_interrupted_job_resumes_after_last_checkpoint(db, sendgrid):
+    users = await insert_members(db, 500)
+    # A worker died after checkpointing the first 300 recipients; its lease has expired
+    job_id = await insert_job(
+        db, status="running", sent=300, last_recipient_id=users[299]['id'],
+        lease_until=datetime.now(timezone.utc) - timedelta(seconds=1)
+    )
+
+    await server.run_newsletter_job(job_id)
+
+    assert sorted(sendgrid.delivered) == sorted(user['email'] for user in users[300:])
+    job = await db.newsletter_jobs.find_one({"id": job_id})
+    assert (job['status'], job['sent'], job['failed']) == ("completed", 500, 0)
+
+async def test_job_leased_by_another_worker_is_left_alone(db, sendgrid):
+    await insert_members(db, 10)
+    job_id = await insert_job(db, status="running", lease_until=datetime.now(timezone.utc) + timedelta(seconds=60))
+
+    await server.run_newsletter_job(job_id)
+
+    assert sendgrid.requests == []
+    assert (await db.newsletter_jobs.find_one({"id": job_id}))['status'] == "running"
+
+async def test_unexpected_error_marks_the_job_failed_at_its_checkpoint(db, sendgrid, monkeypatch):
+    users = await insert_members(db, 900)
+    handle = sendgrid.handle
+    def crash_on_sixth_request(request):
+        if len(sendgrid.requests) == 5:
+            raise RuntimeError("bug")
+        return handle(request)
+    monkeypatch.setattr(sendgrid, "handle", crash_on_sixth_request)
+    job_id = await insert_job(db)
+
+    await server.run_newsletter_job(job_id)
+
+    job = await db.newsletter_jobs.find_one({"id": job_id})
+    assert job['status'] == "failed" and "bug" in job['error']
+    # The first wave of four batches was checkpointed before the crash
+    assert (job['sent'], job['last_recipient_id']) == (400, users[399]['id'])
@@ -0,0 +1,251 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+import stripe as stripe_sdk
+from fastapi import HTTPException
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+class FakeStripe:
+    """Checkout API double: each call pops the next behaviour ("ok", "error", an exception to raise or a
+    delay in seconds), then succeeds"""
+    def __init__(self):
+        self.calls = 0
+        self.behaviours = []
+
+    async def respond(self):
+        self.calls += 1
+        behaviour = self.behaviours.pop(0) if self.behaviours else "ok"
+        if behaviour == "error":
+            raise ConnectionError("stripe unreachable")
+        if isinstance(behaviour, Exception):
+            raise behaviour
+        if isinstance(behaviour, float):
+            await asyncio.sleep(behaviour)
+
+    async def create_checkout_session(self, checkout_request=None):
+        await self.respond()
+        return server.CheckoutSessionResponse(url=f"https://checkout.stripe.test/cs_{self.calls}", session_id=f"cs_{self.calls}")
+
+    async def get_checkout_status(self, session_id):
+        await self.respond()
+        return server.CheckoutStatusResponse(status="complete", payment_status="paid")
+
+@pytest.fixture
+def stripe(monkeypatch):
+    monkeypatch.setattr(server, "STRIPE_TIMEOUT_SECONDS", 0.05)
+    monkeypatch.setattr(server, "STRIPE_BREAKER_COOLDOWN_SECONDS", 0.1)
+    return FakeStripe()
+
+async def call(payments: server.PaymentClient, stripe: FakeStripe):
+    return await payments.call("create_checkout_session", stripe.create_checkout_session())
+
+async def open_circuit(payments: server.PaymentClient, stripe: FakeStripe):
+    stripe.behaviours = ["error"] * server.STRIPE_BREAKER_THRESHOLD
+    for _ in range(server.STRIPE_BREAKER_THRESHOLD):
+        with pytest.raises(HTTPException):
+            await call(payments, stripe)
+
+async def test_slow_call_times_out_and_counts_as_a_failure(stripe):
+    payments = server.PaymentClient()
+    stripe.behaviours = [1.0]
+
+    with pytest.raises(HTTPException) as error:
+        await call(payments, stripe)
+    assert error.value.status_code == 502
+    assert payments.failures == 1
+    assert payments.stats()['latency_seconds']['create_checkout_session']['count'] == 1
+
+    # Below the threshold the circuit stays closed and a success resets the count
+    assert (await call(payments, stripe)).session_id == "cs_2"
+    assert payments.failures == 0
+
+async def test_open_circuit_fails_fast_without_calling_stripe(stripe):
+    payments = server.PaymentClient()
+    await open_circuit(payments, stripe)
+    assert payments.stats()['circuit'] == "open"
+
+    with pytest.raises(HTTPException) as error:
+        await call(payments, stripe)
+    assert error.value.status_code == 503
+    assert stripe.calls == server.STRIPE_BREAKER_THRESHOLD
+
+async def test_half_open_circuit_lets_a_single_trial_through_then_recovers(stripe):
+    payments = server.PaymentClient()
+    await open_circuit(payments, stripe)
+    await asyncio.sleep(server.STRIPE_BREAKER_COOLDOWN_SECONDS)
+
+    # The trial is slow but within the timeout: callers arriving meanwhile are still turned away
+    stripe.behaviours = [0.02]
+    trial = asyncio.create_task(call(payments, stripe))
+    await asyncio.sleep(0)
+    with pytest.raises(HTTPException) as error:
+        await call(payments, stripe)
+    assert error.value.status_code == 503
+    assert (await trial).session_id == f"cs_{server.STRIPE_BREAKER_THRESHOLD + 1}"
+
+    assert payments.stats()['circuit'] == "closed" and payments.failures == 0
+    assert (await call(payments, stripe)).session_id == f"cs_{server.STRIPE_BREAKER_THRESHOLD + 2}"
+
+async def test_failed_trial_opens_the_circuit_again(stripe):
+    payments = server.PaymentClient()
+    await open_circuit(payments, stripe)
+    await asyncio.sleep(server.STRIPE_BREAKER_COOLDOWN_SECONDS)
+
+    stripe.behaviours = ["error"]
+    with pytest.raises(HTTPException):
+        await call(payments, stripe)
+    assert payments.stats()['circuit'] == "open"
+    with pytest.raises(HTTPException) as error:
+        await call(payments, stripe)
+    assert error.value.status_code == 503
+
+async def test_requests_stripe_refuses_leave_the_circuit_closed(stripe):
+    payments = server.PaymentClient()
+    stripe.behaviours = [
+        stripe_sdk.InvalidRequestError("No such price", param="price", http_status=400),
+        stripe_sdk.CardError("Your card was declined", param=None, code="card_declined", http_status=402),
+    ] * server.STRIPE_BREAKER_THRESHOLD
+    for _ in range(2 * server.STRIPE_BREAKER_THRESHOLD):
+        with pytest.raises(HTTPException) as error:
+            await call(payments, stripe)
+        assert error.value.status_code == 400
+    assert payments.failures == 0 and payments.stats()['circuit'] == "closed"
+
+    # Stripe-side errors do count
+    stripe.behaviours = [stripe_sdk.APIError("Internal error", http_status=500), stripe_sdk.APIConnectionError("Connection reset")]
+    for _ in range(2):
+        with pytest.raises(HTTPException) as error:
+            await call(payments, stripe)
+        assert error.value.status_code == 502
+    assert payments.failures == 2
+
+@pytest.fixture
+def payments(stripe, monkeypatch):
+    payments = server.PaymentClient()
+    monkeypatch.setattr(payments, "checkout", lambda webhook_url=None: stripe)
+    monkeypatch.setattr(server, "payments", payments)
+    return payments
+
+async def test_checkout_is_refused_without_an_order_while_the_circuit_is_open(api, db, user, stripe, payments):
+    product = server.Product(
+        titre="Single", artiste="Test", type="single", prix=1.0,
+        image_url="", audio_preview_url="", audio_file_url="", description=""
+    ).model_dump()
+    await db.products.insert_one(dict(product))
+    await api.post("/api/cart/add", json={"product_id": product['id']}, headers=user['headers'])
+    await open_circuit(payments, stripe)
+
+    response = await api.post("/api/checkout/create-session", json={"origin_url": "http://test"}, headers=user['headers'])
+    assert response.status_code == 503
+    assert await db.orders.count_documents({}) == 0
+    assert await db.carts.count_documents({"user_id": user['id']}) == 1
+
+async def insert_late_checkout(db, buyer: dict) -> str:
+    # Created long enough ago that a poll asks Stripe instead of waiting for the webhook
+    transaction = server.PaymentTransaction(
+        session_id="cs_late", user_id=buyer['id'], order_id="o1", amount=1.0, currency="eur",
+        created_at=datetime.now(timezone.utc) - timedelta(seconds=server.CHECKOUT_STRIPE_FALLBACK_SECONDS + 1)
+    )
+    await db.payment_transactions.insert_one(transaction.model_dump())
+    return transaction.session_id
+
+@pytest.mark.parametrize("outage", ["error", "open circuit"])
+async def test_status_poll_keeps_the_local_state_when_stripe_is_unavailable(api, db, user, stripe, payments, outage):
+    session_id = await insert_late_checkout(db, user)
+    if outage == "open circuit":
+        await open_circuit(payments, stripe)
+    stripe.behaviours = ["error"]
+    calls = stripe.calls
+
+    response = await api.get(f"/api/checkout/status/{session_id}", headers=user['headers'])
+    assert response.status_code == 200
+    assert response.json() == {"status": "open", "payment_status": "unpaid", "order_id": "o1"}
+    assert stripe.calls == calls + (outage == "error")
+
+async def test_status_poll_completes_the_payment_from_stripe(api, db, user, stripe, payments):
+    session_id = await insert_late_checkout(db, user)
+    await db.orders.insert_one({"id": "o1", "user_id": user['id'], "items": [], "total": 1.0, "payment_status": "pending", "created_at": datetime.now(timezone.utc)})
+
+    response = await api.get(f"/api/checkout/status/{session_id}", headers=user['headers'])
+    assert response.json() == {"status": "complete", "payment_status": "paid", "order_id": "o1"}
+    assert (await db.orders.find_one({"id": "o1"}))['payment_status'] == "paid"
+
+async def insert_checkout(db, buyer: dict, session_id: str = "cs_wait") -> str:
+    transaction = server.PaymentTransaction(session_id=session_id, user_id=buyer['id'], order_id="o1", amount=1.0, currency="eur")
+    await db.payment_transactions.insert_one(transaction.model_dump())
+    await db.orders.insert_one({"id": "o1", "user_id": buyer['id'], "items": [], "total": 1.0, "payment_status": "pending", "created_at": datetime.now(timezone.utc)})
+    return session_id
+
+async def test_long_poll_returns_as_soon_as_the_webhook_lands(api, db, user, stripe, payments):
+    session_id = await insert_checkout(db, user)
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    poll = asyncio.create_task(api.get(f"/api/checkout/status/{session_id}", params={"wait": 10}, headers=user['headers']))
+    await asyncio.sleep(0.1)
+    assert not poll.done()
+
+    await server.complete_paid_sessions([session_id])
+    response = await poll
+    assert response.json() == {"status": "complete", "payment_status": "paid", "order_id": "o1"}
+    assert loop.time() - started < 1
+    assert stripe.calls == 0 and server.checkout_waiters == {}
+
+async def test_long_poll_sees_changes_made_by_another_worker(api, db, user, stripe, payments, monkeypatch):
+    monkeypatch.setattr(server, "CHECKOUT_RECHECK_SECONDS", 0.05)
+    session_id = await insert_checkout(db, user)
+    poll = asyncio.create_task(api.get(f"/api/checkout/status/{session_id}", params={"wait": 10}, headers=user['headers']))
+    await asyncio.sleep(0.1)
+
+    # Applied by a webhook in another process: no local notification, the periodic re-read picks it up
+    await db.payment_transactions.update_one({"session_id": session_id}, {"$set": {"checkout_status": "expired"}})
+    response = await asyncio.wait_for(poll, 1)
+    assert response.json()['status'] == "expired"
+
+async def test_long_poll_answers_with_the_current_state_at_the_deadline(api, db, user, stripe, payments):
+    session_id = await insert_checkout(db, user)
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+
+    response = await api.get(f"/api/checkout/status/{session_id}", params={"wait": 0.3}, headers=user['headers'])
+    assert response.json() == {"status": "open", "payment_status": "unpaid", "order_id": "o1"}
+    assert 0.3 <= loop.time() - started < 1
+    assert stripe.calls == 0 and server.checkout_waiters == {}
+
+async def test_concurrent_pollers_of_a_late_checkout_ask_stripe_once(api, db, user, stripe, payments, monkeypatch):
+    session_id = await insert_late_checkout(db, user)
+
+    # Every poller reads the transaction before any of them claims the Stripe check
+    class SlowReads:
+        def __init__(self, collection):
+            self.collection = collection
+
+        def __getattr__(self, name):
+            return getattr(self.collection, name)
+
+        async def find_one(self, *args, **kwargs):
+            document = await self.collection.find_one(*args, **kwargs)
+            await asyncio.sleep(0.05)
+            return document
+
+    class SlowTransactionReads:
+        payment_transactions = SlowReads(db.payment_transactions)
+
+        def __getattr__(self, name):
+            return getattr(db, name)
+
+    monkeypatch.setattr(server, "db", SlowTransactionReads())
+    responses = await asyncio.gather(*(api.get(f"/api/checkout/status/{session_id}", headers=user['headers']) for _ in range(5)))
+    assert all(response.status_code == 200 for response in responses)
+    assert stripe.calls == 1
+    monkeypatch.setattr(server, "db", db)
+    transaction = await db.payment_transactions.find_one({"session_id": session_id})
+    assert transaction['stripe_checked_at'] is not None and transaction['payment_status'] == "paid"
+
+    # Within the staleness window nobody asks again
+    await db.payment_transactions.update_one({"session_id": session_id}, {"$set": {"payment_status": "unpaid"}})
+    await api.get(f"/api/checkout/status/{session_id}", headers=user['headers'])
+    assert stripe.calls == 1
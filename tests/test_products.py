@@ -0,0 +1,75 @@
+import random
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+async def seed_catalog(db, count: int) -> list:
+    products = []
+    for index in range(count):
+        product = server.Product(
+            titre=f"Titre {index % 7}",  # duplicates exercise the id tie-breaker
+            artiste=random.choice(["Alpha", "Beta"]),
+            type=random.choice(["album", "single"]),
+            prix=float(index % 5),
+            image_url="", audio_preview_url="", audio_file_url="",
+            description=""
+        ).model_dump()
+        products.append(product)
+    await db.products.insert_many([dict(product) for product in products])
+    return products
+
+async def fetch_all(api, **params) -> list:
+    pages, after = [], None
+    while True:
+        response = await api.get("/api/products", params={**params, "limit": 7, **({"after": after} if after else {})})
+        assert response.status_code == 200
+        pages += response.json()
+        after = response.headers.get("x-next-cursor")
+        if not after:
+            return pages
+
+@pytest.mark.parametrize("sort", list(server.PRODUCT_SORTS))
+@pytest.mark.parametrize("filters", [{}, {"type": "album"}, {"artiste": "Alpha"}, {"artiste": "Beta", "prix_min": 1, "prix_max": 3}])
+async def test_keyset_pagination_visits_every_product_once(api, db, sort, filters):
+    products = await seed_catalog(db, 60)
+    expected = [
+        product for product in products
+        if all(product[key] == value for key, value in filters.items() if key in ("type", "artiste"))
+        and filters.get("prix_min", 0) <= product['prix'] <= filters.get("prix_max", 10)
+    ]
+
+    listed = await fetch_all(api, sort=sort, **filters)
+    assert sorted(product['id'] for product in listed) == sorted(product['id'] for product in expected)
+
+    field, direction = server.PRODUCT_SORTS[sort]
+    keys = [(product[field], product['id']) for product in listed]
+    assert keys == sorted(keys, reverse=direction == -1)
+
+def test_every_catalog_sort_and_filter_has_an_index():
+    indexed = {tuple(key for key, _ in keys) for collection, keys, _ in server.INDEXES if collection == "products"}
+    for field, _ in server.PRODUCT_SORTS.values():
+        for prefix in [(), ("type",), ("artiste",)]:
+            assert (*prefix, field, "id") in indexed
+
+@pytest.mark.parametrize("path", ["/api/products", "/api/products/{id}"])
+async def test_catalog_revalidates_until_a_product_changes(api, db, admin, path):
+    products = await seed_catalog(db, 3)
+    url = path.format(id=products[0]['id'])
+    first = await api.get(url)
+    etag = first.headers['etag']
+    assert first.status_code == 200 and first.headers['cache-control'] == "no-cache"
+
+    for validator in (etag, f"W/{etag}", f'"stale", {etag}'):
+        revalidated = await api.get(url, headers={"If-None-Match": validator})
+        assert revalidated.status_code == 304 and revalidated.content == b""
+        assert revalidated.headers['etag'] == etag
+
+    response = await api.put(f"/api/admin/products/{products[0]['id']}", json={"prix": 42.0}, headers=admin['headers'])
+    assert response.status_code == 200
+    changed = await api.get(url, headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers['etag'] != etag
+    listed = changed.json() if path == "/api/products" else [changed.json()]
+    assert [product['prix'] for product in listed if product['id'] == products[0]['id']] == [42.0]
@@ -0,0 +1,41 @@
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+async def insert_order(db, buyer: dict, product_ids: list, payment_status: str) -> dict:
+    items = [server.OrderItem(product_id=product_id, titre="Single", prix=1.0, quantite=1, download_url="/uploads/a.mp3") for product_id in product_ids]
+    order = server.Order(user_id=buyer['id'], items=items, total=float(len(items)), stripe_session_id=f"cs_{payment_status}", payment_status=payment_status)
+    await db.orders.insert_one(order.model_dump())
+    return order.model_dump()
+
+async def owned(api, buyer: dict, product_ids: list) -> list:
+    response = await api.post("/api/purchases/ownership", json={"product_ids": product_ids}, headers=buyer['headers'])
+    assert response.status_code == 200
+    return sorted(response.json()['owned'])
+
+async def test_only_paid_orders_grant_ownership(api, db, user, admin):
+    paid = await insert_order(db, user, ["p1", "p2"], "pending")
+    await insert_order(db, user, ["p3"], "pending")
+    assert await server.mark_order_paid(paid['id'])
+
+    assert await owned(api, user, ["p1", "p2", "p3", "p4"]) == ["p1", "p2"]
+    # Ownership is per buyer
+    assert await owned(api, admin, ["p1", "p2", "p3"]) == []
+
+async def test_ownership_requires_a_login_and_bounds_the_batch(api, user):
+    assert (await api.post("/api/purchases/ownership", json={"product_ids": ["p1"]})).status_code in (401, 403)
+    response = await api.post("/api/purchases/ownership", json={"product_ids": [f"p{index}" for index in range(501)]}, headers=user['headers'])
+    assert response.status_code == 422
+
+async def test_backfill_records_paid_orders_once(api, db, user):
+    # Orders paid before the purchases collection existed
+    await insert_order(db, user, ["p1", "p2"], "paid")
+    await insert_order(db, user, ["p2", "p3"], "paid")
+    await insert_order(db, user, ["p4"], "pending")
+
+    assert await server.backfill_purchases(batch_size=2) == 3
+    assert await server.backfill_purchases(batch_size=2) == 0
+    assert await db.purchases.count_documents({}) == 3
+    assert await owned(api, user, ["p1", "p2", "p3", "p4"]) == ["p1", "p2", "p3"]
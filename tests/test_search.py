@@ -0,0 +1,68 @@
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+async def insert_products(db, *specs):
+    for titre, artiste, product_type in specs:
+        product = server.Product(
+            titre=titre, artiste=artiste, type=product_type, prix=1.0,
+            image_url="", audio_preview_url="", audio_file_url="", description="Lorem midnight"
+        ).model_dump()
+        product.update(server.search_index_fields(product))
+        await db.products.insert_one(product)
+
+async def search(api, **params) -> list:
+    response = await api.get("/api/products/search", params=params)
+    assert response.status_code == 200
+    return [product['titre'] for product in response.json()]
+
+async def test_best_match_is_found_among_many_prefix_matches(api, db):
+    await insert_products(db, *[(f"Midnightly {index}", "Various", "single") for index in range(600)])
+    await insert_products(db, ("Midnight", "Nobody", "album"), ("Autre", "Midnight Band", "album"))
+
+    results = await search(api, q="midnight", limit=3)
+    # Whole word in the title, then whole word in the artist, then prefix matches
+    assert results[:2] == ["Midnight", "Autre"]
+    assert results[2].startswith("Midnightly")
+
+async def test_search_is_accent_insensitive_and_requires_every_term(api, db):
+    await insert_products(db, ("Été Indien", "Joe Dassin", "single"), ("Été Pourri", "Autre", "single"))
+    assert await search(api, q="ete ind") == ["Été Indien"]
+    assert sorted(await search(api, q="ÉTÉ")) == ["Été Indien", "Été Pourri"]
+    assert await search(api, q="e") == []
+
+async def test_search_filters_by_type(api, db):
+    await insert_products(db, ("Jazz Nights", "Quartet", "album"), ("Jazz Days", "Quartet", "single"))
+    assert await search(api, q="jazz", type="single") == ["Jazz Days"]
+
+async def test_track_titles_and_descriptions_match_below_titles(api, db):
+    album = server.Product(
+        titre="Greatest Hits", artiste="Various", type="album", prix=9.99, image_url="", audio_preview_url="",
+        audio_file_url="", description="Enregistré à Montréal", tracks=[{"numero": 1, "titre": "Bohemian Rhapsody", "audio_url": ""}]
+    ).model_dump()
+    album.update(server.search_index_fields(album))
+    await db.products.insert_one(album)
+    await insert_products(db, ("Rhapsody in Blue", "Gershwin", "single"), ("Montreal", "Tour", "single"))
+
+    # Track titles are searched by prefix, descriptions by whole word
+    assert await search(api, q="rhaps") == ["Rhapsody in Blue", "Greatest Hits"]
+    assert await search(api, q="bohemian") == ["Greatest Hits"]
+    assert await search(api, q="montreal") == ["Montreal", "Greatest Hits"]
+    assert await search(api, q="montr") == ["Montreal"]
+    assert await search(api, q="lorem") == ["Montreal", "Rhapsody in Blue"]
+
+async def test_products_indexed_under_an_older_format_are_reindexed(db):
+    await db.products.insert_one({"id": "p1", "titre": "Summer Vibes", "artiste": "Sunsets", "search_keywords": ["su", "sum"]})
+    await server.backfill_search_keywords()
+    product = await db.products.find_one({"id": "p1"})
+    assert product['search_version'] == server.SEARCH_INDEX_VERSION
+    assert "t=summer" in product['search_keywords'] and "a:sun" in product['search_keywords']
+
+async def test_editing_tracks_reindexes_the_product(api, db, admin):
+    await insert_products(db, ("Album", "Band", "album"))
+    product = await db.products.find_one({"titre": "Album"})
+    tracks = [{"numero": 1, "titre": "Nocturne", "audio_url": ""}]
+    await api.put(f"/api/admin/products/{product['id']}", json={"tracks": tracks}, headers=admin['headers'])
+    assert await search(api, q="noct") == ["Album"]
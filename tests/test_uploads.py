@@ -0,0 +1,69 @@
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+BOUNDARY = "testboundary"
+
+def multipart(filename: str, content_type: str, size: int) -> bytes:
+    return (
+        f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{filename}\"\r\n"
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode() + b"x" * size + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+async def chunked(body: bytes):
+    for start in range(0, len(body), 4096):
+        yield body[start:start + 4096]
+
+@pytest.fixture
+def small_limits(monkeypatch, upload_dir):
+    monkeypatch.setitem(server.UPLOAD_MAX_BYTES, "images", 2 * 1024 * 1024)
+    monkeypatch.setattr(server, "UPLOAD_MULTIPART_OVERHEAD_BYTES", 1024)
+    monkeypatch.setattr(server, "schedule_image_processing", lambda saved: saved)
+    return upload_dir
+
+def stored_files(upload_dir) -> list:
+    return [path for path in upload_dir.rglob("*") if path.is_file()]
+
+async def test_route_limit_is_applied_from_content_length_before_the_body_is_read(small_limits):
+    body_reads = []
+    async def receive():
+        body_reads.append(True)
+        return {"type": "http.request", "body": b"", "more_body": False}
+    sent = []
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http", "method": "POST", "path": "/api/upload/image", "query_string": b"",
+        "headers": [(b"content-length", str(2 * 1024 ** 3).encode()), (b"content-type", f"multipart/form-data; boundary={BOUNDARY}".encode())]
+    }
+    await server.UploadSizeLimitMiddleware(server.app.router)(scope, receive, send)
+
+    assert sent[0]["status"] == 413
+    assert body_reads == []
+
+async def test_chunked_upload_over_the_route_limit_is_cut_off(api, admin, small_limits):
+    response = await api.post(
+        "/api/upload/image",
+        content=chunked(multipart("cover.png", "image/png", 3 * 1024 * 1024)),
+        headers={**admin['headers'], "Content-Type": f"multipart/form-data; boundary={BOUNDARY}"}
+    )
+    assert response.status_code == 413
+    assert response.json()['detail'] == "Fichier trop volumineux (maximum 2 Mo)"
+    assert stored_files(small_limits) == []
+
+async def test_upload_within_the_route_limit_is_stored(api, admin, small_limits):
+    response = await api.post(
+        "/api/upload/image",
+        content=chunked(multipart("cover.png", "image/png", 2 * 1024 * 1024)),
+        headers={**admin['headers'], "Content-Type": f"multipart/form-data; boundary={BOUNDARY}"}
+    )
+    assert response.status_code == 200
+    assert response.json()['size'] == 2 * 1024 * 1024
+    assert [path.name for path in stored_files(small_limits)] == [f"{response.json()['sha256']}.png"]
+
+def test_album_uploads_keep_the_request_wide_limit():
+    assert server.upload_request_limit("/api/upload/multiple-audio-files")[1] == server.UPLOAD_MAX_REQUEST_BYTES
+    assert server.upload_request_limit("/api/upload/image")[1] < server.UPLOAD_MAX_REQUEST_BYTES
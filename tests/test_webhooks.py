@@ -0,0 +1,146 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import random
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+WEBHOOK_SECRET = "whsec_test"
+# mongomock checks unique indexes by scanning the collection on every insert: the full
+# 10k-event load runs against a real server (TEST_MONGO_URL), a tenth of it otherwise
+LOAD_DELIVERIES = 10000 if os.getenv("TEST_MONGO_URL") else 1000
+
+class StripeStub:
+    """Stripe-compatible webhook endpoint side: events in Stripe's JSON shape, signed like Stripe-Signature"""
+    def sign(self, body: bytes) -> str:
+        timestamp = int(time.time())
+        signature = hmac.new(WEBHOOK_SECRET.encode(), f"{timestamp}.".encode() + body, hashlib.sha256).hexdigest()
+        return f"t={timestamp},v1={signature}"
+
+    def event(self, event_id: str, event_type: str, session_id: str, payment_status: str) -> bytes:
+        return json.dumps({
+            "id": event_id, "object": "event", "type": event_type,
+            "data": {"object": {"id": session_id, "object": "checkout.session", "payment_status": payment_status}}
+        }).encode()
+
+    async def handle_webhook(self, body: bytes, signature: str):
+        parts = dict(part.split("=", 1) for part in (signature or "").split(","))
+        expected = hmac.new(WEBHOOK_SECRET.encode(), f"{parts.get('t')}.".encode() + body, hashlib.sha256).hexdigest()
+        if not hmac.compare_digest(parts.get("v1", ""), expected):
+            raise ValueError("No signatures found matching the expected signature for payload")
+        event = json.loads(body)
+        session = event['data']['object']
+        return SimpleNamespace(event_type=event['type'], event_id=event['id'], session_id=session['id'], payment_status=session['payment_status'])
+
+@pytest.fixture
+def stripe(monkeypatch):
+    stub = StripeStub()
+    monkeypatch.setattr(server.payments, "checkout", lambda webhook_url=None: stub)
+    return stub
+
+async def insert_checkouts(db, count: int) -> list:
+    orders, transactions = [], []
+    for index in range(count):
+        item = server.OrderItem(product_id=f"p{index % 50}", titre="Single", prix=1.0, quantite=1, download_url="/uploads/a.mp3")
+        order = server.Order(user_id=f"u{index}", items=[item], total=1.0, stripe_session_id=f"cs_{index:05d}", payment_status="pending")
+        orders.append(order.model_dump())
+        transactions.append(server.PaymentTransaction(
+            session_id=order.stripe_session_id, user_id=order.user_id, order_id=order.id, amount=1.0, currency="eur"
+        ).model_dump())
+    await db.orders.insert_many(orders)
+    await db.payment_transactions.insert_many(transactions)
+    return [order['stripe_session_id'] for order in orders]
+
+async def post_events(api, stripe, bodies: list) -> list:
+    statuses = []
+    for start in range(0, len(bodies), 500):
+        responses = await asyncio.gather(*(
+            api.post("/api/webhook/stripe", content=body, headers={"Stripe-Signature": stripe.sign(body)})
+            for body in bodies[start:start + 500]
+        ))
+        statuses += [(response.status_code, response.json()['status']) for response in responses]
+    return statuses
+
+async def drain() -> int:
+    handled = 0
+    while batch := await server.process_webhook_batch():
+        handled += batch
+    return handled
+
+async def snapshot(db) -> dict:
+    return {
+        "paid_orders": await db.orders.count_documents({"payment_status": "paid"}),
+        "paid_transactions": await db.payment_transactions.count_documents({"payment_status": "paid"}),
+        "expired": await db.payment_transactions.count_documents({"checkout_status": "expired"}),
+        "purchases": await db.purchases.count_documents({}),
+        "stats": await db.order_stats.find_one({"_id": "total"}, {"_id": 0}),
+    }
+
+async def test_event_load_is_applied_once_and_replay_is_idempotent(api, db, stripe):
+    # 80% distinct events (three quarters paid, the rest expired checkouts), 20% Stripe redeliveries
+    distinct = LOAD_DELIVERIES * 4 // 5
+    sessions = await insert_checkouts(db, distinct)
+    paid, expired = sessions[:distinct * 3 // 4], sessions[distinct * 3 // 4:]
+    bodies = [stripe.event(f"evt_paid_{session}", "checkout.session.completed", session, "paid") for session in paid]
+    bodies += [stripe.event(f"evt_expired_{session}", "checkout.session.expired", session, "unpaid") for session in expired]
+    rng = random.Random(7)
+    deliveries = bodies + rng.sample(bodies, LOAD_DELIVERIES - distinct)
+    rng.shuffle(deliveries)
+
+    statuses = await post_events(api, stripe, deliveries)
+    assert statuses.count((200, "success")) == distinct
+    assert statuses.count((200, "duplicate")) == LOAD_DELIVERIES - distinct
+
+    assert await drain() == distinct
+    assert await db.stripe_events.count_documents({"status": "processed"}) == distinct
+    state = await snapshot(db)
+    assert state == {
+        "paid_orders": len(paid), "paid_transactions": len(paid), "expired": len(expired), "purchases": len(paid),
+        "stats": {"paid_orders": len(paid), "revenue": float(len(paid))}
+    }
+
+    # Replay the whole log (replay_webhooks.py --since) and redeliver everything: nothing is counted twice
+    await db.stripe_events.update_many({}, {"$set": {"status": "pending", "attempts": 0, "lease_until": datetime.now(timezone.utc)}})
+    assert await drain() == distinct
+    assert set(await post_events(api, stripe, bodies)) == {(200, "duplicate")}
+    assert await drain() == 0
+    assert await snapshot(db) == state
+
+async def test_badly_signed_event_is_rejected(api, db, stripe):
+    body = stripe.event("evt_1", "checkout.session.completed", "cs_1", "paid")
+    response = await api.post("/api/webhook/stripe", content=body, headers={"Stripe-Signature": "t=1,v1=forged"})
+    assert response.status_code == 400
+    assert await db.stripe_events.count_documents({}) == 0
+
+async def test_failing_event_is_retried_alone_then_parked(api, db, stripe, monkeypatch):
+    sessions = await insert_checkouts(db, 20)
+    poison = sessions[7]
+    complete_paid_sessions = server.complete_paid_sessions
+    async def fail_on_poison(session_ids):
+        if poison in session_ids:
+            raise RuntimeError("malformed session")
+        await complete_paid_sessions(session_ids)
+    monkeypatch.setattr(server, "complete_paid_sessions", fail_on_poison)
+    await post_events(api, stripe, [stripe.event(f"evt_{session}", "checkout.session.completed", session, "paid") for session in sessions])
+
+    assert await drain() == 20
+    assert await db.orders.count_documents({"payment_status": "paid"}) == 19
+    event = await db.stripe_events.find_one({"_id": f"evt_{poison}"})
+    assert (event['status'], event['attempts'], event['error']) == ("pending", 1, "malformed session")
+    assert event['lease_until'] > datetime.now(timezone.utc)
+
+    for attempt in range(2, server.WEBHOOK_MAX_ATTEMPTS + 1):
+        await db.stripe_events.update_one({"_id": f"evt_{poison}"}, {"$set": {"lease_until": datetime.now(timezone.utc)}})
+        assert await drain() == 1
+    event = await db.stripe_events.find_one({"_id": f"evt_{poison}"})
+    assert (event['status'], event['attempts']) == ("failed", server.WEBHOOK_MAX_ATTEMPTS)
+    assert await db.stripe_events.count_documents({"status": "processed"}) == 19